@@ -0,0 +1,108 @@
+"""
+Profundidad de recuperacion adaptativa para generate_response.
+
+En vez de enviar siempre los 3 primeros documentos al LLM, se decide cuantos
+usar segun la similitud de cada uno con la pregunta:
+
+- Saludos, agradecimientos y charla sin contenido del curso no recuperan
+  nada (ni siquiera se calcula el embedding).
+- Si ningun documento supera ADAPTIVE_MIN_SIMILARITY, la pregunta esta fuera
+  del corpus y se responde sin material de referencia.
+- Si el primero es muy parecido (ADAPTIVE_CONFIDENT_SIMILARITY) y le saca
+  ADAPTIVE_CONFIDENT_MARGIN al segundo, se envia solo ese.
+- Si las similitudes son casi iguales (diferencia menor a ADAPTIVE_FLAT_SPREAD)
+  ningun documento destaca y se amplia hasta ADAPTIVE_MAX_K.
+- En otro caso se envian hasta 3, sin los que quedan a mas de
+  ADAPTIVE_MAX_GAP del primero.
+
+Los umbrales son similitudes coseno (embeddings normalizados) y dependen del
+modelo de embeddings y del corpus; los valores por defecto no estan
+calibrados para el modelo por defecto (MiniLM, entrenado en ingles) sobre
+este corpus en castellano. Por eso ADAPTIVE_K viene apagado: se activa
+despues de calibrar con "python benchmarks/eval_retrieval.py --calibrate".
+"""
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+ADAPTIVE_K = os.getenv("ADAPTIVE_K", "0") == "1"
+# Documentos sin adaptar (el comportamiento anterior) y maximo al ampliar
+DEFAULT_K = 3
+ADAPTIVE_MAX_K = int(os.getenv("ADAPTIVE_MAX_K", "5"))
+ADAPTIVE_MIN_SIMILARITY = float(os.getenv("ADAPTIVE_MIN_SIMILARITY", "0.35"))
+ADAPTIVE_CONFIDENT_SIMILARITY = float(os.getenv("ADAPTIVE_CONFIDENT_SIMILARITY", "0.75"))
+ADAPTIVE_CONFIDENT_MARGIN = float(os.getenv("ADAPTIVE_CONFIDENT_MARGIN", "0.08"))
+ADAPTIVE_FLAT_SPREAD = float(os.getenv("ADAPTIVE_FLAT_SPREAD", "0.03"))
+ADAPTIVE_MAX_GAP = float(os.getenv("ADAPTIVE_MAX_GAP", "0.15"))
+
+# Palabras de saludo, cortesia y charla; una pregunta formada solo por ellas
+# no necesita material de referencia
+_SMALL_TALK_WORDS = {
+    "hola", "holi", "hey", "buenas", "buenos", "buen", "dia", "dias", "tardes", "noches", "saludos",
+    "gracias", "muchas", "mil", "thanks", "ok", "okay", "oka", "vale", "listo", "perfecto", "genial",
+    "excelente", "bacan", "entendido", "entiendo", "claro", "super", "bien", "muy", "todo", "nada",
+    "adios", "chao", "chau", "hasta", "luego", "pronto", "manana", "nos", "vemos",
+    "que", "tal", "como", "estas", "esta", "quien", "eres", "tu", "te", "llamas", "puedes", "hacer",
+    "si", "no", "de", "y", "e", "a", "profe", "profesor", "bot", "asistente",
+}
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def is_small_talk(question: str) -> bool:
+    """True si la pregunta es solo saludo, cortesia o charla (sin contenido del curso)."""
+    text = unicodedata.normalize("NFD", question.lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    words = _WORD_RE.findall(text)
+    return bool(words) and all(word in _SMALL_TALK_WORDS for word in words)
+
+
+def similarity(distance: Optional[float], space: str = "l2") -> Optional[float]:
+    """
+    Similitud coseno a partir de la distancia de ChromaDB o del indice int8.
+
+    Args:
+        distance: Distancia devuelta por la busqueda (None si no se pidio)
+        space: Metrica del indice ("l2" es la distancia euclidiana al cuadrado)
+
+    Returns:
+        Similitud en [-1, 1], o None si no hay distancia
+    """
+    if distance is None:
+        return None
+    if space == "l2":
+        # Con vectores normalizados ||a - b||^2 = 2 - 2 cos
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+
+def select_documents(docs: List[Dict], space: str = "l2") -> Tuple[List[Dict], str]:
+    """
+    Elige cuantos documentos recuperados enviar al LLM.
+
+    Args:
+        docs: Documentos recuperados (hasta ADAPTIVE_MAX_K). Se ordenan por
+            similitud: con QUERY_EXPANSION llegan en el orden de la fusion RRF
+        space: Metrica de las distancias de los documentos
+
+    Returns:
+        (documentos elegidos, motivo): "confiado", "amplio", "normal",
+        "sin_relevantes" o "sin_distancias"
+    """
+    scores = [similarity(doc.get("distance"), space) for doc in docs]
+    if not docs or any(score is None for score in scores):
+        return docs[:DEFAULT_K], "sin_distancias"
+
+    ranked = sorted(zip(docs, scores), key=lambda pair: pair[1], reverse=True)
+    relevant = [(doc, score) for doc, score in ranked if score >= ADAPTIVE_MIN_SIMILARITY]
+    if not relevant:
+        return [], "sin_relevantes"
+    best = relevant[0][1]
+    second = relevant[1][1] if len(relevant) > 1 else None
+    if best >= ADAPTIVE_CONFIDENT_SIMILARITY and (second is None or best - second >= ADAPTIVE_CONFIDENT_MARGIN):
+        return [relevant[0][0]], "confiado"
+
+    widest = relevant[:ADAPTIVE_MAX_K]
+    if len(widest) > DEFAULT_K and best - widest[-1][1] <= ADAPTIVE_FLAT_SPREAD:
+        return [doc for doc, _ in widest], "amplio"
+    return [doc for doc, score in relevant[:DEFAULT_K] if best - score <= ADAPTIVE_MAX_GAP], "normal"
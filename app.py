@@ -4,10 +4,11 @@ Diseño moderno, liviano y optimizado para dispositivos moviles.
 """
 import streamlit as st
 import os
-import tempfile
 from dotenv import load_dotenv
-from rag_system import ElectromagnetismRAG, CATEGORIES
-from pdf_processor import process_pdf_to_chunks
+from rag_system import ElectromagnetismRAG, CATEGORIES, RETRIEVAL_SERVICE_URL, WARM_UP
+from job_queue import JobQueue, FINISHED_STATUSES, ensure_worker, save_upload
+from ingest import EXTRACTORS
+from metrics_server import METRICS_PORT, start_in_background as start_metrics_server
 
 load_dotenv()
 
@@ -520,9 +521,20 @@ def initialize_rag():
         corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
         if os.path.exists(corpus_path):
             rag.index_corpus(corpus_path)
+    # Las primeras preguntas tras un reinicio no pagan la carga del modelo e indice
+    if WARM_UP:
+        rag.warm_up()
+    if METRICS_PORT:
+        start_metrics_server(rag, int(METRICS_PORT))
     return rag
 
 
+@st.cache_resource
+def get_job_queue():
+    """Cola de trabajos compartida por las sesiones de este proceso."""
+    return JobQueue()
+
+
 def render_header():
     """Renderiza el header de la app."""
     st.markdown("""
@@ -712,10 +724,12 @@ Por favor proporciona:
                         "Circuitos AC": "corriente_alterna"
                     }
 
+                    # Problema de varios pasos: siempre el modelo grande
                     response = rag.generate_response(
                         solver_prompt,
                         [],
-                        category_filter=category_map.get(problem_type, "todos")
+                        category_filter=category_map.get(problem_type, "todos"),
+                        route="complejo"
                     )
 
                     st.markdown("---")
@@ -767,7 +781,7 @@ def render_upload_view(rag):
 
         uploaded_file = st.file_uploader(
             "Selecciona archivo",
-            type=["pdf", "tex"],
+            type=[extension.lstrip(".") for extension in EXTRACTORS],
             label_visibility="collapsed"
         )
 
@@ -775,46 +789,19 @@ def render_upload_view(rag):
             st.success(f"Archivo: {uploaded_file.name}")
 
             if st.button("⬆️ Subir al Corpus", use_container_width=True, type="primary"):
-                with st.spinner("Procesando archivo..."):
-                    try:
-                        # Guardar temporalmente
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp:
-                            tmp.write(uploaded_file.getvalue())
-                            tmp_path = tmp.name
-
-                        # Procesar segun tipo
-                        if uploaded_file.name.lower().endswith('.pdf'):
-                            chunks = process_pdf_to_chunks(tmp_path, category)
-                        else:
-                            from tex_processor import extract_chunks_from_tex
-                            chunks = extract_chunks_from_tex(tmp_path, category)
-
-                        if chunks:
-                            # Agregar a ChromaDB
-                            collection = rag.collection
-                            existing = collection.get()
-                            next_id = max([int(id.replace("doc_", "")) for id in existing["ids"]] or [0]) + 1
-
-                            documents = [c["content"] for c in chunks]
-                            metadatas = [{
-                                "source": uploaded_file.name,
-                                "category": category,
-                                "category_display": CATEGORIES[category],
-                                "chunk_number": c["chunk_number"],
-                                "file_type": c["file_type"]
-                            } for c in chunks]
-                            ids = [f"doc_{next_id + i}" for i in range(len(chunks))]
-
-                            collection.add(documents=documents, metadatas=metadatas, ids=ids)
-                            st.success(f"Se agregaron {len(chunks)} fragmentos al corpus.")
-                        else:
-                            st.warning("No se pudo extraer contenido del archivo.")
-
-                        # Limpiar temporal
-                        os.unlink(tmp_path)
-
-                    except Exception as e:
-                        st.error(f"Error: {str(e)}")
+                try:
+                    # La extraccion (y OCR) corre en un worker de la cola de trabajos
+                    path = save_upload(uploaded_file.name, uploaded_file.getvalue())
+                    job_id = get_job_queue().enqueue("upload", {
+                        "path": path,
+                        "filename": uploaded_file.name,
+                        "category": category
+                    })
+                    ensure_worker()
+                    st.session_state.setdefault("job_ids", []).append(job_id)
+                    st.success(f"Archivo en cola de procesamiento (trabajo #{job_id}).")
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
 
     with upload_tab2:
         problem_title = st.text_input("Titulo del problema:", placeholder="Ej: Fuerza entre cargas puntuales")
@@ -829,21 +816,13 @@ def render_upload_view(rag):
             if problem_title and problem_content:
                 with st.spinner("Guardando..."):
                     try:
-                        collection = rag.collection
-                        existing = collection.get()
-                        next_id = max([int(id.replace("doc_", "")) for id in existing["ids"]] or [0]) + 1
-
-                        collection.add(
-                            documents=[problem_content],
-                            metadatas=[{
-                                "source": f"{problem_title}.manual",
-                                "category": category,
-                                "category_display": CATEGORIES[category],
-                                "chunk_number": "0",
-                                "file_type": "manual"
-                            }],
-                            ids=[f"doc_{next_id}"]
-                        )
+                        rag.add_chunks([{
+                            "source": f"{problem_title}.manual",
+                            "category": category,
+                            "chunk_number": "0",
+                            "content": problem_content,
+                            "file_type": "manual"
+                        }])
                         st.success("Problema guardado exitosamente.")
                     except Exception as e:
                         st.error(f"Error: {str(e)}")
@@ -858,12 +837,54 @@ def render_upload_view(rag):
     # Boton reindexar
     with st.expander("⚙️ Opciones avanzadas"):
         if st.button("🔄 Reindexar todo el corpus", use_container_width=True):
-            with st.spinner("Reindexando..."):
-                corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
-                rag.clear_and_reindex(corpus_path)
-                st.cache_resource.clear()
-            st.success("Corpus reindexado!")
-            st.rerun()
+            corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+            job_id = get_job_queue().enqueue("reindex", {"corpus_path": corpus_path})
+            ensure_worker()
+            st.session_state.setdefault("job_ids", []).append(job_id)
+            st.success(f"Reindexacion en cola (trabajo #{job_id}).")
+
+    render_jobs_panel()
+
+
+def _jobs_panel_body():
+    """Muestra el estado de los trabajos de esta sesion."""
+    job_ids = st.session_state.get("job_ids", [])
+    if not job_ids:
+        return
+
+    queue = get_job_queue()
+    st.markdown('<div class="card-title">⏳ Trabajos en segundo plano</div>', unsafe_allow_html=True)
+    seen_finished = st.session_state.setdefault("finished_job_ids", set())
+
+    for job_id in reversed(job_ids):
+        job = queue.get(job_id)
+        if job is None:
+            continue
+
+        label = "Subida" if job["kind"] == "upload" else "Reindexacion"
+        st.progress(job["progress"], text=f"#{job_id} {label}: {job['message'] or job['status']}")
+
+        if job["status"] in FINISHED_STATUSES:
+            if job_id not in seen_finished:
+                seen_finished.add(job_id)
+                if job["status"] == "done" and job["kind"] == "upload" and not RETRIEVAL_SERVICE_URL:
+                    # El worker agrego chunks a ChromaDB desde otro proceso: reabrir
+                    # solo el RAG para verlos (un reindexado se detecta solo al
+                    # cambiar la coleccion activa, y con el servicio escribe el servicio)
+                    initialize_rag.clear()
+                    st.rerun()
+        elif st.button("✖️ Cancelar", key=f"cancel_job_{job_id}", use_container_width=True):
+            queue.request_cancel(job_id)
+
+    if st.button("🔃 Actualizar estado", key="refresh_jobs", use_container_width=True):
+        st.rerun()
+
+
+# Con st.fragment (Streamlit >= 1.37) el panel se refresca solo cada 2 s
+if hasattr(st, "fragment"):
+    render_jobs_panel = st.fragment(run_every=2)(_jobs_panel_body)
+else:
+    render_jobs_panel = _jobs_panel_body
 
 
 def main():
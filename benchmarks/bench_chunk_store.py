@@ -0,0 +1,73 @@
+"""
+Benchmark del almacen comprimido de chunks (chunk_store.py).
+
+Guarda los chunks del corpus (.tex y .docx) en un almacen temporal y
+reporta: tamanio del texto frente al tamanio en disco, tiempo de escritura,
+latencia de lectura de un top-k al azar (con la cache de bloques vacia y
+llena) y bytes de texto que ChromaDB devolvia por consulta.
+
+Uso:
+    python benchmarks/bench_chunk_store.py
+    python benchmarks/bench_chunk_store.py --top-k 9 --queries 500
+"""
+import argparse
+import glob
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from chunk_store import ChunkStore  # noqa: E402
+from ingest import process_files  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del almacen de chunks")
+    parser.add_argument("--top-k", type=int, default=9, help="Documentos leidos por consulta (n_results * 3)")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(REPO_ROOT, "corpus", "*", "*.tex"))
+                   + glob.glob(os.path.join(REPO_ROOT, "corpus", "*", "*.docx")))
+    with redirect_stdout(io.StringIO()):
+        chunks = process_files([(path, os.path.basename(os.path.dirname(path))) for path in paths])
+    texts = [chunk["content"] for chunk in chunks]
+
+    directory = tempfile.mkdtemp(prefix="chunk_store_")
+    try:
+        start = time.perf_counter()
+        keys = ChunkStore(directory).put_many(texts)
+        write_seconds = time.perf_counter() - start
+
+        store = ChunkStore(directory)
+        info = store.stats()
+        print(f"{len(texts)} chunks ({info['chunks']} distintos), codec {info['codec']}")
+        print(f"  Texto:    {info['raw_bytes'] / 1e6:7.2f} MB")
+        print(f"  En disco: {info['stored_bytes'] / 1e6:7.2f} MB ({info['raw_bytes'] / info['stored_bytes']:.1f}x),"
+              f" escritura {write_seconds * 1000:.0f} ms")
+
+        rng = random.Random(0)
+        queries = [rng.sample(keys, args.top_k) for _ in range(args.queries)]
+        for label, reopen in (("cache vacia", True), ("cache llena", False)):
+            if reopen:
+                store = ChunkStore(directory)
+            start = time.perf_counter()
+            payload = sum(len(text) for query in queries for text in store.get_many(query))
+            elapsed = time.perf_counter() - start
+            print(f"  Lectura top-{args.top_k} ({label}): "
+                  f"{elapsed / args.queries * 1000:.3f} ms por consulta")
+        print(f"  Texto por consulta que ya no transfiere ChromaDB: {payload / args.queries / 1e3:.1f} KB")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Benchmark de clean_latex contra la cascada de regex original.
+
+Recorre todos los .tex de corpus/ y mide el tiempo de clean_latex frente a
+la implementacion anterior (copiada abajo como referencia). Tambien mide
+una sola pasada de re.sub sobre los tokens LaTeX, con plantilla y con una
+funcion Python por token: es el piso de cualquier limpiador basado en re
+que necesite estado (llaves anidadas, listas).
+
+Uso:
+    python benchmarks/bench_clean_latex.py
+    python benchmarks/bench_clean_latex.py --repeat 5 --show 10
+    python benchmarks/bench_clean_latex.py --stress
+
+--stress mide documentos sinteticos con entornos sin cerrar (un error de
+tipeo comun en los apuntes), donde los patrones .*? de la cascada vuelven a
+recorrer el resto del archivo en cada apertura.
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from tex_processor import clean_latex  # noqa: E402
+
+_TOKEN_RE = re.compile(r"\\(?:[a-zA-Z]+|.)|[{}$~]", re.DOTALL)
+
+def legacy_clean_latex(text: str) -> str:
+    """Cascada de re.sub original (referencia para comparar salida y tiempo)."""
+    # Eliminar comentarios
+    text = re.sub(r'%.*', '', text)
+
+    # Preservar ecuaciones importantes
+    text = re.sub(r'\\begin\{equation\}(.*?)\\end\{equation\}', r'ECUACION: \1', text, flags=re.DOTALL)
+    text = re.sub(r'\\begin\{align\*?\}(.*?)\\end\{align\*?\}', r'ECUACION: \1', text, flags=re.DOTALL)
+    text = re.sub(r'\\begin\{eqnarray\}(.*?)\\end\{eqnarray\}', r'ECUACION: \1', text, flags=re.DOTALL)
+    text = re.sub(r'\\\[(.*?)\\\]', r'ECUACION: \1', text, flags=re.DOTALL)
+    text = re.sub(r'\$\$(.*?)\$\$', r'ECUACION: \1', text, flags=re.DOTALL)
+    text = re.sub(r'\$(.*?)\$', r'MATH: \1', text)
+
+    # Eliminar entornos de dibujo
+    text = re.sub(r'\\begin\{circuitikz\}.*?\\end\{circuitikz\}', '[DIAGRAMA DE CIRCUITO]', text, flags=re.DOTALL)
+    text = re.sub(r'\\begin\{tikzpicture\}.*?\\end\{tikzpicture\}', '[DIAGRAMA]', text, flags=re.DOTALL)
+    text = re.sub(r'\\includegraphics.*?\{.*?\}', '[IMAGEN]', text)
+
+    # Eliminar comandos de formato
+    text = re.sub(r'\\documentclass.*', '', text)
+    text = re.sub(r'\\usepackage.*', '', text)
+    text = re.sub(r'\\geometry.*', '', text)
+    text = re.sub(r'\\begin\{document\}', '', text)
+    text = re.sub(r'\\end\{document\}', '', text)
+    text = re.sub(r'\\newpage', '\n---NUEVA PAGINA---\n', text)
+    text = re.sub(r'\\clearpage', '\n---NUEVA PAGINA---\n', text)
+
+    # Simplificar comandos de texto
+    text = re.sub(r'\\textbf\{(.*?)\}', r'**\1**', text)
+    text = re.sub(r'\\textit\{(.*?)\}', r'*\1*', text)
+    text = re.sub(r'\\textcolor\{[^}]+\}\{(.*?)\}', r'\1', text)
+    text = re.sub(r'\\section\*?\{(.*?)\}', r'\n## \1\n', text)
+    text = re.sub(r'\\subsection\*?\{(.*?)\}', r'\n### \1\n', text)
+    text = re.sub(r'\\paragraph\{(.*?)\}', r'\n**\1**\n', text)
+
+    # Limpiar entornos de listas
+    text = re.sub(r'\\begin\{enumerate\}.*?\{(.*?)\}', r'\nLISTA:', text)
+    text = re.sub(r'\\begin\{enumerate\}', '\nLISTA:', text)
+    text = re.sub(r'\\end\{enumerate\}', '', text)
+    text = re.sub(r'\\begin\{itemize\}', '\nLISTA:', text)
+    text = re.sub(r'\\end\{itemize\}', '', text)
+    text = re.sub(r'\\item\[(.*?)\]', r'\n- \1: ', text)
+    text = re.sub(r'\\item', '\n- ', text)
+
+    # Limpiar otros entornos
+    text = re.sub(r'\\begin\{minipage\}.*?\{.*?\}', '', text)
+    text = re.sub(r'\\end\{minipage\}', '', text)
+    text = re.sub(r'\\begin\{center\}', '', text)
+    text = re.sub(r'\\end\{center\}', '', text)
+    text = re.sub(r'\\begin\{wrapfigure\}.*?\{.*?\}', '', text)
+    text = re.sub(r'\\end\{wrapfigure\}', '', text)
+
+    # Eliminar comandos residuales
+    text = re.sub(r'\\[a-zA-Z]+\{([^}]*)\}', r'\1', text)
+    text = re.sub(r'\\[a-zA-Z]+', '', text)
+
+    # Limpiar espacios
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = re.sub(r' {2,}', ' ', text)
+
+    return text.strip()
+
+
+
+def read_tex(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except UnicodeDecodeError:
+        with open(path, "r", encoding="latin-1") as f:
+            return f.read()
+
+
+def best_time(func, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def single_pass(text: str) -> str:
+    """Una pasada de re.sub que elimina los tokens sin volver a Python."""
+    return _TOKEN_RE.sub("", text)
+
+
+def single_pass_callback(text: str) -> str:
+    """La misma pasada, pero llamando a una funcion Python por token."""
+    return _TOKEN_RE.sub(lambda m: "", text)
+
+
+def stress_document(n: int) -> str:
+    """Documento con n ecuaciones y dibujos sin \\end correspondiente."""
+    block = (
+        "\\begin{equation} E = \\frac{kq}{r^2} \n"
+        "Texto con \\textbf{negrita} y $V = kq/r$.\n"
+        "\\begin{circuitikz} \\draw (0,0) to[R] (2,0);\n"
+    )
+    return block * n
+
+
+def run_stress(repeat: int) -> int:
+    print("Entornos sin cerrar (tiempo vs tamanio):")
+    for n in (250, 500, 1000, 2000):
+        text = stress_document(n)
+        old_t = best_time(legacy_clean_latex, text, repeat)
+        new_t = best_time(clean_latex, text, repeat)
+        print(f"  n={n:5d} ({len(text) / 1e3:6.0f} KB): cascada {old_t * 1000:9.1f} ms, "
+              f"clean_latex {new_t * 1000:7.1f} ms ({old_t / new_t:6.1f}x)")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de clean_latex")
+    parser.add_argument("--corpus", default=os.path.join(REPO_ROOT, "corpus"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--show", type=int, default=5, help="Archivos con mayor tiempo a listar")
+    parser.add_argument("--stress", action="store_true", help="Medir entradas patologicas sinteticas")
+    args = parser.parse_args()
+
+    if args.stress:
+        return run_stress(args.repeat)
+
+    files = sorted(glob.glob(os.path.join(args.corpus, "**", "*.tex"), recursive=True))
+    if not files:
+        print(f"No se encontraron archivos .tex en {args.corpus}")
+        return 1
+
+    rows = []
+    for path in files:
+        text = read_tex(path)
+        old_t = best_time(legacy_clean_latex, text, args.repeat)
+        new_t = best_time(clean_latex, text, args.repeat)
+        rows.append({
+            "file": os.path.relpath(path, args.corpus),
+            "bytes": len(text),
+            "old_s": old_t,
+            "new_s": new_t,
+            "floor_s": best_time(single_pass, text, args.repeat),
+            "callback_s": best_time(single_pass_callback, text, args.repeat),
+            "old_len": len(legacy_clean_latex(text)),
+            "new_len": len(clean_latex(text)),
+        })
+
+    total_old = sum(r["old_s"] for r in rows)
+    total_new = sum(r["new_s"] for r in rows)
+    print(f"Archivos: {len(rows)}  ({sum(r['bytes'] for r in rows) / 1e6:.2f} MB de LaTeX)")
+    print(f"  Cascada regex: {total_old * 1000:9.1f} ms")
+    print(f"  clean_latex:   {total_new * 1000:9.1f} ms")
+    # Relacion de tiempos, no una optimizacion: clean_latex corrige la cascada (ver --stress)
+    print(f"  Cascada / clean_latex: {total_old / total_new:.1f}x")
+    print(f"  Una pasada de re.sub (piso): {sum(r['floor_s'] for r in rows) * 1000:.1f} ms con plantilla, "
+          f"{sum(r['callback_s'] for r in rows) * 1000:.1f} ms con funcion por token")
+    print(f"  Salida:        {sum(r['old_len'] for r in rows)} -> {sum(r['new_len'] for r in rows)} caracteres")
+
+    print("\nArchivos mas lentos con la cascada:")
+    for r in sorted(rows, key=lambda r: r["old_s"], reverse=True)[:args.show]:
+        print(f"  {r['old_s'] * 1000:8.2f} ms -> {r['new_s'] * 1000:6.2f} ms "
+              f"({r['old_s'] / r['new_s']:5.1f}x)  {r['file']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
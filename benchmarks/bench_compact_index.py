@@ -0,0 +1,146 @@
+"""
+Benchmark del indice compacto int8 (compact_index.py): recall frente a RAM.
+
+Compara contra la busqueda exacta en float32 el recall@k del indice int8
+con y sin re-puntuacion exacta (y del HNSW de ChromaDB si hay coleccion),
+y la memoria de cada opcion. Al final extrapola la memoria a corpus mas
+grandes frente a los 32 GB de RAM del perfil "Minimos" de
+DEPLOY_UNIVERSIDAD.md (que comparten el LLM local y el indice).
+
+Consultas: las preguntas de eval_queries.jsonl y una muestra de chunks del
+propio indice (como consultas de otro alumno sobre el mismo problema).
+
+Uso:
+    python benchmarks/bench_compact_index.py                    # indice en ./chroma_db
+    python benchmarks/bench_compact_index.py --persist ./chroma_db --k 3 9
+    python benchmarks/bench_compact_index.py --synthetic 200000 384   # solo numpy
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import compact_index  # noqa: E402
+from compact_index import CompactIndex, hnsw_bytes, int8_bytes  # noqa: E402
+
+MINIMOS_RAM_GB = 32
+
+
+def exact_neighbors(vectors, queries, k: int):
+    """Vecinos exactos en float32 (la referencia del recall)."""
+    distances = (vectors ** 2).sum(axis=1) - 2 * queries @ vectors.T
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def recall(found, truth) -> float:
+    return sum(len(set(f) & t) for f, t in zip(found, truth)) / sum(len(t) for t in truth)
+
+
+def synthetic(count: int, dim: int, queries: int):
+    """Vectores normalizados agrupados en temas, como los embeddings de un corpus."""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(max(count // 200, 1), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.6 * rng.normal(size=(count, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    picks = vectors[rng.choice(count, size=queries, replace=False)]
+    query_vectors = picks + 0.3 * rng.normal(size=picks.shape)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32), query_vectors.astype(np.float32), None
+
+
+def from_collection(persist_directory: str, queries: int):
+    """Embeddings del indice construido y embeddings de las consultas de evaluacion."""
+    from embeddings import document_embedding_function
+    from eval_retrieval import load_eval_set
+    from math_normalize import normalize_batch
+    from rag_system import open_collection
+
+    collection = open_collection(persist_directory)
+    page = collection.get(include=["embeddings", "metadatas", "documents"])
+    vectors = np.asarray(page["embeddings"], dtype=np.float32)
+    if not len(vectors):
+        raise SystemExit(f"La coleccion en {persist_directory} esta vacia: indexar el corpus primero")
+
+    texts = normalize_batch([item["question"] for item in load_eval_set()])
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), size=min(queries, len(vectors)), replace=False)
+    query_vectors = np.asarray(document_embedding_function()(texts), dtype=np.float32)
+    # Los chunks se usan como consulta quitando el vector identico (seria un acierto trivial)
+    noisy = vectors[picks] + 0.02 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+    return vectors, np.concatenate([query_vectors, noisy]), collection
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del indice int8: recall frente a RAM")
+    parser.add_argument("--persist", default="./chroma_db", help="Carpeta de ChromaDB")
+    parser.add_argument("--synthetic", type=int, nargs=2, metavar=("N", "DIM"),
+                        help="Vectores sinteticos en vez del indice")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 9])
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 4, 10])
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors, queries, collection = synthetic(*args.synthetic, args.queries)
+    else:
+        vectors, queries, collection = from_collection(args.persist, args.queries)
+    count, dim = vectors.shape
+    print(f"{count} vectores de dimension {dim}, {len(queries)} consultas\n")
+
+    directory = tempfile.mkdtemp(prefix="compact_index_")
+    try:
+        index = CompactIndex(os.path.join(directory, "index"))
+        start = time.perf_counter()
+        index.build_from([str(i) for i in range(count)], vectors, [""] * count)
+        print(f"Construccion int8: {time.perf_counter() - start:.2f} s\n")
+
+        print(f"{'metodo':<32}" + "".join(f"{f'recall@{k}':>11}" for k in args.k) + f"{'ms/consulta':>13}")
+        truths = {k: exact_neighbors(vectors, queries, k) for k in args.k}
+
+        if collection is not None:
+            ids = collection.get(include=[])["ids"]
+            row = {doc_id: i for i, doc_id in enumerate(ids)}
+            line, elapsed = "", 0.0
+            for k in args.k:
+                start = time.perf_counter()
+                found = collection.query(query_embeddings=queries.tolist(), n_results=k, include=[])["ids"]
+                elapsed = time.perf_counter() - start
+                line += f"{recall([[row[i] for i in f] for f in found], truths[k]):>11.3f}"
+            print(f"{'HNSW de ChromaDB':<32}{line}{elapsed / len(queries) * 1000:>13.2f}")
+
+        # Sin re-puntuacion: orden solo por la distancia aproximada int8
+        for factor in [0] + args.rescore:
+            compact_index.RESCORE_FACTOR = max(factor, 1)
+            compact_index.MIN_CANDIDATES = 0 if factor <= 1 else 50
+            line, elapsed = "", 0.0
+            for k in args.k:
+                start = time.perf_counter()
+                if factor == 0:
+                    approx = index.norms - 2 * (index.codes.astype(np.float32) @ (queries * index.scale).T).T
+                    found = np.argpartition(approx, k - 1, axis=1)[:, :k].tolist()
+                else:
+                    found, _ = index.search(queries, k)
+                elapsed = time.perf_counter() - start
+                line += f"{recall(found, truths[k]):>11.3f}"
+            label = "int8 sin re-puntuar" if factor == 0 else f"int8 + exacto x{factor} candidatos"
+            print(f"{label:<32}{line}{elapsed / len(queries) * 1000:>13.2f}")
+
+        print(f"\n{'vectores':>12}{'float32':>11}{'HNSW':>11}{'int8':>11}   % de los {MINIMOS_RAM_GB} GB del perfil Minimos")
+        for n in sorted({count, 100_000, 1_000_000, 10_000_000}):
+            print(f"{n:>12}{n * dim * 4 / 1e9:>9.2f}GB{hnsw_bytes(n, dim) / 1e9:>9.2f}GB{int8_bytes(n, dim) / 1e9:>9.2f}GB"
+                  f"   {hnsw_bytes(n, dim) / (MINIMOS_RAM_GB * 1e9):6.1%} -> {int8_bytes(n, dim) / (MINIMOS_RAM_GB * 1e9):6.1%}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Benchmark de embeddings en CPU (embeddings por segundo).
+
+Embebe los chunks de los .tex del corpus con la funcion por defecto de
+ChromaDB y, si hay un modelo ONNX en EMBEDDING_MODEL_DIR, con el modelo
+exportado (fp32 y cuantizado int8) para cada combinacion de tamanio de lote
+e hilos pedida.
+
+Uso:
+    python benchmarks/bench_embeddings.py
+    python benchmarks/bench_embeddings.py --batch-sizes 8 32 64 --threads 1 4 --limit 500
+    python benchmarks/bench_embeddings.py --model-dir models/paraphrase-multilingual-MiniLM-L12-v2
+"""
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from typing import Callable, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from embeddings import (  # noqa: E402
+    EMBEDDING_MODEL_DIR, MODEL_FILE, QUANTIZED_MODEL_FILE, OnnxEmbeddingFunction,
+)
+
+
+def corpus_texts(limit: int) -> List[str]:
+    from tex_processor import extract_chunks_from_tex
+
+    texts = []
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, "corpus", "**", "*.tex"), recursive=True)):
+        with redirect_stdout(io.StringIO()):
+            texts.extend(chunk["content"] for chunk in extract_chunks_from_tex(path, "bench"))
+        if len(texts) >= limit:
+            break
+    return texts[:limit]
+
+
+def measure(name: str, embed: Callable[[List[str]], object], texts: List[str]):
+    embed(texts[:8])  # calentamiento (carga del modelo, asignacion de buffers)
+    start = time.perf_counter()
+    embed(texts)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<40} {len(texts) / elapsed:8.1f} emb/s  ({elapsed:.2f} s)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de embeddings en CPU")
+    parser.add_argument("--model-dir", default=EMBEDDING_MODEL_DIR, help="Carpeta del modelo ONNX")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--limit", type=int, default=1000, help="Chunks a embeber")
+    args = parser.parse_args()
+
+    texts = corpus_texts(args.limit)
+    print(f"{len(texts)} chunks, {sum(map(len, texts)) / len(texts):.0f} caracteres en promedio\n")
+
+    try:
+        from chromadb.utils import embedding_functions
+        default = embedding_functions.DefaultEmbeddingFunction()
+        measure("chromadb por defecto (MiniLM-L6, fp32)", default, texts)
+    except ImportError:
+        print("  chromadb no instalado, se omite la funcion por defecto")
+
+    variants = [(False, MODEL_FILE), (True, QUANTIZED_MODEL_FILE)]
+    for quantized, filename in variants:
+        if not os.path.exists(os.path.join(args.model_dir, filename)):
+            print(f"  {filename} no existe en {args.model_dir}, se omite")
+            continue
+        for threads in args.threads:
+            for batch_size in args.batch_sizes:
+                function = OnnxEmbeddingFunction(args.model_dir, batch_size=batch_size, threads=threads,
+                                                 quantized=quantized)
+                measure(f"{filename} lote={batch_size} hilos={threads}", function.embed, texts)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
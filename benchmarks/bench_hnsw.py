@@ -0,0 +1,167 @@
+"""
+Benchmark de los parametros del HNSW de ChromaDB y del calentamiento.
+
+1. Latencia frente a recall: copia los embeddings del indice construido a
+   colecciones temporales con cada combinacion de M y construction_ef, y
+   para cada search_ef mide recall@k contra la busqueda exacta, hit@k del
+   conjunto de evaluacion (eval_queries.jsonl) y latencia p50/p99 de
+   consultas individuales (solo el indice: las consultas ya van embebidas).
+2. Arranque en frio (--cold): en un proceso nuevo mide la latencia de las
+   primeras preguntas del conjunto de evaluacion con y sin warm_up().
+
+Uso:
+    python benchmarks/bench_hnsw.py
+    python benchmarks/bench_hnsw.py --m 8 16 32 --construction-ef 100 200 --search-ef 10 50 100 200
+    python benchmarks/bench_hnsw.py --cold
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from eval_retrieval import DEFAULT_EVAL_SET, load_eval_set, score  # noqa: E402
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def load_index(persist_directory: str, items: List[Dict], extra_queries: int):
+    """Embeddings y metadata del indice, y embeddings de las consultas de prueba."""
+    from embeddings import document_embedding_function
+    from math_normalize import normalize_batch
+    from rag_system import open_collection
+
+    collection = open_collection(persist_directory)
+    data = collection.get(include=["embeddings", "metadatas"])
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    if not len(vectors):
+        raise SystemExit(f"La coleccion en {persist_directory} esta vacia: indexar el corpus primero")
+
+    questions = normalize_batch([item["question"] for item in items])
+    queries = np.asarray(document_embedding_function()(questions), dtype=np.float32)
+    # Mas consultas para el recall: chunks del indice con algo de ruido
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), size=min(extra_queries, len(vectors)), replace=False)
+    noisy = vectors[picks] + 0.02 * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32)
+    return data["ids"], vectors, data["metadatas"], np.concatenate([queries, noisy])
+
+
+def sweep(args) -> int:
+    import chromadb
+
+    items = load_eval_set(args.eval_set)
+    ids, vectors, metadatas, queries = load_index(args.persist_directory, items, args.queries)
+    print(f"{len(ids)} vectores de dimension {vectors.shape[1]}, {len(queries)} consultas, k={args.k}\n")
+
+    distances = (vectors ** 2).sum(axis=1) - 2 * queries @ vectors.T
+    truth = [set(row) for row in np.argpartition(distances, args.k - 1, axis=1)[:, :args.k]]
+    row = {doc_id: i for i, doc_id in enumerate(ids)}
+
+    print(f"{'M':>4}{'constr_ef':>11}{'search_ef':>11}{'construir':>11}{f'recall@{args.k}':>11}"
+          f"{f'hit@{args.k}':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    directory = tempfile.mkdtemp(prefix="bench_hnsw_")
+    try:
+        client = chromadb.PersistentClient(path=directory)
+        for m in args.m:
+            for construction_ef in args.construction_ef:
+                name = f"bench_m{m}_c{construction_ef}"
+                start = time.perf_counter()
+                collection = client.create_collection(name, embedding_function=None, metadata={
+                    "hnsw:space": "l2", "hnsw:M": m, "hnsw:construction_ef": construction_ef})
+                for offset in range(0, len(ids), 5000):
+                    collection.add(ids=ids[offset:offset + 5000], embeddings=vectors[offset:offset + 5000],
+                                   metadatas=metadatas[offset:offset + 5000])
+                build_seconds = time.perf_counter() - start
+
+                for search_ef in args.search_ef:
+                    collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+                    collection.query(query_embeddings=queries[:1], n_results=args.k, include=[])
+                    latencies, found, docs = [], [], []
+                    for query in queries:
+                        start = time.perf_counter()
+                        result = collection.query(query_embeddings=query[None, :], n_results=args.k,
+                                                  include=["metadatas"])
+                        latencies.append((time.perf_counter() - start) * 1000)
+                        found.append({row[doc_id] for doc_id in result["ids"][0]})
+                        docs.append([{"metadata": metadata} for metadata in result["metadatas"][0]])
+                    recall = sum(len(f & t) for f, t in zip(found, truth)) / sum(len(t) for t in truth)
+                    quality = score(docs[:len(items)], items)
+                    print(f"{m:>4}{construction_ef:>11}{search_ef:>11}{build_seconds:>10.2f}s{recall:>11.3f}"
+                          f"{quality['hit_at_k']:>8.3f}{percentile(latencies, 50):>9.2f}"
+                          f"{percentile(latencies, 99):>9.2f}")
+                client.delete_collection(name)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+def cold_child(args) -> int:
+    """Proceso nuevo: latencias de las primeras preguntas, con o sin warm_up()."""
+    import io
+    from contextlib import redirect_stdout
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        from rag_system import ElectromagnetismRAG
+        rag = ElectromagnetismRAG(args.persist_directory, require_llm=False)
+        if args.warm:
+            rag.warm_up()
+    ready = time.perf_counter() - start
+
+    latencies = []
+    for item in load_eval_set(args.eval_set):
+        start = time.perf_counter()
+        rag.retrieve_relevant_problems(item["question"], n_results=args.k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(json.dumps({"ready_s": ready, "latencies_ms": latencies}))
+    return 0
+
+
+def cold(args) -> int:
+    print(f"{'arranque':<14}{'listo en':>10}{'1a consulta':>13}{'p50 ms':>9}{'p99 ms':>9}")
+    for warm in (False, True):
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--persist-directory",
+                   args.persist_directory, "--eval-set", args.eval_set, "--k", str(args.k)]
+        output = subprocess.run(command + (["--warm"] if warm else []), capture_output=True, text=True,
+                                check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        latencies = result["latencies_ms"]
+        print(f"{'con warm_up' if warm else 'sin warm_up':<14}{result['ready_s']:>9.2f}s{latencies[0]:>12.1f}ms"
+              f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 99):>9.1f}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de parametros HNSW y calentamiento")
+    parser.add_argument("--persist-directory", default=os.path.join(REPO_ROOT, "chroma_db"))
+    parser.add_argument("--eval-set", default=DEFAULT_EVAL_SET)
+    parser.add_argument("--k", type=int, default=9, help="Resultados por consulta (n_results * 3)")
+    parser.add_argument("--queries", type=int, default=300, help="Consultas extra derivadas de chunks")
+    parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 20, 50, 100])
+    parser.add_argument("--cold", action="store_true", help="Medir el arranque en frio con y sin warm_up")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warm", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return cold_child(args)
+    if args.cold:
+        return cold(args)
+    return sweep(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Benchmark de tiempo de importacion (python -X importtime).
+
+Mide cuanto tarda en importarse cada modulo de entrada de la aplicacion y
+lista los modulos mas costosos. Sirve para detectar regresiones en el
+arranque de los workers (systemd reinicia el proceso con cada despliegue).
+
+Uso:
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --module rag_system --top 15
+    python benchmarks/bench_import_time.py --json bench_output.txt
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modulos que carga la ruta de consulta (app sin indexar)
+DEFAULT_MODULES = ["rag_system", "pdf_processor", "tex_processor"]
+
+
+def profile_import(module: str, repeat: int = 3) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """
+    Importa un modulo en un proceso limpio con -X importtime.
+
+    Args:
+        module: Nombre del modulo a importar
+        repeat: Numero de repeticiones (se reporta la mejor)
+
+    Returns:
+        (tiempo total en ms, lista de (modulo, self_us, cumulative_us))
+    """
+    best_total = None
+    best_rows = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+        )
+        rows = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            parts = line[len("import time:"):].split("|")
+            if len(parts) != 3:
+                continue
+            rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+
+        if proc.returncode != 0:
+            print(f"  Error importando {module}: {proc.stderr.strip().splitlines()[-1]}")
+
+        top_level = [r for r in rows if r[0] == module]
+        total_ms = (top_level[-1][2] if top_level else sum(r[1] for r in rows)) / 1000
+        if best_total is None or total_ms < best_total:
+            best_total = total_ms
+            best_rows = rows
+    return best_total or 0.0, best_rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de tiempo de importacion")
+    parser.add_argument("--module", action="append", help="Modulo a medir (repetible)")
+    parser.add_argument("--top", type=int, default=10, help="Modulos mas costosos a listar")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict] = {}
+    for module in args.module or DEFAULT_MODULES:
+        total_ms, rows = profile_import(module, args.repeat)
+        heaviest = sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]
+        results[module] = {
+            "total_ms": round(total_ms, 2),
+            "modules_loaded": len(rows),
+            "heaviest": [{"module": m, "self_ms": s / 1000, "cumulative_ms": c / 1000} for m, s, c in heaviest],
+        }
+
+        print(f"\n{module}: {total_ms:.1f} ms ({len(rows)} modulos)")
+        for name, self_us, cum_us in heaviest:
+            print(f"  {self_us / 1000:8.1f} ms  (acum {cum_us / 1000:8.1f} ms)  {name}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
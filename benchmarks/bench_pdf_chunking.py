@@ -0,0 +1,147 @@
+"""
+Benchmark de extraccion y division en chunks de PDFs.
+
+Compara el pipeline anterior (documento completo armado con text +=,
+re-dividido por "--- Pagina" y sub-dividido con current_chunk +=) contra el
+actual (iter_pdf_pages + chunker.chunk_pages): tiempo, memoria maxima
+(tracemalloc), numero de chunks y caracteres indexados en total (el texto
+que se repite entre padres, hijos y solapamiento cuenta cada vez). Las
+paginas se extraen una sola vez y ambos pipelines parten de los mismos
+registros, asi se mide solo la division.
+
+Uso:
+    python benchmarks/bench_pdf_chunking.py                       # PDFs mas grandes del corpus
+    python benchmarks/bench_pdf_chunking.py corpus/campo_magnetico/pautac4.pdf
+    python benchmarks/bench_pdf_chunking.py --all                 # todos los PDFs del corpus, sumados
+    python benchmarks/bench_pdf_chunking.py --synthetic 1500      # sin pdfplumber: paginas sinteticas
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from chunker import chunk_pages  # noqa: E402
+
+
+def legacy_chunks(pages: List[Dict], source: str, chunk_size: int = 2000) -> List[Dict]:
+    """Pipeline original de pdf_processor (referencia)."""
+    text = ""
+    for record in pages:
+        text += f"\n--- Pagina {record['page']} ---\n"
+        text += record["text"] + "\n"
+
+    chunks = []
+    for i, page_content in enumerate(text.split("--- Pagina ")):
+        page_content = page_content.strip()
+        if not page_content:
+            continue
+        if page_content.startswith("---"):
+            lines = page_content.split("\n", 1)
+            if len(lines) > 1:
+                page_content = lines[1]
+        if len(page_content) > chunk_size:
+            current_chunk = ""
+            for paragraph in page_content.split("\n\n"):
+                if len(current_chunk) + len(paragraph) < chunk_size:
+                    current_chunk += paragraph + "\n\n"
+                else:
+                    if current_chunk.strip():
+                        chunks.append({"source": source, "content": current_chunk.strip()})
+                    current_chunk = paragraph + "\n\n"
+            if current_chunk.strip():
+                chunks.append({"source": source, "content": current_chunk.strip()})
+        else:
+            chunks.append({"source": source, "content": page_content.strip()})
+    return chunks
+
+
+def synthetic_pages(n_pages: int) -> List[Dict]:
+    """Paginas armadas con el texto limpio de los .tex del corpus (sin pdfplumber)."""
+    from tex_processor import clean_latex
+
+    texts = []
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, "corpus", "**", "*.tex"), recursive=True)):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            texts.append(clean_latex(f.read()))
+    body = "\n\n".join(texts)
+    page_size = 3000
+    pages = []
+    for n in range(n_pages):
+        start = (n * page_size) % max(len(body) - page_size, 1)
+        pages.append({"page": n + 1, "text": body[start:start + page_size], "ocr": False})
+    return pages
+
+
+def measure(func, docs: List[tuple]) -> Dict:
+    start = time.perf_counter()
+    result = [chunk for name, pages in docs for chunk in func(pages, name)]
+    elapsed = time.perf_counter() - start
+
+    # Memoria en una segunda corrida: tracemalloc distorsiona el tiempo
+    tracemalloc.start()
+    for name, pages in docs:
+        func(pages, name)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed, "peak_mb": peak / 1e6, "chunks": len(result),
+            "chars": sum(len(chunk["content"]) for chunk in result)}
+
+
+def report(name: str, docs: List[tuple]):
+    pages = [record for _, records in docs for record in records]
+    total_chars = sum(len(r["text"]) for r in pages)
+    old = measure(legacy_chunks, docs)
+    new = measure(lambda records, source: chunk_pages(iter(records), source, "bench", "pdf"), docs)
+    print(f"\n{name}: {len(pages)} paginas, {total_chars / 1e6:.2f} M caracteres")
+    for label, row in (("Anterior", old), ("Actual", new)):
+        print(f"  {label + ':':9s} {row['seconds'] * 1000:9.1f} ms  memoria maxima {row['peak_mb']:7.1f} MB  "
+              f"{row['chunks']:6d} chunks  {row['chars'] / 1e6:6.2f} M caracteres indexados")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de division de PDFs en chunks")
+    parser.add_argument("pdfs", nargs="*", help="PDFs a medir (por defecto los mas grandes del corpus)")
+    parser.add_argument("--top", type=int, default=3, help="PDFs mas grandes del corpus a medir")
+    parser.add_argument("--all", action="store_true", help="Medir todos los PDFs del corpus como un solo lote")
+    parser.add_argument("--synthetic", type=int, help="Medir N paginas sinteticas en vez de PDFs")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        report(f"sintetico-{args.synthetic}", [("sintetico", synthetic_pages(args.synthetic))])
+        return 0
+
+    from pdf_processor import iter_pdf_pages
+
+    corpus_pdfs = sorted(glob.glob(os.path.join(REPO_ROOT, "corpus", "**", "*.pdf"), recursive=True),
+                         key=os.path.getsize, reverse=True)
+    if args.all:
+        docs = []
+        start = time.perf_counter()
+        for path in corpus_pdfs:
+            pages = list(iter_pdf_pages(path, use_ocr_fallback=False))
+            if pages:
+                docs.append((os.path.basename(path), pages))
+        print(f"\nExtraccion de {len(corpus_pdfs)} PDFs ({len(docs)} con texto): "
+              f"{time.perf_counter() - start:.2f} s")
+        report("corpus", docs)
+        return 0
+
+    for path in args.pdfs or corpus_pdfs[:args.top]:
+        start = time.perf_counter()
+        pages = list(iter_pdf_pages(path, use_ocr_fallback=False))
+        print(f"\nExtraccion de {os.path.basename(path)}: {time.perf_counter() - start:.2f} s")
+        if pages:
+            report(os.path.basename(path), [(os.path.basename(path), pages)])
+        else:
+            print("  Sin texto extraible (PDF escaneado), se omite")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+Harness de evaluacion de recuperacion sobre el indice construido.
+
+Carga preguntas etiquetadas (eval_queries.jsonl: pregunta, categoria y
+fragmentos del nombre de archivo esperados), las resuelve con la API por
+lotes y reporta hit@k, MRR y consultas/s comparando un bucle de consultas
+individuales contra una sola llamada por lotes.
+
+Con --calibrate reporta ademas las similitudes de los aciertos y de las
+preguntas fuera del curso (eval_offtopic.jsonl), sugiere los umbrales de
+adaptive_retrieval.py y compara la profundidad adaptativa contra k fijo
+(aciertos, documentos y caracteres de contexto por pregunta).
+
+Uso:
+    python benchmarks/eval_retrieval.py
+    python benchmarks/eval_retrieval.py --k 5 --repeat 5
+    python benchmarks/eval_retrieval.py --calibrate
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+DEFAULT_EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_queries.jsonl")
+DEFAULT_OFFTOPIC_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_offtopic.jsonl")
+
+
+def load_eval_set(path: str = DEFAULT_EVAL_SET) -> List[Dict]:
+    """Lee el conjunto de preguntas etiquetadas."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def first_hit_rank(docs: List[Dict], expected_sources: List[str]) -> int:
+    """Posicion (1-based) del primer documento cuya fuente coincide, o 0."""
+    for rank, doc in enumerate(docs, 1):
+        source = doc["metadata"].get("source", "")
+        if any(expected in source for expected in expected_sources):
+            return rank
+    return 0
+
+
+def score(results: List[List[Dict]], items: List[Dict]) -> Dict:
+    """Calcula hit@k y MRR de una lista de resultados por pregunta."""
+    ranks = [first_hit_rank(docs, item["sources"]) for docs, item in zip(results, items)]
+    hits = sum(1 for r in ranks if r)
+    return {
+        "hit_at_k": hits / len(items) if items else 0.0,
+        "mrr": sum(1 / r for r in ranks if r) / len(items) if items else 0.0,
+        "ranks": ranks,
+    }
+
+
+def evaluate(rag, items: List[Dict], k: int = 3, use_category: bool = False) -> Dict:
+    """Evalua la recuperacion de una instancia de ElectromagnetismRAG."""
+    queries = [item["question"] for item in items]
+    if use_category:
+        results = [
+            rag.retrieve_relevant_problems(q, n_results=k, category_filter=item["category"])
+            for q, item in zip(queries, items)
+        ]
+    else:
+        results = rag.retrieve_relevant_problems_batch(queries, n_results=k)
+    return score(results, items)
+
+
+def measure_throughput(rag, queries: List[str], k: int = 3, repeat: int = 3) -> Dict:
+    """Compara consultas/s de un bucle de consultas individuales contra un lote."""
+    loop_times, batch_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for q in queries:
+            rag.retrieve_relevant_problems(q, n_results=k)
+        loop_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rag.retrieve_relevant_problems_batch(queries, n_results=k)
+        batch_times.append(time.perf_counter() - start)
+
+    return {
+        "loop_qps": len(queries) / min(loop_times),
+        "batch_qps": len(queries) / min(batch_times),
+    }
+
+
+def _context_chars(docs: List[Dict]) -> int:
+    """Caracteres de material de referencia que se enviarian al LLM (con el tope CONTEXT_CHARS)."""
+    from rag_system import CONTEXT_CHARS
+    return min(sum(len(doc["content"]) for doc in docs), CONTEXT_CHARS)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+def calibrate(rag, items: List[Dict], offtopic: List[Dict]) -> Dict:
+    """
+    Similitudes de aciertos y de preguntas fuera del curso, umbrales
+    sugeridos y comparacion de la profundidad adaptativa contra k fijo.
+    """
+    from adaptive_retrieval import ADAPTIVE_MAX_K, DEFAULT_K, is_small_talk, select_documents, similarity
+
+    space = rag._distance_space()
+    results = rag.retrieve_relevant_problems_batch([item["question"] for item in items], n_results=ADAPTIVE_MAX_K)
+    top, hit_scores, wrong_top = [], [], []
+    fixed = {"hits": 0, "docs": 0, "chars": 0}
+    adaptive = {"hits": 0, "docs": 0, "chars": 0}
+    reasons: Dict[str, int] = {}
+    for docs, item in zip(results, items):
+        scores = [similarity(doc["distance"], space) for doc in docs]
+        rank = first_hit_rank(docs, item["sources"])
+        if scores:
+            top.append((scores[0], rank == 1))
+        if rank:
+            hit_scores.append(scores[rank - 1])
+        elif scores:
+            wrong_top.append(scores[0])
+
+        for totals, chosen in ((fixed, docs[:DEFAULT_K]), (adaptive, None)):
+            if chosen is None:
+                chosen, reason = select_documents(docs, space)
+                reasons[reason] = reasons.get(reason, 0) + 1
+            totals["hits"] += bool(first_hit_rank(chosen, item["sources"]))
+            totals["docs"] += len(chosen)
+            totals["chars"] += _context_chars(chosen)
+
+    # Fuera del curso: la charla no se recupera; el resto deberia quedar bajo el minimo
+    questions = [item["question"] for item in offtopic if not is_small_talk(item["question"])]
+    off_scores = [similarity(docs[0]["distance"], space)
+                  for docs in rag.retrieve_relevant_problems_batch(questions, n_results=1) if docs]
+    off_selected = sum(bool(select_documents(docs, space)[0])
+                       for docs in rag.retrieve_relevant_problems_batch(questions, n_results=ADAPTIVE_MAX_K))
+
+    # Minimo: entre la pregunta fuera del curso mas parecida y el acierto menos parecido
+    suggested_min = None
+    if hit_scores and off_scores:
+        suggested_min = (max(off_scores) + min(hit_scores)) / 2 if max(off_scores) < min(hit_scores) \
+            else _percentile(off_scores, 0.9)
+    # Confiado: la menor similitud desde la cual el primer documento siempre es el correcto
+    suggested_confident = None
+    for score, correct in sorted(top, reverse=True):
+        if not correct:
+            break
+        suggested_confident = score
+
+    n = len(items)
+    return {
+        "space": space,
+        "hit_similarity": {"min": min(hit_scores, default=None), "p10": _percentile(hit_scores, 0.1),
+                           "p50": _percentile(hit_scores, 0.5)},
+        "miss_top_similarity": {"max": max(wrong_top, default=None)},
+        "offtopic": {"questions": len(questions), "small_talk": len(offtopic) - len(questions),
+                     "max_similarity": max(off_scores, default=None), "with_context": off_selected},
+        "suggested": {"ADAPTIVE_MIN_SIMILARITY": suggested_min, "ADAPTIVE_CONFIDENT_SIMILARITY": suggested_confident},
+        "fixed": {key: value / n for key, value in fixed.items()} if n else fixed,
+        "adaptive": {key: value / n for key, value in adaptive.items()} if n else adaptive,
+        "reasons": reasons,
+    }
+
+
+def _print_calibration(report: Dict):
+    def fmt(value):
+        return "-" if value is None else f"{value:.3f}"
+
+    print(f"Calibracion de adaptive_retrieval.py (metrica {report['space']}, similitud coseno)")
+    hit = report["hit_similarity"]
+    print(f"  Aciertos:        min {fmt(hit['min'])}  p10 {fmt(hit['p10'])}  p50 {fmt(hit['p50'])}")
+    print(f"  Sin acierto:     max similitud del primero {fmt(report['miss_top_similarity']['max'])}")
+    off = report["offtopic"]
+    print(f"  Fuera del curso: {off['questions']} preguntas (+{off['small_talk']} de charla), "
+          f"max {fmt(off['max_similarity'])}, {off['with_context']} con contexto")
+    for key, value in report["suggested"].items():
+        print(f"  Sugerido {key}={fmt(value)}")
+    for label in ("fixed", "adaptive"):
+        totals = report[label]
+        print(f"  {'k fijo' if label == 'fixed' else 'adaptativo':11s} aciertos {totals['hits']:.3f}  "
+              f"docs/pregunta {totals['docs']:.2f}  caracteres/pregunta {totals['chars']:.0f}")
+    print("  Motivos: " + ", ".join(f"{reason} {count}" for reason, count in sorted(report["reasons"].items())))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Evaluacion de recuperacion")
+    parser.add_argument("--eval-set", default=DEFAULT_EVAL_SET)
+    parser.add_argument("--persist-directory", default=os.path.join(REPO_ROOT, "chroma_db"))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    parser.add_argument("--calibrate", action="store_true", help="Calibrar los umbrales de adaptive_retrieval.py")
+    parser.add_argument("--offtopic-set", default=DEFAULT_OFFTOPIC_SET)
+    args = parser.parse_args()
+
+    from rag_system import ElectromagnetismRAG
+
+    rag = ElectromagnetismRAG(args.persist_directory, require_llm=False)
+    if rag.get_collection_stats()["total_problems"] == 0:
+        print("El indice esta vacio. Indexa el corpus antes de evaluar.")
+        return 1
+
+    items = load_eval_set(args.eval_set)
+    quality = evaluate(rag, items, args.k)
+    throughput = measure_throughput(rag, [item["question"] for item in items], args.k, args.repeat)
+
+    print(f"Preguntas: {len(items)}  k={args.k}")
+    print(f"  hit@{args.k}: {quality['hit_at_k']:.3f}")
+    print(f"  MRR:    {quality['mrr']:.3f}")
+    print(f"  Bucle:  {throughput['loop_qps']:.1f} consultas/s")
+    print(f"  Lote:   {throughput['batch_qps']:.1f} consultas/s")
+
+    output = {"quality": quality, "throughput": throughput}
+    if args.calibrate:
+        output["calibration"] = calibrate(rag, items, load_eval_set(args.offtopic_set))
+        _print_calibration(output["calibration"])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
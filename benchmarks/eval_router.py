@@ -0,0 +1,160 @@
+"""
+Evaluacion y ajuste del clasificador de model_router.py.
+
+Lee preguntas etiquetadas (route_queries.jsonl: pregunta y ruta esperada,
+"simple" o "complejo"), reporta la exactitud de las reglas mas el
+clasificador y la matriz de confusion, y con --fit ajusta los pesos de la
+regresion logistica (descenso de gradiente con numpy) y los guarda en un
+JSON para ROUTER_WEIGHTS.
+
+Los pesos por defecto se ajustaron sobre este mismo conjunto, asi que su
+exactitud es la de entrenamiento. La validacion cruzada (--folds) ajusta
+los pesos sin cada particion y la clasifica con ellos; esa exactitud, y el
+costo estimado de las rutas que elige, es la que vale para preguntas
+nuevas. El costo supone los mismos tokens de entrada y salida para ambas
+rutas (--input-tokens, --output-tokens) y los precios de model_router.py.
+
+Uso:
+    python benchmarks/eval_router.py
+    python benchmarks/eval_router.py --folds 10
+    python benchmarks/eval_router.py --fit router_weights.json
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+DEFAULT_ROUTE_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "route_queries.jsonl")
+
+
+def load_route_set(path: str = DEFAULT_ROUTE_SET) -> List[Dict]:
+    """Lee el conjunto de preguntas con su ruta esperada."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(items: List[Dict], weights: Dict[str, float] = None) -> Dict:
+    """Exactitud, matriz de confusion y errores de model_router.classify."""
+    from model_router import classify
+
+    decisions = [classify(item["question"], weights) for item in items]
+    return _score(items, [route for route, _ in decisions], [reason for _, reason in decisions])
+
+
+def _score(items: List[Dict], routes: List[str], reasons: List[str]) -> Dict:
+    confusion = {(expected, got): 0 for expected in ("simple", "complejo") for got in ("simple", "complejo")}
+    errors = []
+    for item, route, reason in zip(items, routes, reasons):
+        confusion[(item["route"], route)] += 1
+        if route != item["route"]:
+            errors.append({"question": item["question"], "expected": item["route"], "got": route, "reason": reason})
+    correct = confusion[("simple", "simple")] + confusion[("complejo", "complejo")]
+    return {"accuracy": correct / len(items) if items else 0.0,
+            "confusion": {f"{e}->{g}": n for (e, g), n in confusion.items()}, "errors": errors}
+
+
+def fit(items: List[Dict], epochs: int = 3000, lr: float = 0.1, l2: float = 0.01) -> Dict[str, float]:
+    """Ajusta la regresion logistica sobre las caracteristicas de model_router."""
+    import numpy as np
+
+    from model_router import FEATURES, features
+
+    x = np.array([[features(item["question"])[name] for name in FEATURES] for item in items])
+    y = np.array([item["route"] == "complejo" for item in items], dtype=float)
+    w = np.zeros(len(FEATURES))
+    for _ in range(epochs):
+        p = 1 / (1 + np.exp(-x @ w))
+        grad = x.T @ (p - y) / len(y) + l2 * np.r_[0, w[1:]]
+        w -= lr * grad
+    return {name: round(float(value), 2) for name, value in zip(FEATURES, w)}
+
+
+def cross_validate(items: List[Dict], folds: int = 5, seed: int = 0) -> Dict:
+    """
+    Validacion cruzada estratificada: cada pregunta se clasifica con pesos
+    ajustados sin su particion.
+
+    Returns:
+        evaluate() sobre las predicciones fuera de muestra, mas "routes"
+        (ruta elegida para cada pregunta, en el orden de items)
+    """
+    import random
+
+    from model_router import classify
+
+    # Particiones con la misma proporcion de simples y complejos
+    fold_of = {}
+    for route in ("simple", "complejo"):
+        indices = [i for i, item in enumerate(items) if item["route"] == route]
+        random.Random(seed).shuffle(indices)
+        fold_of.update({index: position % folds for position, index in enumerate(indices)})
+
+    routes = [None] * len(items)
+    for fold in range(folds):
+        weights = fit([item for i, item in enumerate(items) if fold_of[i] != fold])
+        for i, item in enumerate(items):
+            if fold_of[i] == fold:
+                routes[i] = classify(item["question"], weights)[0]
+    result = _score(items, routes, ["validacion cruzada"] * len(items))
+    result["routes"] = routes
+    return result
+
+
+def estimate_cost(items: List[Dict], routes: List[str], input_tokens: int, output_tokens: int) -> Dict:
+    """Costo en USD de responder items con las rutas dadas contra enviar todo al modelo grande."""
+    from model_router import COMPLEX, ROUTES
+
+    routed = sum(ROUTES[route].cost(input_tokens, output_tokens) for route in routes)
+    baseline = COMPLEX.cost(input_tokens, output_tokens) * len(items)
+    return {"baseline": baseline, "routed": routed, "savings": 1 - routed / baseline if baseline else 0.0,
+            "small_share": routes.count("simple") / len(routes) if routes else 0.0,
+            "complex_to_small": sum(1 for item, route in zip(items, routes)
+                                    if item["route"] == "complejo" and route == "simple")}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Evaluacion del enrutador de modelos")
+    parser.add_argument("--route-set", default=DEFAULT_ROUTE_SET)
+    parser.add_argument("--fit", metavar="ARCHIVO", help="Ajustar los pesos y guardarlos en ARCHIVO (JSON)")
+    parser.add_argument("--folds", type=int, default=5, help="Particiones de la validacion cruzada")
+    parser.add_argument("--input-tokens", type=int, default=2500, help="Tokens de entrada por pregunta (con contexto)")
+    parser.add_argument("--output-tokens", type=int, default=800, help="Tokens de salida por pregunta")
+    args = parser.parse_args()
+
+    items = load_route_set(args.route_set)
+    weights = None
+    if args.fit:
+        weights = fit(items)
+        with open(args.fit, "w", encoding="utf-8") as f:
+            json.dump(weights, f, indent=2)
+        print(f"Pesos ajustados en {args.fit} (usar con ROUTER_WEIGHTS={args.fit}):")
+        print("  " + ", ".join(f"{name} {value:g}" for name, value in weights.items()))
+
+    result = evaluate(items, weights)
+    print(f"Preguntas: {len(items)}  exactitud sobre los datos de ajuste {result['accuracy']:.3f}")
+    print("  " + "  ".join(f"{key}: {n}" for key, n in result["confusion"].items()))
+    for error in result["errors"]:
+        print(f"  [{error['expected']} -> {error['got']}, {error['reason']}] {error['question']}")
+
+    held_out = cross_validate(items, args.folds)
+    print(f"Validacion cruzada ({args.folds} particiones): exactitud {held_out['accuracy']:.3f}")
+    print("  " + "  ".join(f"{key}: {n}" for key, n in held_out["confusion"].items()))
+    for error in held_out["errors"]:
+        print(f"  [{error['expected']} -> {error['got']}] {error['question']}")
+
+    cost = estimate_cost(items, held_out["routes"], args.input_tokens, args.output_tokens)
+    print(f"Costo ({args.input_tokens} tokens de entrada y {args.output_tokens} de salida por pregunta, "
+          f"rutas de la validacion cruzada):")
+    print(f"  todo al modelo grande ${cost['baseline']:.4f}  enrutado ${cost['routed']:.4f}  "
+          f"ahorro {cost['savings']:.1%}")
+    print(f"  {cost['small_share']:.0%} de las preguntas al modelo chico; "
+          f"{cost['complex_to_small']} problemas enviados al modelo chico por error")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
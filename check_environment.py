@@ -1,6 +1,8 @@
 """
 Script de verificacion de entorno para ElectroAgent.
 Ejecutar con: python check_environment.py
+Verificacion en vivo (indice, cola de trabajos y LLM; las mismas sondas
+que /healthz de metrics_server.py): python check_environment.py --live
 
 Este script verifica todas las dependencias necesarias para ejecutar
 la aplicacion en un nuevo PC con Windows 11.
@@ -210,7 +212,35 @@ def check_chromadb():
         print_info("ChromaDB se creara automaticamente al iniciar")
         return True
 
+def check_live():
+    """Ejecuta las sondas de metrics_server.py sobre el despliegue actual."""
+    print_header("ElectroAgent - Verificacion en vivo")
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    from metrics_server import run_probes
+
+    probes = run_probes()
+    for name, result in probes.items():
+        details = ", ".join(f"{key}={value}" for key, value in result.items() if key != "ok")
+        if result["ok"]:
+            print_ok(f"{name}: {details}")
+        else:
+            print_error(f"{name}: {details}")
+
+    print()
+    if all(result["ok"] for result in probes.values()):
+        print(f"{GREEN}{BOLD}Servicio listo para recibir consultas{RESET}")
+        return 0
+    print(f"{RED}{BOLD}Hay sondas que fallan{RESET}")
+    return 1
+
 def main():
+    if "--live" in sys.argv[1:]:
+        return check_live()
+
     print_header("ElectroAgent - Verificacion de Entorno")
     print(f"  Directorio: {os.getcwd()}")
     print(f"  Python: {sys.executable}")
@@ -0,0 +1,348 @@
+"""
+Almacen comprimido del texto de los chunks, separado del indice vectorial.
+
+ChromaDB guarda solo los vectores, los ids y la metadata liviana de cada
+chunk (con su content_hash); el texto vive aqui, direccionado por contenido
+(SHA-256), y se lee solo para los documentos que se muestran o se envian al
+LLM.
+
+Formato en disco (dentro de CHUNK_STORE_DIR):
+    chunks.dat  Bloques comprimidos: 1 byte de codec + datos. Cada bloque
+                agrupa varios chunks consecutivos (hasta BLOCK_BYTES), asi
+                la compresion aprovecha el texto repetido entre chunks del
+                mismo archivo y un problema y sus partes caen en el mismo bloque.
+    chunks.idx  Una linea por chunk: "hash offset largo inicio fin", donde
+                offset/largo ubican el bloque en chunks.dat e inicio/fin el
+                chunk dentro del bloque descomprimido.
+
+chunks.dat se lee con mmap (las paginas se comparten entre procesos) y los
+dos archivos solo crecen por el final. Las escrituras de varios procesos se
+serializan con el candado de write_lock.py (la lectura no lo usa). Otro
+proceso que agregue chunks se detecta al no encontrar un hash; reset() y
+compact() crean archivos nuevos y los lectores los reabren al notar el
+cambio de inodo. Los textos que ninguna coleccion usa ya (archivos
+reindexados o borrados) solo se eliminan con compact(), que rag_system.py
+llama al borrar las colecciones retiradas.
+
+Se usa zstd si esta instalado (pip install zstandard) y zlib si no.
+"""
+import hashlib
+import mmap
+import os
+import shutil
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from write_lock import write_lock
+
+CHUNK_STORE = os.getenv("CHUNK_STORE", "1") == "1"
+# Por defecto dentro de la carpeta de ChromaDB, para que indice y texto viajen juntos
+CHUNK_STORE_DIR = os.getenv("CHUNK_STORE_DIR")
+
+DATA_FILE = "chunks.dat"
+INDEX_FILE = "chunks.idx"
+HASH_CHARS = 32
+BLOCK_BYTES = 64 * 1024
+# Bloques descomprimidos que se mantienen en memoria
+BLOCK_CACHE_SIZE = 32
+
+_ZLIB = b"z"
+_ZSTD = b"s"
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:HASH_CHARS]
+
+
+def _parse_index_line(line: bytes) -> Optional[Tuple[str, Tuple[int, int, int, int]]]:
+    """
+    Hash y ubicacion de una linea de chunks.idx, o None si no se puede leer.
+
+    Un proceso que muere a mitad de una escritura deja un resto de linea sin
+    salto al final; put_many lo descarta antes de agregar, pero un almacen
+    escrito por una version anterior puede tener ese resto pegado delante de
+    la linea siguiente. La entrada valida son siempre los ultimos cinco
+    campos, con el hash en los ultimos HASH_CHARS caracteres del primero.
+    """
+    fields = line.decode("ascii", errors="replace").split()
+    if len(fields) < 5 or len(fields[-5]) < HASH_CHARS:
+        return None
+    try:
+        offset, length, start, end = (int(field) for field in fields[-4:])
+    except ValueError:
+        return None
+    return fields[-5][-HASH_CHARS:], (offset, length, start, end)
+
+
+def _compress(data: bytes) -> bytes:
+    if zstandard is not None:
+        return _ZSTD + zstandard.ZstdCompressor(level=9).compress(data)
+    return _ZLIB + zlib.compress(data, 6)
+
+
+def _decompress(frame: bytes) -> bytes:
+    codec, data = frame[:1], frame[1:]
+    if codec == _ZLIB:
+        return zlib.decompress(data)
+    if codec == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("El almacen de chunks usa zstd: instalar zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Codec de bloque desconocido: {codec!r}")
+
+
+class ChunkStore:
+    """Almacen de textos direccionado por hash, comprimido por bloques."""
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: Carpeta del almacen (se crea si no existe)
+        """
+        self.directory = directory
+        self.data_path = os.path.join(directory, DATA_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self._lock = threading.RLock()
+        self._blocks: "OrderedDict[int, bytes]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._open()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for path in (self.data_path, self.index_path):
+            if not os.path.exists(path):
+                open(path, "ab").close()
+        self._index: Dict[str, Tuple[int, int, int, int]] = {}
+        self._index_inode = os.stat(self.index_path).st_ino
+        self._index_position = 0
+        self._map: Optional[mmap.mmap] = None
+        self._blocks.clear()
+        self._read_index()
+
+    def _read_index(self):
+        """Lee las lineas nuevas de chunks.idx (las agregadas por otros procesos)."""
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_position)
+            data = f.read()
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].splitlines():
+            entry = _parse_index_line(line)
+            if entry is None:
+                print(f"Advertencia: linea ilegible en {self.index_path}: {line[:80]!r}")
+                continue
+            self._index[entry[0]] = entry[1]
+        self._index_position += complete
+
+    def _refresh(self):
+        if os.stat(self.index_path).st_ino != self._index_inode:
+            self.close()
+            self._open()
+        else:
+            self._read_index()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def put_many(self, texts: Iterable[str]) -> List[str]:
+        """
+        Guarda textos (los ya presentes no se repiten).
+
+        Args:
+            texts: Textos a guardar, en orden de documento
+
+        Returns:
+            Hash de cada texto, en el mismo orden
+        """
+        # El offset de cada bloque se toma del final de chunks.dat: otro
+        # proceso no debe agregar entre la lectura y la escritura
+        with self._lock, write_lock(self.directory):
+            self._refresh()
+            # Resto de una escritura cortada: las lineas nuevas se pegarian a el
+            if os.path.getsize(self.index_path) > self._index_position:
+                os.truncate(self.index_path, self._index_position)
+            keys = []
+            block: List[Tuple[str, bytes]] = []
+            pending = set()
+            block_size = 0
+            with open(self.data_path, "ab") as data_file, open(self.index_path, "ab") as index_file:
+                for text in texts:
+                    key = content_hash(text)
+                    keys.append(key)
+                    if key in self._index or key in pending:
+                        continue
+                    encoded = text.encode("utf-8")
+                    block.append((key, encoded))
+                    pending.add(key)
+                    block_size += len(encoded)
+                    if block_size >= BLOCK_BYTES:
+                        self._write_block(block, data_file, index_file)
+                        block, block_size = [], 0
+                if block:
+                    self._write_block(block, data_file, index_file)
+            return keys
+
+    def _write_block(self, block: List[Tuple[str, bytes]], data_file, index_file):
+        frame = _compress(b"".join(encoded for _, encoded in block))
+        offset = data_file.seek(0, os.SEEK_END)
+        data_file.write(frame)
+        # Los datos deben estar en disco antes que las lineas del indice que los apuntan
+        data_file.flush()
+        os.fsync(data_file.fileno())
+
+        lines = []
+        start = 0
+        for key, encoded in block:
+            end = start + len(encoded)
+            self._index[key] = (offset, len(frame), start, end)
+            lines.append(f"{key} {offset} {len(frame)} {start} {end}\n")
+            start = end
+        # _index_position no avanza: las lineas propias se releen sin efecto y
+        # asi no se saltan las que otro proceso haya agregado entremedio
+        index_file.write("".join(lines).encode("ascii"))
+        index_file.flush()
+
+    def put(self, text: str) -> str:
+        return self.put_many([text])[0]
+
+    def _block(self, offset: int, length: int) -> bytes:
+        block = self._blocks.get(offset)
+        if block is not None:
+            self._blocks.move_to_end(offset)
+            self.cache_hits += 1
+            return block
+        self.cache_misses += 1
+        if self._map is None or offset + length > len(self._map):
+            if self._map is not None:
+                self._map.close()
+            with open(self.data_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        block = _decompress(self._map[offset:offset + length])
+        self._blocks[offset] = block
+        if len(self._blocks) > BLOCK_CACHE_SIZE:
+            self._blocks.popitem(last=False)
+        return block
+
+    def get(self, key: str) -> Optional[str]:
+        """Texto de un hash, o None si no esta en el almacen."""
+        with self._lock:
+            location = self._index.get(key)
+            # Hash nuevo o bloque fuera del mapeo: puede haber escrito (o vaciado) otro proceso
+            if location is None or self._map is None or location[0] + location[1] > len(self._map):
+                self._refresh()
+                location = self._index.get(key)
+                if location is None:
+                    return None
+            offset, length, start, end = location
+            return self._block(offset, length)[start:end].decode("utf-8")
+
+    def get_many(self, keys: Iterable[str]) -> List[Optional[str]]:
+        return [self.get(key) for key in keys]
+
+    def copy_to(self, directory: str, keys: Iterable[str]) -> int:
+        """
+        Escribe en directory un almacen con solo los textos de keys, en el
+        orden en que estan aqui (los chunks de un archivo siguen en el mismo
+        bloque).
+
+        Args:
+            directory: Carpeta del almacen nuevo
+            keys: Hashes a copiar (los que no estan en el almacen se omiten)
+
+        Returns:
+            Textos copiados
+        """
+        with self._lock:
+            self._refresh()
+            locations = sorted(self._index[key] for key in set(keys) if key in self._index)
+            target = ChunkStore(directory)
+            try:
+                target.put_many(self._block(offset, length)[start:end].decode("utf-8")
+                                for offset, length, start, end in locations)
+            finally:
+                target.close()
+            return len(locations)
+
+    def compact(self, keep: Iterable[str]) -> Dict:
+        """
+        Reescribe el almacen con solo los textos de keep. Como reset(), crea
+        archivos nuevos en vez de modificar los actuales.
+
+        Args:
+            keep: Hashes que todavia usa alguna coleccion
+
+        Returns:
+            Chunks y bytes en disco antes y despues
+        """
+        with self._lock, write_lock(self.directory):
+            self._refresh()
+            before = {"chunks": len(self._index), "bytes": os.path.getsize(self.data_path)}
+            # Dentro de la carpeta: mismo sistema de archivos para os.replace
+            staging = os.path.join(self.directory, f"compact.{os.getpid()}.tmp")
+            shutil.rmtree(staging, ignore_errors=True)
+            try:
+                self.copy_to(staging, keep)
+                for name in (DATA_FILE, INDEX_FILE):
+                    os.replace(os.path.join(staging, name), os.path.join(self.directory, name))
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            self.close()
+            self._open()
+            return {"chunks_before": before["chunks"], "bytes_before": before["bytes"],
+                    "chunks_after": len(self._index), "bytes_after": os.path.getsize(self.data_path)}
+
+    def reset(self):
+        """
+        Vacia el almacen. Se crean archivos nuevos en vez de truncar los
+        actuales: otros procesos pueden tenerlos mapeados en memoria.
+        """
+        with self._lock, write_lock(self.directory):
+            for path in (self.data_path, self.index_path):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                open(tmp_path, "wb").close()
+                os.replace(tmp_path, path)
+            self.close()
+            self._open()
+
+    def stats(self) -> Dict:
+        """Numero de chunks y bytes de texto frente a bytes en disco."""
+        with self._lock:
+            self._refresh()
+            raw = sum(end - start for _, _, start, end in self._index.values())
+            return {
+                "chunks": len(self._index),
+                "raw_bytes": raw,
+                "stored_bytes": os.path.getsize(self.data_path),
+                "codec": "zstd" if zstandard is not None else "zlib",
+            }
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._blocks.clear()
+
+
+def default_store_dir(persist_directory: str) -> str:
+    return CHUNK_STORE_DIR or os.path.join(persist_directory, "chunk_store")
+
+
+if __name__ == "__main__":
+    import sys
+
+    store = ChunkStore(sys.argv[1] if len(sys.argv) > 1 else default_store_dir("./chroma_db"))
+    info = store.stats()
+    ratio = info["raw_bytes"] / info["stored_bytes"] if info["stored_bytes"] else 0
+    print(f"{info['chunks']} chunks, {info['raw_bytes'] / 1e6:.2f} MB de texto, "
+          f"{info['stored_bytes'] / 1e6:.2f} MB en disco ({info['codec']}, {ratio:.1f}x)")
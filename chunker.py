@@ -0,0 +1,449 @@
+"""
+Segmentacion estructural de guias, certamenes y soluciones.
+
+Detecta enunciados de problemas, sub-items (a, b, c), ecuaciones y bloques
+de solucion en el texto ya limpio de un .tex o un PDF, y genera chunks
+enlazados: un chunk padre con el problema completo y chunks hijo
+(enunciado, cada item, cada bloque de solucion) que apuntan a el con
+parent_id. La recuperacion busca sobre ambos y colapsa los hijos en su
+padre, asi el LLM recibe un problema completo en vez de tres pedazos de
+pagina sueltos.
+"""
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from tracing import span
+
+# Tamanio maximo de un chunk hijo o de seccion (caracteres)
+MAX_CHILD_CHARS = 1500
+# Ventanas medidas en tokens: el modelo de embeddings (all-MiniLM-L6-v2)
+# trunca la entrada en 256 tokens, lo que pase de ahi no se indexa
+MAX_CHILD_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Un padre mas largo que esto no reemplaza al hijo en la recuperacion
+MAX_PARENT_CHARS = 4000
+
+# Encabezados (sobre lineas ya sin espacios al inicio)
+_HEADING_PREFIX = r"(?:#{1,4}\s*|\*\*\s*)?"
+_PROBLEM_RE = re.compile(
+    _HEADING_PREFIX + r"(?:pauta\s+(?:de\s+la\s+)?)?(?:problema|pregunta|ejercicio)\s*(?:n[°ºo]\.?\s*)?(\d+(?:\.\d+)?)\b"
+    r"|" + _HEADING_PREFIX + r"P(\d+)\s*[.):\-]",
+    re.IGNORECASE,
+)
+# Item de primer nivel de un certamen: "- (20 puntos) Tres cargas..."
+_EXAM_ITEM_RE = re.compile(r"-\s*\(\d+\s*(?:puntos|pts|ptos)\.?\)", re.IGNORECASE)
+_STATEMENT_RE = re.compile(_HEADING_PREFIX + r"enunciado\b", re.IGNORECASE)
+_SOLUTION_RE = re.compile(_HEADING_PREFIX + r"(?:soluci[oó]n|desarrollo|resoluci[oó]n|respuesta)s?\b", re.IGNORECASE)
+_PART_RE = re.compile(
+    _HEADING_PREFIX + r"(?:(?:[Pp]arte|[Ii]tem|[Ii]nciso)\s*\(?([a-z]|\d+)\)?(?![a-z])"
+    r"|\(([a-h])\)(?:\*\*)?(?=[\s:]|$)"
+    r"|([a-h])\)(?=\s|$))"
+    r"|-\s*\(?([a-h])\)\s*:?"
+)
+_PAGE_RE = re.compile(r"-{3}\s*(?:Pagina\s+(\d+)\s*-{3}|NUEVA PAGINA\s*-{3})$")
+# Superconjunto barato de los patrones anteriores: las lineas que no lo
+# cumplen (casi todas) se agregan al bloque actual sin probar los demas
+_STRUCTURE_HINT_RE = re.compile(
+    r"-|" + _HEADING_PREFIX + r"(?:pauta|problema|pregunta|ejercicio|p\d|soluci|desarrollo|resoluci|respuesta"
+    r"|enunciado|parte|item|inciso|\(|[a-h]\))",
+    re.IGNORECASE,
+)
+_EQUATION_PREFIXES = ("ECUACION:", "MATH:")
+
+# Aproximacion de tokens: palabras y simbolos ASCII sueltos, contados sobre
+# los bytes con translate (en C) en vez de un regex por token
+_SYMBOLS = b"".join(bytes([c]) for c in range(33, 127) if not chr(c).isalnum() and chr(c) != "_")
+_SYMBOLS_TO_SPACE = bytes.maketrans(_SYMBOLS, b" " * len(_SYMBOLS))
+_NOT_SYMBOLS = bytes(c for c in range(256) if c not in _SYMBOLS)
+
+
+def count_tokens(text: str) -> int:
+    """Numero aproximado de tokens del modelo de embeddings."""
+    raw = text.encode("utf-8")
+    return len(raw.translate(_SYMBOLS_TO_SPACE).split()) + len(raw.translate(None, _NOT_SYMBOLS))
+
+
+class _Block:
+    """Trozo contiguo de un problema: enunciado, item o solucion."""
+
+    def __init__(self, block_type: str, label: str = "", page: Optional[int] = None):
+        self.block_type = block_type
+        self.label = label
+        self.page = page
+        self.lines: List[str] = []
+
+    def text(self) -> str:
+        return "\n".join(self.lines).strip()
+
+
+class _Problem:
+    def __init__(self, label: str, heading: str, page: Optional[int]):
+        self.label = label
+        self.heading = heading
+        self.page = page
+        self.blocks = [_Block("statement", "", page)]
+
+    def text(self) -> str:
+        parts = [self.heading] + [b.text() for b in self.blocks]
+        return "\n\n".join(p for p in parts if p)
+
+
+def _problem_label(match: "re.Match") -> str:
+    return match.group(1) or match.group(2)
+
+
+def _part_label(match: "re.Match") -> str:
+    return next(g for g in match.groups() if g).lower()
+
+
+def _segment(lines: Iterable[str], list_items: bool = False):
+    """
+    Recorre el texto linea a linea y lo separa en secciones sueltas (texto
+    antes o fuera de un problema) y problemas con sus bloques.
+
+    Con list_items=True (guias sin encabezados "Problema N") cada item de
+    primer nivel de una lista es un problema y sus items anidados son partes.
+    """
+    sections: List[_Block] = [_Block("section")]
+    problems: List[_Problem] = []
+    by_label: Dict[str, _Problem] = {}
+    current: Optional[_Problem] = None
+    block = sections[0]
+    in_solution = False
+    page: Optional[int] = None
+    title: Optional[str] = None
+
+    for raw_line in lines:
+        line = raw_line.strip()
+        if not _STRUCTURE_HINT_RE.match(line) and not (list_items and raw_line.startswith(("- ", "  - "))):
+            block.lines.append(raw_line.rstrip())
+            continue
+
+        page_match = _PAGE_RE.match(line)
+        if page_match:
+            if page_match.group(1):
+                page = int(page_match.group(1))
+                if block.page is None:
+                    block.page = page
+            if block.lines and block.lines[-1]:
+                block.lines.append("")
+            continue
+
+        problem_match = _PROBLEM_RE.match(line)
+        solution_match = _SOLUTION_RE.match(line)
+        heading = line
+        if not problem_match and not solution_match:
+            if _EXAM_ITEM_RE.match(line) or (list_items and raw_line.startswith("- ")):
+                problem_match = True
+                if list_items:
+                    heading = f"Problema {len(problems) + 1}"
+            elif current is None and _STATEMENT_RE.match(line):
+                # Solucion de un solo problema: "Enunciado" abre el problema y
+                # el titulo del documento ("Solucion: Anillo Cargado") hace de encabezado
+                problem_match = True
+                heading = title or line
+
+        if problem_match and not solution_match:
+            label = _problem_label(problem_match) if problem_match is not True else str(len(problems) + 1)
+            current = _Problem(label, heading, page)
+            if heading is not line:
+                current.blocks[0].lines.append(line)
+            problems.append(current)
+            by_label.setdefault(label, current)
+            block = current.blocks[0]
+            in_solution = False
+            continue
+
+        if solution_match:
+            # "Desarrollo -- Problema 2" enlaza la solucion con su enunciado
+            referenced = _PROBLEM_RE.search(line)
+            if referenced and _problem_label(referenced) in by_label:
+                current = by_label[_problem_label(referenced)]
+            if current is None:
+                # Titulo del documento ("Solucion: Ley de Gauss"), no un bloque
+                title = title or line
+                block.lines.append(line)
+                continue
+            in_solution = True
+            block = _Block("solution", "", page)
+            block.lines.append(line)
+            current.blocks.append(block)
+            continue
+
+        part_match = _PART_RE.match(line) if current is not None else None
+        nested_item = list_items and current is not None and raw_line.startswith("  - ")
+        if part_match or nested_item:
+            if part_match:
+                label = _part_label(part_match)
+            else:
+                label = "abcdefghijklmnopqrstuvwxyz"[min(sum(b.block_type == "part" for b in current.blocks), 25)]
+            block = _Block("solution" if in_solution else "part", label, page)
+            current.blocks.append(block)
+
+        # Se conserva la sangria (jerarquia de items anidados)
+        block.lines.append(raw_line.rstrip())
+
+    return sections, problems
+
+
+def _split_long(piece: str, max_tokens: int, max_chars: int) -> Iterator[tuple]:
+    """Corta en espacios un parrafo o linea que no cabe en una ventana."""
+    pos, n = 0, len(piece)
+    # Largo de ventana estimado con la densidad de tokens de la pieza
+    step = min(max_chars, max(len(piece) * max_tokens // max(count_tokens(piece), 1), 1))
+    while pos < n:
+        size = step
+        while True:
+            end = n if n - pos <= size else _space_before(piece, pos, pos + size)
+            window = piece[pos:end].strip()
+            tokens = count_tokens(window)
+            if tokens <= max_tokens or end - pos <= 1:
+                break
+            # Tramo mas denso que el promedio: achicar en proporcion
+            size = max((end - pos) * max_tokens // tokens, 1)
+        if window:
+            yield window, tokens
+        pos = end
+
+
+def _space_before(piece: str, start: int, end: int) -> int:
+    """Ultimo espacio o salto de linea en (start, end); end si no hay."""
+    cut = max(piece.rfind(" ", start + 1, end), piece.rfind("\n", start + 1, end))
+    return cut if cut > start else end
+
+
+def _windows(text: str, max_tokens: int = MAX_CHILD_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS,
+             max_chars: int = MAX_CHILD_CHARS) -> List[str]:
+    """
+    Divide un bloque largo en ventanas de hasta max_tokens (y max_chars)
+    cortando en parrafos, luego en lineas y, en ultimo caso, en palabras.
+    Una ecuacion no se separa del texto que la precede. Cada ventana
+    repite los ultimos parrafos de la anterior hasta sumar overlap tokens.
+    """
+    if not text:
+        return []
+    if len(text) <= max_chars and count_tokens(text) <= max_tokens:
+        return [text]
+
+    # Una ecuacion queda en la misma pieza que el texto que la introduce
+    glued: List[List[str]] = []
+    for paragraph in text.split("\n\n"):
+        for piece in ([paragraph] if len(paragraph) <= max_chars else paragraph.split("\n")):
+            if glued and piece.lstrip().startswith(_EQUATION_PREFIXES):
+                glued[-1].append(piece)
+            else:
+                glued.append([piece])
+
+    sized: List[tuple] = []
+    for group in glued:
+        piece = "\n".join(group)
+        tokens = count_tokens(piece) if len(piece) <= max_chars else max_tokens + 1
+        if tokens > max_tokens:
+            sized.extend(_split_long(piece, max_tokens, max_chars))
+        elif piece.strip():
+            sized.append((piece, tokens))
+
+    windows: List[str] = []
+    current: List[tuple] = []
+    tokens = size = 0
+    for piece, piece_tokens in sized:
+        if current and (tokens + piece_tokens > max_tokens or size + len(piece) > max_chars):
+            windows.append("\n\n".join(p for p, _ in current).strip())
+            # Solapamiento: arrastrar las ultimas piezas que quepan en overlap tokens
+            carry: List[tuple] = []
+            carried = 0
+            for previous in reversed(current):
+                if carried + previous[1] > overlap:
+                    break
+                carry.append(previous)
+                carried += previous[1]
+            carry.reverse()
+            current, tokens, size = carry, carried, sum(len(p) + 2 for p, _ in carry)
+            if current and (tokens + piece_tokens > max_tokens or size + len(piece) > max_chars):
+                current, tokens, size = [], 0, 0
+        current.append((piece, piece_tokens))
+        tokens += piece_tokens
+        size += len(piece) + 2
+    if current:
+        windows.append("\n\n".join(p for p, _ in current).strip())
+    return [w for w in windows if w]
+
+
+def _pack_blocks(blocks: List[_Block], max_tokens: int, max_chars: int) -> Iterator[tuple]:
+    """
+    Junta bloques cortos consecutivos del mismo tipo (p. ej. los items a, b
+    y c de un enunciado) mientras quepan en una ventana, para no generar un
+    hijo casi vacio por item.
+
+    Yields:
+        (block_type, part_label, page, texto); part_label une las etiquetas ("a,b")
+    """
+    pending = None
+    for block in blocks:
+        body = block.text()
+        if not body:
+            continue
+        tokens = count_tokens(body) if len(body) <= max_chars else max_tokens + 1
+        if (pending and pending[0] == block.block_type and pending[4] + tokens <= max_tokens
+                and len(pending[3]) + len(body) + 2 <= max_chars):
+            pending[1].append(block.label)
+            pending[3] += "\n\n" + body
+            pending[4] += tokens
+            continue
+        if pending:
+            yield pending[0], ",".join(label for label in pending[1] if label), pending[2], pending[3]
+        pending = [block.block_type, [block.label], block.page, body, tokens]
+    if pending:
+        yield pending[0], ",".join(label for label in pending[1] if label), pending[2], pending[3]
+
+
+def chunk_document(text: str, source: str, category: str, file_type: str,
+                   max_chars: int = MAX_CHILD_CHARS, max_tokens: int = MAX_CHILD_TOKENS,
+                   overlap: int = CHUNK_OVERLAP_TOKENS) -> List[Dict]:
+    """
+    Divide el texto de un documento segun su estructura de problemas.
+
+    Args:
+        text: Texto limpio (salida de clean_latex o de la extraccion de PDF)
+        source: Nombre del archivo de origen
+        category: Categoria tematica (carpeta de origen)
+        file_type: "tex", "pdf", ...
+        max_chars: Tamanio maximo de cada chunk hijo o de seccion
+        max_tokens: Tokens maximos de cada chunk hijo o de seccion
+        overlap: Tokens que una ventana repite de la anterior
+
+    Returns:
+        Lista de chunks. Cada problema genera un padre (chunk_level "parent",
+        chunk_number "pN") y sus hijos (chunk_level "child", parent_id "pN").
+        Un problema que cabe en una ventana queda solo como padre; uno mas
+        largo que MAX_PARENT_CHARS, solo como hijos sin parent_id. El texto
+        fuera de problemas genera chunks de seccion sin padre.
+    """
+    return chunk_lines(text.split("\n"), source, category, file_type, max_chars, max_tokens, overlap)
+
+
+def chunk_pages(pages: Iterable[Dict], source: str, category: str, file_type: str,
+                max_chars: int = MAX_CHILD_CHARS, max_tokens: int = MAX_CHILD_TOKENS,
+                overlap: int = CHUNK_OVERLAP_TOKENS) -> List[Dict]:
+    """
+    Igual que chunk_document, pero a partir de registros por pagina
+    ({"page": n, "text": ...}, ver pdf_processor.iter_pdf_pages). El texto
+    se consume linea a linea, sin armar el documento completo en un string.
+    """
+    def lines() -> Iterator[str]:
+        for record in pages:
+            yield f"--- Pagina {record['page']} ---"
+            yield from record["text"].split("\n")
+
+    return chunk_lines(lines(), source, category, file_type, max_chars, max_tokens, overlap)
+
+
+def chunk_lines(lines: Iterable[str], source: str, category: str, file_type: str,
+                max_chars: int = MAX_CHILD_CHARS, max_tokens: int = MAX_CHILD_TOKENS,
+                overlap: int = CHUNK_OVERLAP_TOKENS) -> List[Dict]:
+    """Igual que chunk_document, a partir de un iterable de lineas (p. ej. un generador)."""
+    # Con un generador de paginas, el span incluye tambien la lectura del PDF
+    with span("chunk", file=source, file_type=file_type) as trace:
+        chunks = _chunk_lines(lines, source, category, file_type, max_chars, max_tokens, overlap)
+        trace.set(chunks=len(chunks))
+    return chunks
+
+
+def _chunk_lines(lines: Iterable[str], source: str, category: str, file_type: str,
+                 max_chars: int, max_tokens: int, overlap: int) -> List[Dict]:
+    sections, problems = _segment(lines)
+    if not problems:
+        # Sin encabezados todo quedo en la seccion inicial: re-segmentar sus
+        # lineas con los items de lista como problemas
+        sections, problems = _segment(sections[0].lines, list_items=True)
+    chunks: List[Dict] = []
+
+    def add(content: str, chunk_number: str, page: Optional[int], **structure):
+        chunk = {
+            "source": source,
+            "category": category,
+            "chunk_number": chunk_number,
+            "content": content,
+            "file_type": file_type,
+        }
+        chunk.update(structure)
+        if page is not None:
+            chunk["page"] = page
+        chunks.append(chunk)
+
+    section_text = sections[0].text()
+    for k, window in enumerate(_windows(section_text, max_tokens, overlap, max_chars)):
+        add(window, f"s{k}", sections[0].page, chunk_level="section", block_type="section")
+
+    for n, problem in enumerate(problems):
+        parent_id = f"p{n}"
+        text = problem.text()
+        if len(text) <= max_chars and count_tokens(text) <= max_tokens:
+            # Cabe en una ventana: los hijos solo repetirian al padre
+            add(text, parent_id, problem.page,
+                chunk_level="parent", block_type="problem", problem_label=problem.label)
+            continue
+
+        # Un padre mas largo que MAX_PARENT_CHARS nunca reemplaza a sus hijos y
+        # su embedding solo ve el comienzo: en ese caso se indexan solo los hijos
+        link = {}
+        if len(text) <= MAX_PARENT_CHARS:
+            add(text, parent_id, problem.page,
+                chunk_level="parent", block_type="problem", problem_label=problem.label)
+            link["parent_id"] = parent_id
+
+        # Cada hijo repite el encabezado del problema para que su embedding tenga contexto
+        child_tokens = max(max_tokens - count_tokens(problem.heading), 32)
+        child_chars = max_chars - len(problem.heading) - 2
+        child = 0
+        for block_type, labels, page, body in _pack_blocks(problem.blocks, child_tokens, child_chars):
+            for window in _windows(body, child_tokens, overlap, child_chars):
+                add(f"{problem.heading}\n\n{window}".strip(), f"{parent_id}.{child}", page,
+                    chunk_level="child", block_type=block_type,
+                    problem_label=problem.label, part_label=labels, **link)
+                child += 1
+
+    return chunks
+
+
+def collapse_to_parents(docs: List[Dict], parents: Dict[tuple, Dict], n_results: int) -> List[Dict]:
+    """
+    Reemplaza cada hijo por su problema completo y elimina repetidos.
+
+    Args:
+        docs: Documentos recuperados, ordenados por relevancia
+        parents: Padres disponibles indexados por (category, source, chunk_number)
+        n_results: Numero de documentos a retornar
+
+    Returns:
+        Hasta n_results documentos, uno por problema
+    """
+    collapsed: List[Dict] = []
+    seen = set()
+    for doc in docs:
+        metadata = doc.get("metadata") or {}
+        # El mismo nombre de archivo puede existir en dos categorias
+        origin = (metadata.get("category"), metadata.get("source"))
+        parent_id = metadata.get("parent_id")
+        if metadata.get("chunk_level") == "parent":
+            parent_id = metadata.get("chunk_number")
+            parent = doc
+        else:
+            parent = parents.get((*origin, parent_id)) if parent_id else None
+
+        if parent is not None and len(parent["content"]) <= MAX_PARENT_CHARS:
+            key = (*origin, parent_id)
+            if parent is not doc:
+                doc = dict(doc, content=parent["content"],
+                           metadata=dict(parent["metadata"], matched_chunk=metadata.get("chunk_number")))
+        else:
+            # Sin padre o demasiado largo: el hijo se devuelve tal cual
+            key = (*origin, metadata.get("chunk_number"), doc.get("content", "")[:64])
+        if key in seen:
+            continue
+        seen.add(key)
+        collapsed.append(doc)
+        if len(collapsed) >= n_results:
+            break
+    return collapsed
@@ -0,0 +1,401 @@
+"""
+Indice vectorial compacto (int8) como alternativa al HNSW de ChromaDB.
+
+ChromaDB mantiene en RAM los vectores float32 de la coleccion mas el grafo
+HNSW. Con VECTOR_INDEX=int8 las consultas se resuelven aqui:
+
+    1. Cada vector se cuantiza a int8 por dimension (escala = max|x| / 127),
+       4 veces menos memoria que float32 y sin grafo.
+    2. Se recorre la matriz int8 completa (por bloques de filas) con la
+       distancia L2 aproximada y se toman los RESCORE_FACTOR * k mejores.
+    3. Esos candidatos se re-puntuan con la distancia L2 exacta leyendo los
+       vectores float32 desde disco (mmap: solo se tocan sus paginas).
+
+ChromaDB sigue guardando vectores, ids y metadata; este indice es una copia
+derivada que se reconstruye al indexar el corpus (o con
+"python compact_index.py build") y crece con add_chunks. Las distancias son
+L2 al cuadrado, igual que las de ChromaDB.
+
+Con VECTOR_INDEX=auto se construye solo si el HNSW estimado supera
+INDEX_MEMORY_BUDGET_MB. Si la propia matriz int8 tampoco cabe en el
+presupuesto, se lee con mmap en vez de cargarla.
+
+Formato en disco (dentro de COMPACT_INDEX_DIR):
+    codes.i8     Matriz n x dim de int8
+    vectors.f32  Matriz n x dim de float32 (re-puntuacion exacta)
+    norms.f32    ||x||^2 de cada vector
+    index.json   dim, escala por dimension, ids y categoria de cada fila
+"""
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+from write_lock import file_lock
+
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "hnsw")  # "hnsw", "int8" o "auto"
+# Memoria para el indice vectorial (0 = sin limite)
+INDEX_MEMORY_BUDGET_MB = float(os.getenv("INDEX_MEMORY_BUDGET_MB", "0"))
+# Candidatos por resultado que se re-puntuan con los vectores exactos
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "10"))
+MIN_CANDIDATES = 50
+# Por defecto dentro de la carpeta de ChromaDB, como chunk_store
+COMPACT_INDEX_DIR = os.getenv("COMPACT_INDEX_DIR")
+
+CODES_FILE = "codes.i8"
+VECTORS_FILE = "vectors.f32"
+NORMS_FILE = "norms.f32"
+META_FILE = "index.json"
+# Filas por bloque al recorrer la matriz int8 (acota la memoria temporal)
+SCAN_ROWS = 16384
+# Filas por pagina al leer los embeddings de ChromaDB
+FETCH_ROWS = 5000
+
+# Parametros por defecto del HNSW de ChromaDB (para estimar su memoria)
+HNSW_M = 16
+
+
+def hnsw_bytes(count: int, dim: int) -> int:
+    """Memoria aproximada del HNSW de ChromaDB: vectores float32 + enlaces de la capa 0 + ids."""
+    return count * (dim * 4 + 2 * HNSW_M * 4 + 64)
+
+
+def int8_bytes(count: int, dim: int) -> int:
+    """Memoria residente del indice int8: codigos + normas (los float32 quedan en disco)."""
+    return count * (dim + 4)
+
+
+def wants_compact(count: int, dim: int) -> bool:
+    """Si con la configuracion actual corresponde construir el indice compacto."""
+    if VECTOR_INDEX == "int8":
+        return True
+    if VECTOR_INDEX == "auto":
+        return INDEX_MEMORY_BUDGET_MB > 0 and hnsw_bytes(count, dim) > INDEX_MEMORY_BUDGET_MB * 1e6
+    if VECTOR_INDEX != "hnsw":
+        print(f"Advertencia: VECTOR_INDEX desconocido '{VECTOR_INDEX}', se usa hnsw")
+    return False
+
+
+def default_index_dir(persist_directory: str, collection_name: Optional[str] = None) -> str:
+    """
+    Carpeta del indice de una coleccion. La coleccion original usa
+    compact_index/; las creadas por un reindexado (ver
+    rag_system.clear_and_reindex) tienen la suya, para no pisar el indice
+    que esta sirviendo mientras se construye la nueva.
+    """
+    base = COMPACT_INDEX_DIR or os.path.join(persist_directory, "compact_index")
+    return f"{base}.{collection_name}" if collection_name else base
+
+
+class CompactIndex:
+    """Busqueda exhaustiva sobre vectores int8 con re-puntuacion exacta."""
+
+    def __init__(self, directory: str, memory_budget_mb: float = INDEX_MEMORY_BUDGET_MB):
+        """
+        Args:
+            directory: Carpeta del indice
+            memory_budget_mb: Si los codigos int8 no caben, se leen con mmap (0 = sin limite)
+        """
+        self.directory = directory
+        self.memory_budget_mb = memory_budget_mb
+        self._lock = threading.RLock()
+        self._version = None
+        self.count = 0
+        self.dim = 0
+        self.ids: List[str] = []
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write_lock(self):
+        # Junto a la carpeta y no dentro: build la reemplaza completa
+        return file_lock(f"{self.directory.rstrip(os.sep)}.lock")
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path(META_FILE))
+
+    def _load(self):
+        """Carga (o recarga, si otro proceso lo reconstruyo o amplio) el indice."""
+        import numpy as np
+
+        # index.json siempre se reemplaza completo: un inodo nuevo indica cambios
+        stat = os.stat(self._path(META_FILE))
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._version:
+            return
+        with open(self._path(META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        count, dim = meta["count"], meta["dim"]
+
+        codes = np.memmap(self._path(CODES_FILE), dtype=np.int8, mode="r", shape=(count, dim)) \
+            if count else np.empty((0, dim), dtype=np.int8)
+        if not self.memory_budget_mb or int8_bytes(count, dim) <= self.memory_budget_mb * 1e6:
+            codes = np.array(codes)
+        self.codes = codes
+        self.vectors = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, dim)) \
+            if count else np.empty((0, dim), dtype=np.float32)
+        self.norms = np.fromfile(self._path(NORMS_FILE), dtype=np.float32, count=count)
+        self.scale = np.array(meta["scale"], dtype=np.float32)
+        self.ids = meta["ids"]
+        self.category_names = meta["category_names"]
+        self.categories = np.array(meta["categories"], dtype=np.int32)
+        self.count, self.dim = count, dim
+        self._version = version
+
+    def open(self) -> bool:
+        """Carga el indice si existe. Returns: True si quedo listo para consultas."""
+        with self._lock:
+            if not self.exists():
+                return False
+            self._load()
+            return True
+
+    def _write(self, directory: str, embeddings, scale, mode: str):
+        import numpy as np
+
+        with open(os.path.join(directory, CODES_FILE), mode) as f:
+            f.write(_quantize(embeddings, scale).tobytes())
+        with open(os.path.join(directory, VECTORS_FILE), mode) as f:
+            f.write(embeddings.tobytes())
+        with open(os.path.join(directory, NORMS_FILE), mode) as f:
+            f.write(np.einsum("ij,ij->i", embeddings, embeddings).astype(np.float32).tobytes())
+
+    @staticmethod
+    def _write_meta(directory: str, meta: Dict):
+        # index.json se escribe al final y se reemplaza de forma atomica:
+        # los lectores solo ven filas cuyos datos ya estan completos
+        path = os.path.join(directory, META_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    def build(self, collection) -> int:
+        """
+        Reconstruye el indice desde los embeddings guardados en ChromaDB.
+        Se escribe en una carpeta temporal que luego reemplaza a la actual.
+
+        Args:
+            collection: Coleccion de ChromaDB
+
+        Returns:
+            Numero de vectores indexados
+        """
+        import numpy as np
+
+        ids, categories, parts = [], [], []
+        offset = 0
+        while True:
+            page = collection.get(include=["embeddings", "metadatas"], limit=FETCH_ROWS, offset=offset)
+            if not len(page["ids"]):
+                break
+            ids.extend(page["ids"])
+            categories.extend((m or {}).get("category", "") for m in page["metadatas"])
+            parts.append(np.asarray(page["embeddings"], dtype=np.float32))
+            offset += len(page["ids"])
+        embeddings = np.concatenate(parts) if parts else np.empty((0, 0), dtype=np.float32)
+        return self.build_from(ids, embeddings, categories)
+
+    def build_from(self, ids: List[str], embeddings, categories: List[str]) -> int:
+        """Reconstruye el indice desde vectores en memoria (ver build)."""
+        import numpy as np
+
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with self._lock, self._write_lock():
+            tmp_directory = f"{self.directory.rstrip(os.sep)}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            os.makedirs(tmp_directory)
+            scale = _scale(embeddings)
+            self._write(tmp_directory, embeddings, scale, "wb")
+            names = sorted(set(categories))
+            position = {name: i for i, name in enumerate(names)}
+            self._write_meta(tmp_directory, {
+                "count": len(ids), "dim": int(embeddings.shape[1]), "scale": scale.tolist(), "ids": list(ids),
+                "category_names": names, "categories": [position[c] for c in categories],
+            })
+
+            # Los procesos que tengan mapeados los archivos anteriores siguen leyendolos
+            old_directory = f"{self.directory.rstrip(os.sep)}.{os.getpid()}.old"
+            if os.path.exists(self.directory):
+                os.replace(self.directory, old_directory)
+            os.replace(tmp_directory, self.directory)
+            shutil.rmtree(old_directory, ignore_errors=True)
+            self._version = None
+            self._load()
+        return len(ids)
+
+    def append(self, ids: List[str], embeddings, categories: List[str]):
+        """
+        Agrega vectores al final (la escala se mantiene; los valores fuera de
+        rango se saturan y la re-puntuacion exacta corrige el orden).
+        """
+        import numpy as np
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(ids):
+            return
+        with self._lock, self._write_lock():
+            self._version = None
+            self._load()
+            if embeddings.shape[1] != self.dim:
+                raise ValueError(f"Dimension {embeddings.shape[1]} distinta a la del indice ({self.dim})")
+            self._write(self.directory, embeddings, self.scale, "ab")
+            names = list(self.category_names)
+            names.extend(c for c in dict.fromkeys(categories) if c not in names)
+            position = {name: i for i, name in enumerate(names)}
+            self._write_meta(self.directory, {
+                "count": self.count + len(ids), "dim": self.dim, "scale": self.scale.tolist(),
+                "ids": self.ids + list(ids), "category_names": names,
+                "categories": self.categories.tolist() + [position[c] for c in categories],
+            })
+            self._load()
+
+    def search(self, query_embeddings, n_results: int, category: Optional[str] = None):
+        """
+        Vecinos mas cercanos de cada consulta.
+
+        Args:
+            query_embeddings: Matriz m x dim (o lista de listas)
+            n_results: Resultados por consulta
+            category: Restringe la busqueda a una categoria (opcional)
+
+        Returns:
+            (indices, distancias): listas por consulta, de menor a mayor distancia
+        """
+        import numpy as np
+
+        with self._lock:
+            self._load()
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+            if self.count == 0 or n_results <= 0:
+                return [[] for _ in queries], [[] for _ in queries]
+
+            allowed = None
+            if category is not None:
+                if category not in self.category_names:
+                    return [[] for _ in queries], [[] for _ in queries]
+                allowed = self.categories == self.category_names.index(category)
+            candidates = min(max(n_results * RESCORE_FACTOR, MIN_CANDIDATES), self.count)
+
+            # ||x - q||^2 ~ ||x||^2 - 2 (codigo * escala) . q + ||q||^2; el ultimo termino
+            # no cambia el orden y se suma solo en la re-puntuacion exacta
+            scaled = (queries * self.scale).T
+            best_rows = np.empty((len(queries), 0), dtype=np.int64)
+            best_scores = np.empty((len(queries), 0), dtype=np.float32)
+            for start in range(0, self.count, SCAN_ROWS):
+                block = np.asarray(self.codes[start:start + SCAN_ROWS], dtype=np.float32)
+                scores = self.norms[start:start + len(block)] - 2 * (block @ scaled).T
+                if allowed is not None:
+                    scores[:, ~allowed[start:start + len(block)]] = np.inf
+                rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+                scores = np.concatenate([best_scores, scores], axis=1)
+                rows = np.concatenate([best_rows, rows], axis=1)
+                if scores.shape[1] > candidates:
+                    keep = np.argpartition(scores, candidates - 1, axis=1)[:, :candidates]
+                    scores = np.take_along_axis(scores, keep, axis=1)
+                    rows = np.take_along_axis(rows, keep, axis=1)
+                best_scores, best_rows = scores, rows
+
+            indices, distances = [], []
+            for query, rows, scores in zip(queries, best_rows, best_scores):
+                rows = np.sort(rows[np.isfinite(scores)])
+                exact = ((np.asarray(self.vectors[rows]) - query) ** 2).sum(axis=1)
+                order = np.argsort(exact, kind="stable")[:n_results]
+                indices.append(rows[order].tolist())
+                distances.append(exact[order].tolist())
+            return indices, distances
+
+    def query(self, collection, query_embeddings, n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[List[str]] = None) -> Dict:
+        """
+        Misma forma de respuesta que collection.query de ChromaDB. La metadata
+        (y el texto, si se pide) se trae con un solo collection.get.
+
+        Args:
+            collection: Coleccion de ChromaDB con la metadata
+            query_embeddings: Embeddings de las consultas
+            n_results: Resultados por consulta
+            where: None o {"category": ...}
+            include: Campos a devolver ("metadatas", "documents", "distances")
+        """
+        include = include or ["metadatas", "documents", "distances"]
+        category = (where or {}).get("category")
+        indices, distances = self.search(query_embeddings, n_results, category)
+        result_ids = [[self.ids[i] for i in rows] for rows in indices]
+        results = {"ids": result_ids}
+        if "distances" in include:
+            results["distances"] = distances
+
+        fields = [field for field in include if field in ("metadatas", "documents")]
+        wanted = list(dict.fromkeys(doc_id for ids in result_ids for doc_id in ids))
+        if fields and wanted:
+            found = collection.get(ids=wanted, include=fields)
+            for field in fields:
+                by_id = dict(zip(found["ids"], found.get(field) or []))
+                results[field] = [[by_id.get(doc_id) for doc_id in ids] for ids in result_ids]
+        return results
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Memoria residente del indice frente a la estimada para el HNSW."""
+        with self._lock:
+            self._load()
+            resident = self.norms.nbytes + (0 if hasattr(self.codes, "filename") else self.codes.nbytes)
+            return {"count": self.count, "dim": self.dim, "resident": resident,
+                    "hnsw": hnsw_bytes(self.count, self.dim)}
+
+
+def _scale(embeddings):
+    import numpy as np
+
+    if not len(embeddings):
+        return np.ones(embeddings.shape[1] if embeddings.ndim == 2 else 0, dtype=np.float32)
+    peak = np.abs(embeddings).max(axis=0)
+    return (np.where(peak > 0, peak, 1.0) / 127).astype(np.float32)
+
+
+def _quantize(embeddings, scale):
+    import numpy as np
+
+    return np.clip(np.rint(embeddings / scale), -127, 127).astype(np.int8)
+
+
+def open_compact_index(directory: str, collection) -> Optional[CompactIndex]:
+    """
+    Indice compacto para las consultas, o None para usar el HNSW de ChromaDB
+    (VECTOR_INDEX=hnsw, indice aun no construido o desactualizado).
+
+    Args:
+        directory: Carpeta del indice de la coleccion (rag_system.compact_index_dir)
+        collection: Coleccion de ChromaDB con la que debe coincidir
+    """
+    if VECTOR_INDEX == "hnsw":
+        return None
+    index = CompactIndex(directory)
+    if not index.open():
+        if VECTOR_INDEX == "int8":
+            print("Advertencia: no hay indice int8; reindexar o ejecutar python compact_index.py build")
+        return None
+    count = collection.count()
+    if index.count != count:
+        print(f"Advertencia: el indice int8 tiene {index.count} vectores y ChromaDB {count}; "
+              "se usa HNSW hasta reconstruirlo (python compact_index.py build)")
+        return None
+    return index
+
+
+if __name__ == "__main__":
+    import sys
+
+    from rag_system import active_collection_name, compact_index_dir, open_collection
+
+    persist_directory = sys.argv[2] if len(sys.argv) > 2 else "./chroma_db"
+    index = CompactIndex(compact_index_dir(persist_directory, active_collection_name(persist_directory)))
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        print(f"Indice int8: {index.build(open_collection(persist_directory))} vectores")
+    elif not index.open():
+        print("Uso: python compact_index.py build [carpeta_chroma_db]")
+        sys.exit(1)
+    info = index.memory_bytes()
+    print(f"{info['count']} vectores de dimension {info['dim']}: {info['resident'] / 1e6:.2f} MB en RAM "
+          f"(HNSW estimado: {info['hnsw'] / 1e6:.2f} MB)")
@@ -0,0 +1,309 @@
+"""
+Vigila corpus/<categoria>/ e indexa los archivos nuevos, modificados o
+borrados en cuanto dejan de cambiar, sin reindexar el resto del corpus.
+
+En Linux usa inotify (via ctypes, sin dependencias): se reciben los
+archivos cerrados tras escribirse, movidos o borrados. En otros sistemas,
+o con --poll, compara cada WATCH_POLL_INTERVAL segundos la fecha y el
+tamanio de los archivos. En ambos casos los cambios se acumulan hasta que
+pasan WATCH_DEBOUNCE segundos sin eventos (una copia de varios PDFs es un
+solo lote) y luego se procesan con ElectromagnetismRAG.sync_files, igual
+que "python -m indexer incremental" pero solo para esos archivos.
+
+Al iniciar se procesan los cambios ocurridos mientras el watcher estaba
+detenido (segun el manifiesto de la ultima indexacion); lo mismo se hace
+si se desborda la cola de eventos de inotify, que los descarta. Un lote que falla
+se informa y sus archivos quedan fuera del manifiesto, asi que el
+siguiente inicio o "indexer incremental" los vuelve a intentar.
+
+Uso:
+    python corpus_watcher.py
+    python corpus_watcher.py --corpus /srv/electroai/corpus --debounce 10
+    python corpus_watcher.py --poll --interval 30
+"""
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from ingest import is_supported, manifest_key
+from rag_system import CATEGORIES, CORPUS_PATH
+
+# Segundos sin eventos antes de procesar un lote de cambios
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "5"))
+# Intervalo entre revisiones sin inotify
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "10"))
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+_EVENT = struct.Struct("iIII")
+_FILE_EVENTS = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+
+class Inotify:
+    """Acceso minimo a inotify de Linux con ctypes."""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 fallo")
+        self._dirs: Dict[int, str] = {}
+
+    def watch(self, directory: str, mask: int):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            import ctypes
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch fallo para {directory}")
+        self._dirs[wd] = directory
+
+    def read(self, timeout: Optional[float]) -> List[Tuple[str, int]]:
+        """
+        Espera eventos hasta timeout segundos (None = sin limite).
+
+        Returns:
+            Pares (ruta, mascara) de los eventos recibidos; un desborde de la
+            cola llega como ("", IN_Q_OVERFLOW)
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, offset = [], 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            directory = self._dirs.get(wd)
+            if mask & IN_Q_OVERFLOW:
+                # wd es -1: el kernel descarto eventos de cualquier carpeta
+                events.append(("", mask))
+            elif directory is not None:
+                events.append((os.path.join(directory, name) if name else directory, mask))
+            if mask & IN_DELETE_SELF:
+                self._dirs.pop(wd, None)
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _snapshot(corpus_path: str) -> Dict[str, Tuple[int, int]]:
+    """{ruta: (mtime_ns, tamanio)} de los archivos soportados de las categorias."""
+    files = {}
+    for category in CATEGORIES:
+        directory = os.path.join(corpus_path, category)
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.startswith(".") and is_supported(entry.name):
+                stat = entry.stat()
+                files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+class CorpusWatcher:
+    """Acumula cambios del corpus y los indexa por lotes."""
+
+    def __init__(self, rag, corpus_path: str = CORPUS_PATH, debounce: float = WATCH_DEBOUNCE,
+                 poll: bool = False, poll_interval: float = WATCH_POLL_INTERVAL, workers: Optional[int] = None):
+        """
+        Args:
+            rag: ElectromagnetismRAG donde se indexa
+            corpus_path: Carpeta raiz del corpus
+            debounce: Segundos sin eventos antes de procesar los cambios
+            poll: Revisar periodicamente en vez de usar inotify
+            poll_interval: Segundos entre revisiones (con poll)
+            workers: Procesos de extraccion (None = INGEST_WORKERS)
+        """
+        self.rag = rag
+        self.corpus_path = os.path.abspath(corpus_path)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self.inotify = None
+        if not poll and sys.platform.startswith("linux"):
+            try:
+                self.inotify = Inotify()
+            except OSError as e:
+                print(f"Advertencia: inotify no disponible ({e}); se revisa cada {poll_interval:g} s")
+        self._pending: Set[str] = set()
+        self._last_event = 0.0
+        # Se perdieron eventos: revisar todo el corpus contra el manifiesto
+        self._overflowed = False
+
+    def _category(self, path: str) -> Optional[str]:
+        directory, name = os.path.split(path)
+        category = os.path.basename(directory)
+        if (os.path.dirname(directory) == self.corpus_path and category in CATEGORIES
+                and not name.startswith(".") and is_supported(name)):
+            return category
+        return None
+
+    def _watch_tree(self):
+        mask = _FILE_EVENTS | IN_DELETE_SELF
+        self.inotify.watch(self.corpus_path, IN_CREATE | IN_MOVED_TO)
+        for category in CATEGORIES:
+            directory = os.path.join(self.corpus_path, category)
+            if os.path.isdir(directory):
+                self.inotify.watch(directory, mask)
+
+    def process(self, paths: Set[str]) -> Optional[Dict[str, int]]:
+        """
+        Indexa los archivos indicados: los que existen y cambiaron de
+        contenido se reemplazan y los que ya no existen se borran.
+
+        Returns:
+            Resultado de sync_files, o None si no habia cambios reales
+        """
+        from ingest import file_digest
+
+        manifest = self.rag.load_manifest()
+        changed, deleted = [], []
+        for path in sorted(paths):
+            category = self._category(path)
+            if category is None:
+                continue
+            key = manifest_key(path, category)
+            if os.path.isfile(path):
+                if manifest.get(key) != file_digest(path):
+                    changed.append((path, category))
+            elif key in manifest:
+                deleted.append(key)
+        if not (changed or deleted):
+            return None
+
+        start = time.perf_counter()
+        names = [f"{category}/{os.path.basename(path)}" for path, category in changed] + deleted
+        print(f"Cambios en el corpus: {', '.join(names)}")
+        result = self.rag.sync_files(changed, deleted, self.corpus_path, workers=self.workers)
+        print(f"  {result['removed']} fragmentos borrados, {result['added']} agregados "
+              f"en {time.perf_counter() - start:.1f} s")
+        return result
+
+    def _flush(self):
+        paths, self._pending = self._pending, set()
+        try:
+            self.process(paths)
+        except Exception as e:
+            print(f"Error indexando {len(paths)} archivos: {e}")
+
+    def catch_up(self):
+        """Procesa los cambios ocurridos mientras el watcher estaba detenido."""
+        changed, deleted = self.rag.corpus_changes(self.corpus_path)
+        paths = {path for path, _ in changed}
+        paths.update(os.path.join(self.corpus_path, key) for key in deleted)
+        if paths:
+            self._pending.update(paths)
+            self._flush()
+
+    def run(self, stop_after: Optional[float] = None):
+        """
+        Bucle principal; termina con Ctrl+C (o tras stop_after segundos).
+        """
+        deadline = time.monotonic() + stop_after if stop_after is not None else None
+        if self.inotify is not None:
+            self._watch_tree()
+            print(f"Vigilando {self.corpus_path} (inotify, lotes tras {self.debounce:g} s sin cambios)")
+        else:
+            snapshot = _snapshot(self.corpus_path)
+            print(f"Vigilando {self.corpus_path} (revision cada {self.poll_interval:g} s)")
+        self.catch_up()
+
+        while deadline is None or time.monotonic() < deadline:
+            now = time.monotonic()
+            waiting = self._pending or self._overflowed
+            if waiting and now - self._last_event >= self.debounce:
+                if self._overflowed:
+                    self._overflowed = False
+                    try:
+                        self.catch_up()
+                    except Exception as e:
+                        print(f"Error revisando el corpus tras el desborde de inotify: {e}")
+                else:
+                    self._flush()
+                continue
+            timeout = self.debounce - (now - self._last_event) if waiting else None
+            if deadline is not None:
+                timeout = max(0.0, min(timeout if timeout is not None else deadline - now, deadline - now))
+
+            if self.inotify is not None:
+                events = self.inotify.read(timeout)
+                for path, mask in events:
+                    if mask & IN_Q_OVERFLOW:
+                        print("Advertencia: se desbordo la cola de inotify; se revisa todo el corpus")
+                        # Una carpeta de categoria creada entre los eventos perdidos no tiene watch
+                        self._watch_tree()
+                        self._overflowed = True
+                        self._last_event = time.monotonic()
+                    elif mask & IN_ISDIR:
+                        # Carpeta de categoria creada despues de iniciar
+                        if os.path.dirname(path) == self.corpus_path and os.path.basename(path) in CATEGORIES:
+                            self.inotify.watch(path, _FILE_EVENTS | IN_DELETE_SELF)
+                            self._pending.update(p for p in _snapshot(self.corpus_path) if p.startswith(path + os.sep))
+                            self._last_event = time.monotonic()
+                    elif self._category(path) is not None:
+                        self._pending.add(path)
+                        self._last_event = time.monotonic()
+            else:
+                time.sleep(min(self.poll_interval, timeout) if timeout is not None else self.poll_interval)
+                current = _snapshot(self.corpus_path)
+                changed = {path for path, stat in current.items() if snapshot.get(path) != stat}
+                changed.update(path for path in snapshot if path not in current)
+                snapshot = current
+                if changed:
+                    self._pending.update(changed)
+                    self._last_event = time.monotonic()
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+
+
+def main() -> int:
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Indexa los cambios del corpus en cuanto ocurren")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE, help="Segundos sin cambios antes de indexar")
+    parser.add_argument("--poll", action="store_true", help="Revisar periodicamente en vez de usar inotify")
+    parser.add_argument("--interval", type=float, default=WATCH_POLL_INTERVAL, help="Segundos entre revisiones (--poll)")
+    parser.add_argument("--workers", type=int, help="Procesos de extraccion (por defecto INGEST_WORKERS)")
+    args = parser.parse_args()
+
+    from rag_system import ElectromagnetismRAG
+
+    rag = ElectromagnetismRAG(args.persist_directory, require_llm=False)
+    watcher = CorpusWatcher(rag, args.corpus, args.debounce, args.poll, args.interval, args.workers)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
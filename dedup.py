@@ -0,0 +1,230 @@
+"""
+Deteccion de chunks casi duplicados con MinHash + LSH.
+
+El corpus tiene varias versiones del mismo material (.tex y .pdf de un
+mismo certamen, pautas v1/v2, formas A/B). Al indexar se agrupan los chunks
+casi iguales, se guarda una sola copia canonica con la lista de sus alias en
+la metadata, y al consultar se colapsan los resultados que igual resulten
+repetidos (p. ej. archivos subidos despues de indexar). Para eso cada chunk
+guarda en la metadata una firma compacta ("minhash", ver signature_key)
+calculada al indexar: la consulta solo compara bytes.
+
+La similitud se mide sobre triples de palabras y numeros del texto, sin los
+nombres de comandos LaTeX (\\frac, \\vec, ...): asi la misma pauta en .tex y
+en .pdf se reconoce aunque las ecuaciones queden escritas distinto, pero dos
+pasos de un desarrollo que solo cambian los datos no se confunden.
+"""
+import os
+import random
+import re
+import unicodedata
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+DEDUP_ENABLED = os.getenv("DEDUP", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+LSH_BANDS = 16  # 16 bandas x 4 filas: candidatos desde ~0.5 de similitud
+# Chunks con menos triples que esto (titulos, items de una linea) no se comparan
+MIN_SHINGLES = 16
+
+# Se prefiere conservar la version con mejor texto
+_FILE_TYPE_RANK = {"tex": 0, "docx": 1, "manual": 2, "pdf": 3, "image": 4}
+
+_LATEX_COMMAND_RE = re.compile(r"\\[a-zA-Z]+")
+_WORD_RE = re.compile(r"[^\W_]+")
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+
+def shingles(text: str) -> Set[int]:
+    """Triples de palabras y numeros normalizados (minusculas, sin tildes), hasheados."""
+    text = _LATEX_COMMAND_RE.sub(" ", text.lower())
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    words = _WORD_RE.findall(text)
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {
+        zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode())
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(shingle_set: Set[int]) -> Tuple[int, ...]:
+    """Firma MinHash de NUM_PERM valores."""
+    if not shingle_set:
+        return ()
+    return tuple(min((a * x + b) % _MERSENNE for x in shingle_set) for a, b in _PERMUTATIONS)
+
+
+def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Estimacion de la similitud de Jaccard entre dos firmas."""
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster_duplicates(signatures: List[Tuple[int, ...]], groups: List[str],
+                       threshold: float = DEDUP_THRESHOLD) -> List[List[int]]:
+    """
+    Agrupa firmas casi iguales con LSH por bandas.
+
+    Args:
+        signatures: Firmas MinHash (tupla vacia = no comparar)
+        groups: Solo se comparan elementos del mismo grupo (p. ej. categoria y nivel del chunk)
+        threshold: Similitud minima para considerar dos elementos duplicados
+
+    Returns:
+        Grupos de indices con dos o mas elementos
+    """
+    rows = NUM_PERM // LSH_BANDS
+    parent = list(range(len(signatures)))
+    buckets: Dict[Tuple, List[int]] = {}
+    for i, signature in enumerate(signatures):
+        if not signature:
+            continue
+        for band in range(LSH_BANDS):
+            key = (groups[i], band, signature[band * rows:(band + 1) * rows])
+            for j in buckets.setdefault(key, []):
+                if _find(parent, i) != _find(parent, j) and similarity(signature, signatures[j]) >= threshold:
+                    parent[_find(parent, i)] = _find(parent, j)
+            buckets[key].append(i)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(signatures)):
+        clusters.setdefault(_find(parent, i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def _canonical_rank(chunk: Dict) -> Tuple:
+    return (_FILE_TYPE_RANK.get(chunk.get("file_type"), 9), -len(chunk["content"]), chunk["source"])
+
+
+def _signature(chunk: Dict) -> Tuple[int, ...]:
+    shingle_set = shingles(chunk["content"])
+    return minhash(shingle_set) if len(shingle_set) >= MIN_SHINGLES else ()
+
+
+def signature_key(text: str) -> str:
+    """
+    Firma para la metadata del chunk: el byte bajo de cada valor MinHash
+    (b-bit MinHash), en hexadecimal. Vacia si el texto es muy corto para
+    compararse (menos de MIN_SHINGLES triples).
+    """
+    shingle_set = shingles(text)
+    if len(shingle_set) < MIN_SHINGLES:
+        return ""
+    return _compact(minhash(shingle_set))
+
+
+def _compact(signature: Tuple[int, ...]) -> str:
+    return bytes(value & 0xFF for value in signature).hex()
+
+
+def _merge(chunks: List[Dict], indices: List[int], dropped: Set[int], aliases: Dict[int, List[Dict]],
+           threshold: float) -> None:
+    signatures = [_signature(chunks[i]) for i in indices]
+    # La firma compacta va a la metadata (rag_system._chunk_metadata) sin volver a calcularla
+    for i, signature in zip(indices, signatures):
+        chunks[i]["minhash"] = _compact(signature) if signature else ""
+    # Solo dentro de la misma categoria: una copia por categoria mantiene el
+    # material visible en las consultas filtradas por categoria
+    groups = [f'{chunks[i].get("category", "")}/{chunks[i].get("chunk_level", "")}' for i in indices]
+    for members in cluster_duplicates(signatures, groups, threshold):
+        members = sorted((indices[m] for m in members), key=lambda i: _canonical_rank(chunks[i]))
+        canonical = members[0]
+        for i in members[1:]:
+            dropped.add(i)
+            aliases.setdefault(canonical, []).append(chunks[i])
+            aliases[canonical].extend(aliases.pop(i, []))
+
+
+def dedup_chunks(chunks: List[Dict], threshold: float = DEDUP_THRESHOLD) -> List[Dict]:
+    """
+    Elimina chunks casi duplicados y registra los alias en la copia canonica.
+
+    Primero se comparan los problemas completos y las secciones: si un
+    problema es duplicado, se descartan tambien todos sus hijos. Luego se
+    comparan los hijos que quedan. Solo se colapsan chunks de la misma
+    categoria.
+
+    Args:
+        chunks: Chunks de todo el corpus
+        threshold: Similitud minima (Jaccard estimada) para colapsar
+
+    Returns:
+        Chunks canonicos. Los que tienen duplicados llevan "aliases"
+        ("archivo#chunk; ...") y "alias_sources" ("archivo; ...").
+    """
+    dropped: Set[int] = set()
+    aliases: Dict[int, List[Dict]] = {}
+
+    units = [i for i, c in enumerate(chunks) if not c.get("parent_id")]
+    _merge(chunks, units, dropped, aliases, threshold)
+
+    # El mismo nombre de archivo puede estar en dos categorias
+    dropped_parents = {(chunks[i].get("category"), chunks[i]["source"], chunks[i]["chunk_number"]) for i in dropped}
+    for i, chunk in enumerate(chunks):
+        if chunk.get("parent_id") and (chunk.get("category"), chunk["source"], chunk["parent_id"]) in dropped_parents:
+            dropped.add(i)
+
+    children = [i for i, c in enumerate(chunks) if c.get("parent_id") and i not in dropped]
+    _merge(chunks, children, dropped, aliases, threshold)
+
+    result = []
+    for i, chunk in enumerate(chunks):
+        if i in dropped:
+            continue
+        if i in aliases:
+            chunk = dict(chunk)
+            chunk["aliases"] = "; ".join(f"{a['source']}#{a['chunk_number']}" for a in aliases[i])
+            chunk["alias_sources"] = "; ".join(sorted({a["source"] for a in aliases[i]} - {chunk["source"]}))
+        result.append(chunk)
+    return result
+
+
+def collapse_duplicates(docs: List[Dict], n_results: int, threshold: Optional[float] = None) -> List[Dict]:
+    """
+    Descarta de una lista de resultados los documentos casi iguales a uno
+    mejor rankeado, comparando las firmas "minhash" de la metadata. Los
+    documentos sin firma (indexados antes, o muy cortos) solo se descartan
+    si su texto es identico al de otro.
+
+    Args:
+        docs: Documentos recuperados, ordenados por relevancia
+        n_results: Numero de documentos a retornar
+        threshold: Similitud minima para considerar dos documentos iguales
+
+    Returns:
+        Hasta n_results documentos distintos
+    """
+    threshold = DEDUP_THRESHOLD if threshold is None else threshold
+    # Coincidencias minimas entre firmas de NUM_PERM bytes
+    matches = threshold * NUM_PERM
+    kept: List[Dict] = []
+    kept_signatures: List[bytes] = []
+    kept_texts: Set[str] = set()
+    for doc in docs:
+        text = doc.get("content") or ""
+        if text in kept_texts:
+            continue
+        signature = bytes.fromhex((doc.get("metadata") or {}).get("minhash") or "")
+        if signature and any(sum(x == y for x, y in zip(signature, other)) >= matches for other in kept_signatures):
+            continue
+        kept.append(doc)
+        kept_texts.add(text)
+        if signature:
+            kept_signatures.append(signature)
+        if len(kept) >= n_results:
+            break
+    return kept
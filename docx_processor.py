@@ -0,0 +1,165 @@
+"""
+Procesador de archivos Word (.docx) para extraer contenido relevante.
+
+Lee word/document.xml directamente del zip con iterparse (sin python-docx):
+cada parrafo de primer nivel se emite apenas se cierra y su arbol se libera,
+asi la memoria no crece con el tamanio del documento. Las ecuaciones de
+Word (OMML) se convierten a una notacion tipo LaTeX (\\frac, ^{}, _{},
+\\sqrt) para que queden igual que las del corpus .tex.
+"""
+import os
+import zipfile
+from typing import Dict, Iterator, List
+from xml.etree.ElementTree import iterparse
+
+from chunker import chunk_lines
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_M = "{http://schemas.openxmlformats.org/officeDocument/2006/math}"
+
+# Elementos cuyo contenido no es texto del documento
+_SKIP = {_W + "rPr", _W + "pPr", _W + "sectPr", _W + "instrText", _W + "delText", _W + "tblPr",
+         _W + "tblGrid", _W + "trPr", _W + "tcPr", _M + "sSubPr", _M + "sSupPr", _M + "sSubSupPr",
+         _M + "fPr", _M + "radPr", _M + "naryPr", _M + "dPr", _M + "ctrlPr", _M + "rPr", _M + "funcPr",
+         _M + "accPr", _M + "barPr", _M + "eqArrPr", _M + "limLowPr", _M + "limUppPr", _M + "oMathParaPr"}
+_NARY_DEFAULT = "∫"
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _text(parts: List) -> str:
+    return "".join(text for _, text in parts)
+
+
+def _role(parts: List, name: str) -> str:
+    return "".join(text for tag, text in parts if tag == name)
+
+
+def _compose(elem, parts: List, parent_tag: str) -> str:
+    """Texto de un elemento a partir del de sus hijos ya procesados."""
+    tag = elem.tag
+    if tag in (_W + "t", _M + "t"):
+        return elem.text or ""
+    if tag == _W + "tab":
+        return " "
+    if tag in (_W + "br", _W + "cr"):
+        return "\n---NUEVA PAGINA---\n" if elem.get(_W + "type") == "page" else "\n"
+    if tag == _W + "drawing" or tag == _W + "pict":
+        return " [IMAGEN] "
+
+    # Ecuaciones (OMML)
+    if tag == _M + "f":
+        return "\\frac{" + _role(parts, "num") + "}{" + _role(parts, "den") + "}"
+    if tag == _M + "sSup":
+        return _role(parts, "e") + "^{" + _role(parts, "sup") + "}"
+    if tag == _M + "sSub":
+        return _role(parts, "e") + "_{" + _role(parts, "sub") + "}"
+    if tag == _M + "sSubSup":
+        return _role(parts, "e") + "_{" + _role(parts, "sub") + "}^{" + _role(parts, "sup") + "}"
+    if tag == _M + "rad":
+        return "\\sqrt{" + _role(parts, "e") + "}"
+    if tag == _M + "d":
+        return (_role(parts, "begChr") or "(") + ", ".join(t for g, t in parts if g == "e") + (_role(parts, "endChr") or ")")
+    if tag == _M + "nary":
+        limits = ""
+        if _role(parts, "sub"):
+            limits += "_{" + _role(parts, "sub") + "}"
+        if _role(parts, "sup"):
+            limits += "^{" + _role(parts, "sup") + "}"
+        return (_role(parts, "chr") or _NARY_DEFAULT) + limits + " " + _role(parts, "e")
+    if tag in (_M + "begChr", _M + "endChr", _M + "chr"):
+        return elem.get(_M + "val", "")
+    if tag == _M + "oMath":
+        math = " ".join(_text(parts).split())
+        return f"\nECUACION: {math}\n" if parent_tag == _M + "oMathPara" else f" MATH: {math} "
+
+    # Tablas: celdas separadas por " | ", una fila por linea
+    if tag == _W + "tc":
+        return " ".join(_text(parts).split())
+    if tag == _W + "tr":
+        return " | ".join(t for g, t in parts if g == "tc") + "\n"
+
+    if tag == _W + "p":
+        text = _text(parts).strip()
+        return text + "\n" if text else ""
+    return _text(parts)
+
+
+def _paragraph_prefix(ppr) -> str:
+    """Vinieta sangrada para items de lista y ## para titulos."""
+    if ppr is None:
+        return ""
+    style = ppr.find(_W + "pStyle")
+    style_name = (style.get(_W + "val") or "").lower() if style is not None else ""
+    if style_name.startswith(("heading", "titulo", "ttulo", "title")):
+        return "## "
+    num = ppr.find(_W + "numPr")
+    if num is not None:
+        level = num.find(_W + "ilvl")
+        depth = int(level.get(_W + "val", "0")) if level is not None else 0
+        return "  " * depth + "- "
+    return ""
+
+
+def iter_docx_lines(file_path: str) -> Iterator[str]:
+    """
+    Genera las lineas de texto de un .docx en orden de documento.
+
+    Args:
+        file_path: Ruta al archivo .docx
+
+    Yields:
+        Lineas de texto (parrafos, filas de tablas, ecuaciones)
+    """
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as xml:
+        # Pila de (tag, partes de los hijos); cada parte es (rol, texto)
+        stack: List = []
+        for event, elem in iterparse(xml, events=("start", "end")):
+            if event == "start":
+                stack.append((elem.tag, []))
+                continue
+
+            tag, parts = stack.pop()
+            parent_tag = stack[-1][0] if stack else ""
+            if tag in _SKIP:
+                text = ""
+            else:
+                text = _compose(elem, parts, parent_tag)
+                if tag == _W + "p" and text:
+                    text = _paragraph_prefix(elem.find(_W + "pPr")) + text
+
+            if parent_tag == _W + "body":
+                # Parrafo o tabla de primer nivel completo: emitir y liberar
+                for line in text.split("\n"):
+                    yield line
+                elem.clear()
+            elif stack:
+                stack[-1][1].append((_local(tag), text))
+                if tag in (_W + "p", _W + "tbl"):
+                    elem.clear()
+
+
+def process_docx_to_chunks(file_path: str, category: str) -> List[Dict]:
+    """
+    Procesa un .docx y lo divide en chunks para indexacion.
+
+    Args:
+        file_path: Ruta al archivo .docx
+        category: Categoria tematica (carpeta de origen)
+
+    Returns:
+        Lista de diccionarios con metadata de cada chunk
+    """
+    return chunk_lines(iter_docx_lines(file_path), os.path.basename(file_path), category, "docx")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        for line in iter_docx_lines(sys.argv[1]):
+            print(line)
+    else:
+        print("Uso: python docx_processor.py <ruta_al_docx>")
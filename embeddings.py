@@ -0,0 +1,191 @@
+"""
+Backend de embeddings configurable para la coleccion de ChromaDB.
+
+Por defecto (EMBEDDING_BACKEND=default) se usa la funcion de embeddings de
+ChromaDB (all-MiniLM-L6-v2, solo ingles). Con EMBEDDING_BACKEND=onnx se
+carga un modelo multilingue exportado a ONNX, idealmente cuantizado a int8,
+y se ejecuta en CPU con ONNX Runtime (onnxruntime y tokenizers ya vienen
+como dependencias de chromadb).
+
+Preparar el modelo (una vez, en una maquina con optimum instalado):
+    optimum-cli export onnx --model sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2 \\
+        models/paraphrase-multilingual-MiniLM-L12-v2
+    python embeddings.py quantize models/paraphrase-multilingual-MiniLM-L12-v2
+
+Cambiar de modelo requiere reindexar: los vectores de modelos distintos no
+son comparables.
+"""
+import os
+from functools import lru_cache
+from typing import List, Optional
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "default")  # "default" u "onnx"
+EMBEDDING_MODEL_DIR = os.getenv("EMBEDDING_MODEL_DIR", "./models/paraphrase-multilingual-MiniLM-L12-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Hilos intra-op de ONNX Runtime (0 = uno por nucleo)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+EMBEDDING_MAX_LENGTH = int(os.getenv("EMBEDDING_MAX_LENGTH", "256"))
+
+# Nombres de archivo dentro de EMBEDDING_MODEL_DIR
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+DEFAULT_MODEL_NAME = "chromadb-default"
+
+
+class OnnxEmbeddingFunction:
+    """
+    Funcion de embeddings para ChromaDB sobre un modelo tipo sentence-transformers
+    en ONNX: tokenizacion por lotes, mean pooling y normalizacion L2.
+    """
+
+    def __init__(self, model_dir: str = EMBEDDING_MODEL_DIR, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 threads: int = EMBEDDING_THREADS, max_length: int = EMBEDDING_MAX_LENGTH,
+                 quantized: bool = True):
+        """
+        Args:
+            model_dir: Carpeta con model.onnx (o model_int8.onnx) y tokenizer.json
+            batch_size: Textos por llamada al modelo
+            threads: Hilos intra-op de ONNX Runtime (0 = decide ONNX Runtime)
+            max_length: Tokens maximos por texto (se trunca el resto)
+            quantized: Preferir model_int8.onnx si existe
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+        if not quantized or not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, MODEL_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"No se encontro el modelo ONNX en {model_dir}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_token = next((t for t in ("<pad>", "[PAD]") if self.tokenizer.token_to_id(t) is not None), None)
+        if pad_token:
+            self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token), pad_token=pad_token)
+        else:
+            self.tokenizer.enable_padding()
+
+        self.batch_size = max(1, batch_size)
+        self.model_name = f"onnx:{os.path.basename(os.path.normpath(model_dir))}:{os.path.basename(model_path)}"
+
+    def embed(self, texts: List[str]):
+        """Embeddings normalizados (arreglo numpy de n x dimension)."""
+        import numpy as np
+
+        # Lotes de textos de largo parecido: menos padding por lote
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = None
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encodings = self.tokenizer.encode_batch([texts[i] for i in batch])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+            hidden = self.session.run(None, feeds)[0]
+            mask = attention_mask[..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+            if result is None:
+                result = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            result[batch] = pooled
+        return result if result is not None else np.empty((0, 0), dtype=np.float32)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        # ChromaDB exige que el parametro se llame "input"
+        return self.embed(list(input)).tolist()
+
+    # Resto de la interfaz que ChromaDB >= 1.0 espera de una funcion de embeddings
+    def embed_query(self, input: List[str]) -> List[List[float]]:
+        return self(input)
+
+    @staticmethod
+    def name() -> str:
+        return "electro_onnx"
+
+    def is_legacy(self) -> bool:
+        # Sin configuracion serializable: ChromaDB no intenta reconstruirla al abrir
+        return True
+
+    def default_space(self) -> str:
+        return "l2"
+
+    def supported_spaces(self) -> List[str]:
+        return ["l2", "cosine", "ip"]
+
+
+@lru_cache(maxsize=1)
+def get_embedding_function() -> Optional[OnnxEmbeddingFunction]:
+    """
+    Funcion de embeddings configurada por EMBEDDING_BACKEND.
+
+    Returns:
+        OnnxEmbeddingFunction, o None para usar la funcion por defecto de ChromaDB
+    """
+    if EMBEDDING_BACKEND == "onnx":
+        embedding_function = OnnxEmbeddingFunction()
+        print(f"Embeddings: {embedding_function.model_name} (lotes de {embedding_function.batch_size})")
+        return embedding_function
+    if EMBEDDING_BACKEND != "default":
+        print(f"Advertencia: EMBEDDING_BACKEND desconocido '{EMBEDDING_BACKEND}', se usa el de ChromaDB")
+    return None
+
+
+@lru_cache(maxsize=1)
+def document_embedding_function():
+    """
+    Funcion para embeber documentos fuera de ChromaDB (al guardar el texto
+    en chunk_store): la configurada o, si no hay, la de ChromaDB por defecto.
+    """
+    embedding_function = get_embedding_function()
+    if embedding_function is None:
+        from chromadb.utils import embedding_functions
+        embedding_function = embedding_functions.DefaultEmbeddingFunction()
+    return embedding_function
+
+
+def embedding_model_name(embedding_function: Optional[OnnxEmbeddingFunction]) -> str:
+    return embedding_function.model_name if embedding_function is not None else DEFAULT_MODEL_NAME
+
+
+def quantize_model(model_dir: str = EMBEDDING_MODEL_DIR) -> str:
+    """
+    Cuantiza los pesos de model.onnx a int8 (cuantizacion dinamica).
+
+    Args:
+        model_dir: Carpeta con model.onnx
+
+    Returns:
+        Ruta del modelo cuantizado
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = os.path.join(model_dir, MODEL_FILE)
+    target = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    print(f"Modelo cuantizado: {target} ({os.path.getsize(source) / 1e6:.0f} MB -> "
+          f"{os.path.getsize(target) / 1e6:.0f} MB)")
+    return target
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "quantize":
+        quantize_model(sys.argv[2] if len(sys.argv) > 2 else EMBEDDING_MODEL_DIR)
+    else:
+        print("Uso: python embeddings.py quantize [carpeta_del_modelo]")
@@ -0,0 +1,451 @@
+"""
+Paquetes versionados del indice: se construye una vez y se instala en
+cualquier servidor sin volver a extraer el corpus (ni pasar por OCR).
+
+Un paquete es un .tar (o .tar.gz) con:
+    bundle.json          Version, modelo de embeddings, dimension, numero de
+                         chunks, metadata y parametros HNSW de la coleccion,
+                         y el SHA-256 y tamanio de cada archivo
+    ids.json             IDs de los chunks
+    vectors.npy          Embeddings (float32, N x dim)
+    metadatas.jsonl      Metadata de cada chunk
+    documents.jsonl      Texto de cada chunk (solo sin chunk_store)
+    chunk_store/         chunks.dat y chunks.idx con los textos de la coleccion
+                         (ver chunk_store.py)
+    corpus_manifest.json Huellas de los archivos del corpus (indexer incremental)
+
+No se copian los archivos internos de ChromaDB (SQLite y HNSW dependen de
+la version instalada): install reconstruye la coleccion desde los vectores,
+sin calcular embeddings.
+
+install verifica las sumas SHA-256 y el modelo de embeddings, arma la
+nueva version en chroma_db.versions/<version>/ y cambia ./chroma_db (un
+enlace simbolico) de forma atomica. La app y el servicio de recuperacion
+notan el cambio en la siguiente consulta y abren la nueva version en
+segundo plano, sin cortar las consultas en curso. La primera instalacion
+convierte una carpeta ./chroma_db existente en la version "inicial".
+
+Uso:
+    python index_bundle.py export indice.tar             # desde ./chroma_db
+    python index_bundle.py verify indice.tar
+    python index_bundle.py install indice.tar            # en cada servidor
+    python index_bundle.py list
+    python index_bundle.py rollback                      # volver a la version anterior
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from write_lock import LOCK_FILE, write_lock
+
+BUNDLE_FORMAT = 1
+BUNDLE_FILE = "bundle.json"
+# Versiones instaladas que se conservan (la activa incluida) para rollback
+BUNDLE_KEEP = int(os.getenv("BUNDLE_KEEP", "3"))
+# Filas por lectura de ChromaDB y por collection.add al instalar
+PAGE_ROWS = 5000
+
+
+class BundleError(Exception):
+    """Paquete danado, incompatible o mal instalado."""
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def versions_dir(live_path: str) -> str:
+    """Carpeta con las versiones instaladas, junto a ./chroma_db."""
+    return os.path.abspath(live_path).rstrip(os.sep) + ".versions"
+
+
+def export_bundle(persist_directory: str, output_path: str) -> Dict:
+    """
+    Empaqueta el indice de persist_directory. Las escrituras al indice
+    esperan mientras se lee (ver write_lock.py); el empaquetado no las
+    bloquea.
+
+    Args:
+        persist_directory: Carpeta de ChromaDB (con chunk_store y corpus_manifest.json)
+        output_path: Archivo .tar o .tar.gz a crear
+
+    Returns:
+        Contenido de bundle.json
+    """
+    import numpy as np
+
+    from chunk_store import INDEX_FILE, ChunkStore, default_store_dir
+    from rag_system import MANIFEST_FILE, _hnsw_settings, active_collection_name, chroma_client
+
+    staging = tempfile.mkdtemp(prefix="index_bundle_")
+    try:
+        # Con el candado, ninguna escritura cambia la coleccion, chunk_store o el
+        # manifiesto entre las lecturas por paginas y la copia
+        with write_lock(persist_directory):
+            collection = chroma_client(persist_directory).get_collection(active_collection_name(persist_directory))
+            count = collection.count()
+            if not count:
+                raise BundleError(f"La coleccion en {persist_directory} esta vacia")
+            metadata = dict(collection.metadata or {})
+            ids, vectors = [], None
+            with open(os.path.join(staging, "metadatas.jsonl"), "w", encoding="utf-8") as metadatas_file, \
+                    open(os.path.join(staging, "documents.jsonl"), "w", encoding="utf-8") as documents_file:
+                has_documents = False
+                content_hashes = set()
+                for offset in range(0, count, PAGE_ROWS):
+                    page = collection.get(include=["embeddings", "metadatas", "documents"], limit=PAGE_ROWS,
+                                          offset=offset)
+                    embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+                    if vectors is None:
+                        vectors = np.lib.format.open_memmap(os.path.join(staging, "vectors.npy"), mode="w+",
+                                                            dtype=np.float32, shape=(count, embeddings.shape[1]))
+                    vectors[len(ids):len(ids) + len(embeddings)] = embeddings
+                    ids.extend(page["ids"])
+                    documents = page["documents"] or [None] * len(page["ids"])
+                    for chunk_metadata, document in zip(page["metadatas"], documents):
+                        metadatas_file.write(json.dumps(chunk_metadata, ensure_ascii=False) + "\n")
+                        documents_file.write(json.dumps(document, ensure_ascii=False) + "\n")
+                        # Con chunk_store, ChromaDB no guarda el texto
+                        has_documents = has_documents or bool(document)
+                        if chunk_metadata and chunk_metadata.get("content_hash"):
+                            content_hashes.add(chunk_metadata["content_hash"])
+            if len(ids) != count:
+                raise BundleError(f"Se leyeron {len(ids)} de {count} chunks de la coleccion")
+            vectors.flush()
+            dim = int(vectors.shape[1])
+            del vectors
+            if not has_documents:
+                os.unlink(os.path.join(staging, "documents.jsonl"))
+            with open(os.path.join(staging, "ids.json"), "w", encoding="utf-8") as f:
+                json.dump(ids, f)
+
+            store_dir = default_store_dir(persist_directory)
+            if os.path.exists(os.path.join(store_dir, INDEX_FILE)):
+                # Solo los textos de esta coleccion, no los de archivos ya reindexados
+                store = ChunkStore(store_dir)
+                try:
+                    copied = store.copy_to(os.path.join(staging, "chunk_store"), content_hashes)
+                finally:
+                    store.close()
+                os.unlink(os.path.join(staging, "chunk_store", LOCK_FILE))
+                if copied != len(content_hashes):
+                    raise BundleError(f"Faltan {len(content_hashes) - copied} textos en chunk_store ({store_dir})")
+            elif not has_documents:
+                raise BundleError(f"La coleccion no guarda el texto y no hay chunk_store en {store_dir}")
+            if os.path.exists(os.path.join(persist_directory, MANIFEST_FILE)):
+                shutil.copyfile(os.path.join(persist_directory, MANIFEST_FILE),
+                                os.path.join(staging, MANIFEST_FILE))
+
+        files = {}
+        for root, _, names in os.walk(staging):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, staging).replace(os.sep, "/")
+                files[relative] = {"sha256": _sha256(path), "bytes": os.path.getsize(path)}
+        content_id = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()
+        bundle = {
+            "format": BUNDLE_FORMAT,
+            "version": f"{time.strftime('%Y%m%d-%H%M%S')}-{content_id[:8]}",
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "embedding_model": metadata.get("embedding_model"),
+            "dim": dim,
+            "count": count,
+            "collection_metadata": {key: value for key, value in metadata.items() if not key.startswith("hnsw:")},
+            "hnsw": _hnsw_settings(collection),
+            "files": files,
+        }
+        with open(os.path.join(staging, BUNDLE_FILE), "w", encoding="utf-8") as f:
+            json.dump(bundle, f, ensure_ascii=False, indent=1)
+
+        mode = "w:gz" if output_path.endswith((".tar.gz", ".tgz")) else "w"
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with tarfile.open(tmp_path, mode) as tar:
+            # bundle.json primero: verify y list lo leen sin recorrer todo el archivo
+            tar.add(os.path.join(staging, BUNDLE_FILE), arcname=BUNDLE_FILE)
+            for relative in sorted(files):
+                tar.add(os.path.join(staging, relative), arcname=relative)
+        os.replace(tmp_path, output_path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    print(f"Paquete {bundle['version']}: {count} chunks, modelo {bundle['embedding_model']} -> {output_path}")
+    return bundle
+
+
+def _extract(bundle_path: str, directory: str):
+    with tarfile.open(bundle_path) as tar:
+        for member in tar.getmembers():
+            # Solo archivos y carpetas con rutas relativas dentro del paquete
+            name = os.path.normpath(member.name)
+            if name.startswith(("..", os.sep)) or os.path.isabs(name) or not (member.isfile() or member.isdir()):
+                raise BundleError(f"Entrada no permitida en el paquete: {member.name}")
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(directory, filter="data")
+        else:
+            tar.extractall(directory)
+
+
+def verify_directory(directory: str) -> Dict:
+    """
+    Verifica un paquete extraido: formato, archivos y sumas SHA-256.
+
+    Returns:
+        Contenido de bundle.json
+    """
+    try:
+        with open(os.path.join(directory, BUNDLE_FILE), encoding="utf-8") as f:
+            bundle = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"{BUNDLE_FILE} ausente o ilegible: {e}")
+    if bundle.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"Formato de paquete {bundle.get('format')} no soportado (se espera {BUNDLE_FORMAT})")
+
+    present = set()
+    for root, _, names in os.walk(directory):
+        for name in names:
+            present.add(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/"))
+    present.discard(BUNDLE_FILE)
+    if present != set(bundle["files"]):
+        raise BundleError(f"Archivos distintos a los declarados: sobran {sorted(present - set(bundle['files']))}, "
+                          f"faltan {sorted(set(bundle['files']) - present)}")
+    for relative, expected in bundle["files"].items():
+        path = os.path.join(directory, relative)
+        if os.path.getsize(path) != expected["bytes"] or _sha256(path) != expected["sha256"]:
+            raise BundleError(f"Suma de verificacion incorrecta: {relative}")
+    return bundle
+
+
+def verify_bundle(bundle_path: str) -> Dict:
+    """Extrae el paquete a una carpeta temporal y lo verifica (ver verify_directory)."""
+    staging = tempfile.mkdtemp(prefix="index_bundle_")
+    try:
+        _extract(bundle_path, staging)
+        return verify_directory(staging)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _build_version(staging: str, bundle: Dict, version_dir: str):
+    """Crea la coleccion de ChromaDB, chunk_store e indice int8 de una version."""
+    import numpy as np
+
+    import chromadb
+
+    from compact_index import CompactIndex, wants_compact
+    from embeddings import get_embedding_function
+    from rag_system import COLLECTION_NAME, MANIFEST_FILE
+
+    os.makedirs(version_dir)
+    with open(os.path.join(staging, "ids.json"), encoding="utf-8") as f:
+        ids = json.load(f)
+    vectors = np.load(os.path.join(staging, "vectors.npy"), mmap_mode="r")
+    with open(os.path.join(staging, "metadatas.jsonl"), encoding="utf-8") as f:
+        metadatas = [json.loads(line) for line in f]
+    documents = None
+    if os.path.exists(os.path.join(staging, "documents.jsonl")):
+        with open(os.path.join(staging, "documents.jsonl"), encoding="utf-8") as f:
+            documents = [json.loads(line) for line in f]
+    if not (len(ids) == len(vectors) == len(metadatas) == bundle["count"]):
+        raise BundleError("El numero de ids, vectores y metadatas no coincide con bundle.json")
+
+    embedding_function = get_embedding_function()
+    options = {"embedding_function": embedding_function} if embedding_function is not None else {}
+    client = chromadb.PersistentClient(path=version_dir)
+    collection = client.create_collection(
+        name=COLLECTION_NAME, metadata={**bundle["collection_metadata"], **bundle["hnsw"]}, **options)
+    for start in range(0, len(ids), PAGE_ROWS):
+        end = start + PAGE_ROWS
+        collection.add(ids=ids[start:end], embeddings=np.asarray(vectors[start:end]),
+                       metadatas=metadatas[start:end], **({"documents": documents[start:end]} if documents else {}))
+
+    if os.path.isdir(os.path.join(staging, "chunk_store")):
+        shutil.copytree(os.path.join(staging, "chunk_store"), os.path.join(version_dir, "chunk_store"))
+    if os.path.exists(os.path.join(staging, MANIFEST_FILE)):
+        shutil.copyfile(os.path.join(staging, MANIFEST_FILE), os.path.join(version_dir, MANIFEST_FILE))
+    if wants_compact(len(ids), bundle["dim"]):
+        CompactIndex(os.path.join(version_dir, "compact_index")).build_from(
+            ids, vectors, [(metadata or {}).get("category", "") for metadata in metadatas])
+    shutil.copyfile(os.path.join(staging, BUNDLE_FILE), os.path.join(version_dir, BUNDLE_FILE))
+
+
+def activate(live_path: str, version: str):
+    """
+    Hace que live_path apunte a la version indicada, reemplazando el enlace
+    de forma atomica.
+    """
+    versions = versions_dir(live_path)
+    if not os.path.isdir(os.path.join(versions, version)):
+        raise BundleError(f"La version {version} no esta instalada en {versions}")
+    live_path = os.path.abspath(live_path).rstrip(os.sep)
+    # Se espera a que termine la escritura en curso en la version actual (ver write_lock.py)
+    with write_lock(live_path) if os.path.isdir(live_path) else contextlib.nullcontext():
+        if os.path.isdir(live_path) and not os.path.islink(live_path):
+            # Primera instalacion: la carpeta actual pasa a ser una version mas
+            os.replace(live_path, os.path.join(versions, "inicial"))
+            print(f"La carpeta {live_path} quedo como la version 'inicial'")
+        target = os.path.relpath(os.path.join(versions, version), os.path.dirname(live_path))
+        tmp_link = f"{live_path}.{os.getpid()}.tmp"
+        os.symlink(target, tmp_link)
+        os.replace(tmp_link, live_path)
+
+
+def installed_versions(live_path: str) -> List[str]:
+    """Versiones instaladas, de la mas antigua a la mas nueva (por fecha de instalacion)."""
+    versions = versions_dir(live_path)
+    if not os.path.isdir(versions):
+        return []
+    names = [name for name in os.listdir(versions)
+             if os.path.isdir(os.path.join(versions, name)) and not name.endswith(".tmp")]
+    return sorted(names, key=lambda name: os.path.getmtime(os.path.join(versions, name)))
+
+
+def active_version(live_path: str) -> Optional[str]:
+    if not os.path.islink(live_path):
+        return None
+    return os.path.basename(os.path.realpath(live_path))
+
+
+def _prune(live_path: str, keep: int):
+    """Borra las versiones mas antiguas; la activa nunca se borra."""
+    active = active_version(live_path)
+    old = [name for name in installed_versions(live_path) if name != active]
+    for name in old[:max(len(old) - (keep - 1), 0)]:
+        # Los procesos que aun la tengan abierta siguen leyendo sus archivos hasta cerrarlos
+        shutil.rmtree(os.path.join(versions_dir(live_path), name), ignore_errors=True)
+        print(f"  Version {name} eliminada")
+
+
+def install_bundle(bundle_path: str, live_path: str = "./chroma_db", force: bool = False,
+                   keep: int = BUNDLE_KEEP) -> str:
+    """
+    Verifica e instala un paquete y lo activa.
+
+    Args:
+        bundle_path: Paquete .tar o .tar.gz
+        live_path: Ruta que usan la app y los workers (./chroma_db)
+        force: Instalar aunque el modelo de embeddings no coincida con el configurado
+        keep: Versiones a conservar para rollback
+
+    Returns:
+        Version instalada
+    """
+    from chunk_store import CHUNK_STORE_DIR
+    from compact_index import COMPACT_INDEX_DIR
+    from embeddings import embedding_model_name, get_embedding_function
+
+    if CHUNK_STORE_DIR or COMPACT_INDEX_DIR:
+        print("Advertencia: CHUNK_STORE_DIR o COMPACT_INDEX_DIR estan definidos; esas carpetas no "
+              "cambian con la version del indice")
+    versions = versions_dir(live_path)
+    os.makedirs(versions, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix="bundle.", suffix=".tmp", dir=versions)
+    try:
+        start = time.perf_counter()
+        _extract(bundle_path, staging)
+        bundle = verify_directory(staging)
+        configured = embedding_model_name(get_embedding_function())
+        if bundle["embedding_model"] != configured and not force:
+            raise BundleError(f"El paquete usa el modelo {bundle['embedding_model']} y este servidor {configured}; "
+                              "las consultas no serian comparables (usar --force para instalarlo igual)")
+        version = bundle["version"]
+        version_dir = os.path.join(versions, version)
+        if os.path.exists(version_dir):
+            raise BundleError(f"La version {version} ya esta instalada (python index_bundle.py list)")
+
+        build_dir = os.path.join(staging, "build")
+        _build_version(staging, bundle, build_dir)
+        os.replace(build_dir, version_dir)
+        activate(live_path, version)
+        print(f"Version {version} activa ({bundle['count']} chunks) en {time.perf_counter() - start:.1f} s")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    _prune(live_path, keep)
+    _notify_retrieval_service()
+    return version
+
+
+def _notify_retrieval_service():
+    """El servicio de recuperacion tambien nota el cambio solo; pedirlo acorta la espera."""
+    url = os.getenv("RETRIEVAL_SERVICE_URL")
+    if not url:
+        return
+    from retrieval_service import RemoteCollection
+    try:
+        RemoteCollection(url).reload()
+    except Exception as e:
+        print(f"Advertencia: no se pudo avisar al servicio de recuperacion: {e}")
+
+
+def rollback(live_path: str = "./chroma_db", version: Optional[str] = None) -> str:
+    """Activa la version indicada o, por defecto, la instalada antes de la activa."""
+    if version is None:
+        active = active_version(live_path)
+        older = [name for name in installed_versions(live_path) if name != active]
+        if not older:
+            raise BundleError("No hay una version anterior instalada")
+        version = older[-1]
+    activate(live_path, version)
+    # La version activa pasa a ser la mas reciente para _prune y el proximo rollback
+    os.utime(os.path.join(versions_dir(live_path), version))
+    _notify_retrieval_service()
+    print(f"Version {version} activa")
+    return version
+
+
+def main() -> int:
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Paquetes versionados del indice")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Empaquetar el indice actual")
+    export.add_argument("output", help="Archivo .tar o .tar.gz")
+    export.add_argument("--persist-directory", default="./chroma_db")
+    verify = commands.add_parser("verify", help="Verificar las sumas de un paquete")
+    verify.add_argument("bundle")
+    install = commands.add_parser("install", help="Instalar un paquete y activarlo")
+    install.add_argument("bundle")
+    install.add_argument("--live", default="./chroma_db", help="Ruta que usa la app")
+    install.add_argument("--keep", type=int, default=BUNDLE_KEEP, help="Versiones a conservar")
+    install.add_argument("--force", action="store_true", help="Instalar aunque el modelo de embeddings difiera")
+    listing = commands.add_parser("list", help="Versiones instaladas")
+    listing.add_argument("--live", default="./chroma_db")
+    back = commands.add_parser("rollback", help="Volver a la version anterior (o a la indicada)")
+    back.add_argument("version", nargs="?")
+    back.add_argument("--live", default="./chroma_db")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            export_bundle(args.persist_directory, args.output)
+        elif args.command == "verify":
+            bundle = verify_bundle(args.bundle)
+            print(f"Paquete {bundle['version']} valido: {bundle['count']} chunks, modelo {bundle['embedding_model']}")
+        elif args.command == "install":
+            install_bundle(args.bundle, args.live, args.force, args.keep)
+        elif args.command == "list":
+            active = active_version(args.live)
+            for name in installed_versions(args.live):
+                print(f"{'*' if name == active else ' '} {name}")
+        elif args.command == "rollback":
+            rollback(args.live, args.version)
+    except BundleError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
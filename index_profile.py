@@ -0,0 +1,223 @@
+"""
+Perfil de la indexacion por archivo: que archivos hacen lenta la ingesta.
+
+Para cada archivo del corpus mide, mientras se extraen sus chunks con
+ingest.process_file:
+
+    wall_s     tiempo de reloj
+    cpu_s      tiempo de CPU, incluidos los subprocesos (Tesseract, poppler)
+    peak_mb    memoria maxima asignada por Python durante el archivo
+               (tracemalloc; no incluye buffers nativos de pdfplumber/poppler)
+    pages      paginas del PDF (1 para imagenes, 0 para .tex/.docx)
+    ocr_pages  paginas pasadas por OCR
+    chunks     chunks producidos
+
+Los archivos se procesan uno a uno en este proceso (sin INGEST_WORKERS) y
+sin la cache de chunks, para que cada medicion sea del trabajo real. El
+reporte se guarda en CSV (o JSON, segun la extension) y se imprime
+ordenado por la columna elegida. Con --cprofile se guarda ademas un perfil
+de cProfile (.prof) de toda la extraccion, que se abre con snakeviz o
+pstats; para un flamegraph con py-spy basta envolver el mismo comando:
+
+    py-spy record -o indexacion.svg -- python index_profile.py
+
+Uso:
+    python index_profile.py                          # todo ./corpus
+    python index_profile.py --category campo_electrico --sort ocr_pages
+    python index_profile.py --report perfil.json --cprofile indexacion.prof
+"""
+import cProfile
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+import pdf_processor
+from ingest import list_category_files, process_file
+
+COLUMNS = ("file", "category", "type", "size_kb", "wall_s", "cpu_s", "peak_mb", "pages", "ocr_pages",
+           "chunks", "error")
+SORT_KEYS = ("wall_s", "cpu_s", "peak_mb", "pages", "ocr_pages", "chunks", "size_kb")
+
+
+def _cpu_seconds() -> float:
+    """CPU de este proceso y de los subprocesos ya terminados (el OCR corre en tesseract)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def corpus_files(corpus_path: str, categories: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """
+    Pares (ruta, categoria) de los archivos del corpus, como los recorre index_corpus.
+
+    Args:
+        corpus_path: Carpeta raiz del corpus
+        categories: Carpetas de categoria a incluir (None = todas las de CATEGORIES)
+    """
+    from rag_system import CATEGORIES
+
+    files = []
+    for category in categories or list(CATEGORIES):
+        category_path = os.path.join(corpus_path, category)
+        if os.path.isdir(category_path):
+            files.extend((path, category) for path in list_category_files(category_path))
+        else:
+            print(f"  Advertencia: Carpeta {category} no existe")
+    return files
+
+
+def profile_file(path: str, category: str, use_cache: bool = False,
+                 trace_memory: bool = True) -> Tuple[List[Dict], Dict]:
+    """
+    Extrae los chunks de un archivo midiendo su costo.
+
+    Args:
+        path: Ruta al archivo
+        category: Categoria tematica
+        use_cache: Reusar la cache de chunks (mide solo los archivos que cambiaron)
+        trace_memory: Medir la memoria maxima con tracemalloc (hace la extraccion mas lenta)
+
+    Returns:
+        (chunks, fila del reporte)
+    """
+    counts = dict(pdf_processor.page_counts)
+    row = {"file": os.path.join(category, os.path.basename(path)), "category": category,
+           "type": os.path.splitext(path)[1].lower().lstrip("."),
+           "size_kb": round(os.path.getsize(path) / 1024, 1), "error": ""}
+    if trace_memory:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    chunks = []
+    wall, cpu = time.perf_counter(), _cpu_seconds()
+    try:
+        chunks = process_file(path, category, use_cache)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["wall_s"] = round(time.perf_counter() - wall, 3)
+    row["cpu_s"] = round(_cpu_seconds() - cpu, 3)
+
+    row["peak_mb"] = round((tracemalloc.get_traced_memory()[1] - baseline) / 2**20, 1) if trace_memory else ""
+    for key in ("pages", "ocr_pages"):
+        row[key] = pdf_processor.page_counts[key] - counts[key]
+    row["chunks"] = len(chunks)
+    return chunks, row
+
+
+def profile_files(files: List[Tuple[str, str]], use_cache: bool = False, trace_memory: bool = True,
+                  cprofile_path: Optional[str] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Extrae varios archivos en secuencia con profile_file.
+
+    Args:
+        files: Pares (ruta, categoria)
+        use_cache: Reusar la cache de chunks
+        trace_memory: Medir la memoria maxima de cada archivo
+        cprofile_path: Si se indica, guarda ahi un perfil de cProfile de toda la extraccion
+
+    Returns:
+        (chunks de todos los archivos, filas del reporte en el orden de files)
+    """
+    profiler = cProfile.Profile() if cprofile_path else None
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    all_chunks, rows = [], []
+    try:
+        for path, category in files:
+            if profiler:
+                profiler.enable()
+            chunks, row = profile_file(path, category, use_cache, trace_memory)
+            if profiler:
+                profiler.disable()
+            all_chunks.extend(chunks)
+            rows.append(row)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        if profiler:
+            profiler.dump_stats(cprofile_path)
+            print(f"Perfil de cProfile en {cprofile_path} (snakeviz {cprofile_path})")
+    return all_chunks, rows
+
+
+def sort_rows(rows: List[Dict], sort_by: str = "wall_s") -> List[Dict]:
+    """Filas de mayor a menor segun la columna sort_by."""
+    return sorted(rows, key=lambda row: row[sort_by] if isinstance(row[sort_by], (int, float)) else -1,
+                  reverse=True)
+
+
+def write_report(rows: List[Dict], path: str, sort_by: str = "wall_s"):
+    """Guarda el reporte ordenado en CSV, o en JSON si path termina en .json."""
+    rows = sort_rows(rows, sort_by)
+    if path.lower().endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    else:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    print(f"Reporte en {path}")
+
+
+def print_report(rows: List[Dict], sort_by: str = "wall_s", top: int = 15):
+    """Imprime los archivos mas costosos y los totales por tipo de archivo."""
+    total_wall = sum(row["wall_s"] for row in rows) or 1.0
+    print(f"\n{'archivo':<48}{'wall s':>9}{'cpu s':>8}{'pico MB':>9}{'pags':>6}{'ocr':>5}{'chunks':>8}{'% wall':>8}")
+    for row in sort_rows(rows, sort_by)[:top]:
+        name = row["file"] if len(row["file"]) <= 46 else "..." + row["file"][-43:]
+        peak = f"{row['peak_mb']:>9}" if row["peak_mb"] != "" else f"{'-':>9}"
+        print(f"{name:<48}{row['wall_s']:>9.2f}{row['cpu_s']:>8.2f}{peak}{row['pages']:>6}{row['ocr_pages']:>5}"
+              f"{row['chunks']:>8}{row['wall_s'] / total_wall:>8.1%}" + (f"  ERROR {row['error']}" if row["error"] else ""))
+
+    by_type: Dict[str, List[Dict]] = {}
+    for row in rows:
+        by_type.setdefault(row["type"], []).append(row)
+    print(f"\n{'tipo':<8}{'archivos':>10}{'wall s':>9}{'cpu s':>8}{'ocr':>6}{'chunks':>8}{'% wall':>8}")
+    for file_type, group in sorted(by_type.items(), key=lambda item: -sum(r["wall_s"] for r in item[1])):
+        wall = sum(row["wall_s"] for row in group)
+        print(f"{file_type:<8}{len(group):>10}{wall:>9.2f}{sum(row['cpu_s'] for row in group):>8.2f}"
+              f"{sum(row['ocr_pages'] for row in group):>6}{sum(row['chunks'] for row in group):>8}"
+              f"{wall / total_wall:>8.1%}")
+    errors = sum(1 for row in rows if row["error"])
+    print(f"\nTotal: {len(rows)} archivos en {total_wall:.2f} s" + (f", {errors} con error" if errors else ""))
+
+
+def main() -> int:
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Perfil de la indexacion por archivo")
+    parser.add_argument("paths", nargs="*", help="Archivos a perfilar (por defecto, todo el corpus)")
+    parser.add_argument("--corpus", default="./corpus")
+    parser.add_argument("--category", action="append", help="Solo estas categorias (se puede repetir)")
+    parser.add_argument("--sort", choices=SORT_KEYS, default="wall_s")
+    parser.add_argument("--top", type=int, default=15, help="Archivos a mostrar")
+    parser.add_argument("--report", default="index_profile.csv", help="Reporte .csv o .json")
+    parser.add_argument("--cprofile", help="Guardar un perfil de cProfile (.prof)")
+    parser.add_argument("--use-cache", action="store_true", help="Reusar la cache de chunks")
+    parser.add_argument("--no-memory", action="store_true", help="No medir memoria (sin el costo de tracemalloc)")
+    args = parser.parse_args()
+
+    if args.paths:
+        files = [(path, os.path.basename(os.path.dirname(os.path.abspath(path)))) for path in args.paths]
+    else:
+        files = corpus_files(args.corpus, args.category)
+    if not files:
+        print("No hay archivos que perfilar.")
+        return 1
+
+    _, rows = profile_files(files, args.use_cache, not args.no_memory, args.cprofile)
+    print_report(rows, args.sort, args.top)
+    write_report(rows, args.report, args.sort)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
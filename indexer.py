@@ -0,0 +1,229 @@
+"""
+Indexacion del corpus desde la linea de comandos, sin la app (p. ej. desde cron
+en el servidor, en vez de dentro de una sesion de Streamlit).
+
+Subcomandos:
+    full         Reindexa todo el corpus en una coleccion nueva y la activa al
+                 terminar (las consultas siguen usando la actual mientras tanto)
+    incremental  Solo los archivos nuevos, modificados o borrados desde la
+                 ultima indexacion (segun chroma_db/corpus_manifest.json)
+    file         Un archivo: reemplaza sus chunks (los de la misma
+                 categoria y nombre). Si esta en corpus/<categoria>/ queda
+                 ademas en el manifiesto
+    category     Borra y reindexa una o mas categorias
+    compact      Quita de chunk_store los textos que ya no usa ninguna
+                 coleccion (tambien se hace solo tras un reindexado completo)
+
+Uso:
+    python -m indexer full --workers 4
+    python -m indexer incremental --dry-run
+    python -m indexer file "corpus/campo_electrico/campo electrico sears.pdf"
+    python -m indexer file ~/Descargas/pauta.pdf --category campo_magnetico
+    python -m indexer category corriente_alterna --no-ocr
+    python -m indexer full --profile index_profile.csv --no-cache
+    python -m indexer compact
+
+Opciones comunes: --workers (procesos de extraccion), --batch-size (chunks
+por lote de embeddings), --no-ocr (omite PDFs escaneados e imagenes; se
+indexan en una corrida posterior con OCR), --no-cache (no reusar la cache
+de chunks), --dry-run (solo muestra que se procesaria) y --profile (perfil
+por archivo, ver index_profile.py; extrae en un solo proceso).
+"""
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from rag_system import (CATEGORIES, CORPUS_PATH, RETIRED_COLLECTION_GRACE, RETRIEVAL_SERVICE_URL,
+                        ElectromagnetismRAG, compact_chunk_store, drop_retired_collections)
+
+
+def _category_of(path: str, corpus_path: str) -> Optional[str]:
+    """Categoria de un archivo que esta en corpus/<categoria>/, o None."""
+    folder = os.path.dirname(os.path.abspath(path))
+    if os.path.dirname(folder) == os.path.abspath(corpus_path) and os.path.basename(folder) in CATEGORIES:
+        return os.path.basename(folder)
+    return None
+
+
+def _print_plan(title: str, files: List[Tuple[str, str]], deleted: Optional[List[str]] = None):
+    print(f"{title}: {len(files)} archivos" + (f", {len(deleted)} borrados" if deleted else ""))
+    for path, category in files:
+        print(f"  + {category}/{os.path.basename(path)}")
+    for key in deleted or []:
+        print(f"  - {key}")
+
+
+class _Extractor:
+    """Extraccion de chunks para rag_system: ingest.process_files o, con --profile, index_profile."""
+
+    def __init__(self, workers: int, use_cache: bool, profile: Optional[str], cprofile: Optional[str]):
+        self.workers = workers
+        self.use_cache = use_cache
+        self.profile = profile
+        self.rows: List[Dict] = []
+        self.cprofile = cprofile
+        self.profiler = None
+        if profile and cprofile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    def __call__(self, files: List[Tuple[str, str]]) -> List[Dict]:
+        if not self.profile:
+            from ingest import process_files
+            return process_files(files, self.workers, self.use_cache)
+
+        from index_profile import profile_files
+        # Un solo perfil de cProfile para todas las llamadas (una por categoria)
+        if self.profiler:
+            self.profiler.enable()
+        try:
+            chunks, rows = profile_files(files, self.use_cache)
+        finally:
+            if self.profiler:
+                self.profiler.disable()
+        self.rows.extend(rows)
+        return chunks
+
+    def report(self, sort_by: str = "wall_s"):
+        if self.profile and self.rows:
+            from index_profile import print_report, write_report
+            print_report(self.rows, sort_by)
+            write_report(self.rows, self.profile, sort_by)
+        if self.profiler:
+            self.profiler.dump_stats(self.cprofile)
+            print(f"Perfil de cProfile en {self.cprofile} (snakeviz {self.cprofile})")
+
+
+def run(args) -> int:
+    from ingest import INGEST_WORKERS, list_category_files
+
+    if args.command == "compact":
+        if compact_chunk_store(args.persist_directory) is None:
+            print("chunk_store no esta activo en esta carpeta o usa CHUNK_STORE_DIR; no se compacto")
+        return 0
+
+    if args.no_ocr:
+        import pdf_processor
+        pdf_processor.OCR_ENABLED = False
+        # Los procesos de extraccion que se inician con spawn leen la variable
+        os.environ["OCR_ENABLED"] = "0"
+    workers = args.workers or INGEST_WORKERS
+    if args.profile and workers > 1:
+        print("Con --profile la extraccion corre en un solo proceso")
+    extract = _Extractor(workers, not args.no_cache, args.profile, args.cprofile)
+
+    if args.command == "file":
+        missing = [path for path in args.paths if not os.path.isfile(path)]
+        if missing:
+            print(f"Error: No se encontro el archivo: {missing[0]}")
+            return 1
+        in_corpus = [(path, _category_of(path, args.corpus)) for path in args.paths]
+        if args.category and args.category not in CATEGORIES:
+            print(f"Error: categoria desconocida {args.category} (opciones: {', '.join(CATEGORIES)})")
+            return 1
+        if any(category is None for _, category in in_corpus) and not args.category:
+            print("Error: el archivo no esta en corpus/<categoria>/; indicar --category")
+            return 1
+
+    rag = ElectromagnetismRAG(args.persist_directory, require_llm=False)
+    if args.batch_size:
+        rag.batch_size = args.batch_size
+
+    if args.command == "full":
+        if args.dry_run:
+            files = [(path, category) for category in CATEGORIES
+                     if os.path.isdir(os.path.join(args.corpus, category))
+                     for path in list_category_files(os.path.join(args.corpus, category))]
+            _print_plan(f"Reindexado completo (reemplaza {rag.collection.count()} fragmentos)", files)
+            return 0
+        reindexed = rag.clear_and_reindex(args.corpus, extract=extract)
+
+    elif args.command == "incremental":
+        changed, deleted = rag.corpus_changes(args.corpus, args.categories)
+        if args.dry_run or not (changed or deleted):
+            _print_plan("Cambios desde la ultima indexacion", changed, deleted)
+            return 0
+        result = rag.sync_files(changed, deleted, args.corpus, extract=extract)
+        print(f"{result['files']} archivos: {result['removed']} fragmentos borrados, {result['added']} agregados")
+
+    elif args.command == "file":
+        # Todos reemplazan los chunks con su misma categoria y nombre; solo los
+        # del corpus quedan en el manifiesto (incremental no toca los de fuera)
+        corpus_files = [(path, category) for path, category in in_corpus
+                        if category is not None and (args.category in (None, category))]
+        outside = [(path, args.category) for path, category in in_corpus if (path, category) not in corpus_files]
+        if args.dry_run:
+            _print_plan("Archivos del corpus (se reemplazan)", corpus_files)
+            _print_plan("Archivos externos (se reemplazan)", outside)
+            return 0
+        if corpus_files:
+            result = rag.sync_files(corpus_files, [], args.corpus, extract=extract)
+            print(f"{result['removed']} fragmentos reemplazados por {result['added']}")
+        if outside:
+            result = rag.replace_files(outside, extract=extract)
+            print(f"{result['removed']} fragmentos reemplazados por {result['added']}")
+
+    elif args.command == "category":
+        unknown = [category for category in args.names if category not in CATEGORIES]
+        if unknown:
+            print(f"Error: categoria desconocida {unknown[0]} (opciones: {', '.join(CATEGORIES)})")
+            return 1
+        if args.dry_run:
+            files = [(path, category) for category in args.names
+                     if os.path.isdir(os.path.join(args.corpus, category))
+                     for path in list_category_files(os.path.join(args.corpus, category))]
+            _print_plan("Reindexado de " + ", ".join(args.names), files)
+            return 0
+        removed = rag.reindex_categories(args.names, args.corpus, extract=extract)
+        print(f"{removed} fragmentos anteriores reemplazados")
+
+    extract.report()
+    print(f"Total en coleccion: {rag.collection.count()}")
+    if args.command == "full" and reindexed and not RETRIEVAL_SERVICE_URL:
+        # Con el servicio de recuperacion, el servicio borra la coleccion anterior
+        print(f"Esperando {RETIRED_COLLECTION_GRACE:g} s para borrar la coleccion anterior mientras la app "
+              "pasa a la nueva (con Ctrl+C se borra en el proximo reindexado)...")
+        try:
+            time.sleep(RETIRED_COLLECTION_GRACE)
+        except KeyboardInterrupt:
+            return 0
+        drop_retired_collections(args.persist_directory)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--corpus", default=CORPUS_PATH, help="Carpeta raiz del corpus")
+    common.add_argument("--persist-directory", default="./chroma_db")
+    common.add_argument("--workers", type=int, help="Procesos de extraccion (por defecto INGEST_WORKERS)")
+    common.add_argument("--batch-size", type=int, help="Chunks por lote de embeddings (por defecto INDEX_BATCH_SIZE)")
+    common.add_argument("--no-ocr", action="store_true", help="Omitir PDFs escaneados e imagenes")
+    common.add_argument("--no-cache", action="store_true", help="No reusar la cache de chunks")
+    common.add_argument("--dry-run", action="store_true", help="Mostrar que se procesaria sin indexar")
+    common.add_argument("--profile", metavar="REPORTE", help="Perfil por archivo en REPORTE (.csv o .json)")
+    common.add_argument("--cprofile", metavar="ARCHIVO", help="Con --profile, guardar un perfil de cProfile")
+
+    parser = argparse.ArgumentParser(description="Indexacion del corpus sin la app")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("full", parents=[common], help="Reindexar todo el corpus")
+    incremental = commands.add_parser("incremental", parents=[common], help="Solo archivos nuevos, modificados o borrados")
+    incremental.add_argument("--category", dest="categories", action="append", choices=list(CATEGORIES),
+                             help="Revisar solo esta categoria (se puede repetir)")
+    single = commands.add_parser("file", parents=[common], help="Indexar uno o mas archivos")
+    single.add_argument("paths", nargs="+")
+    single.add_argument("--category", help="Categoria de los archivos que no estan en corpus/<categoria>/")
+    category = commands.add_parser("category", parents=[common], help="Reindexar categorias")
+    category.add_argument("names", nargs="+", metavar="categoria")
+    compact = commands.add_parser("compact", help="Quitar de chunk_store los textos sin uso")
+    compact.add_argument("--persist-directory", default="./chroma_db")
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
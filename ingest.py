@@ -0,0 +1,237 @@
+"""
+Pipeline de ingesta del corpus: extractores por tipo de archivo, cache de
+chunks por hash de contenido y procesamiento en paralelo.
+
+Cada extractor recibe (ruta, categoria) y retorna chunks en el formato de
+chunker. El resultado se guarda en CHUNK_CACHE_DIR con la huella SHA-256 del
+archivo como clave, asi reindexar solo vuelve a extraer (y a pasar por OCR)
+los archivos que cambiaron.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from chunker import CHUNK_OVERLAP_TOKENS, MAX_CHILD_CHARS, MAX_CHILD_TOKENS, chunk_document
+from math_normalize import MATH_NORMALIZE, normalize_chunks
+from tracing import span
+
+CHUNK_CACHE_DIR = os.getenv("CHUNK_CACHE_DIR", "./.chunk_cache")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+
+# Subir al cambiar cualquier extractor o el formato de los chunks
+CACHE_VERSION = 4
+
+# Una imagen con menos texto reconocido que esto (logos, diagramas) se omite
+IMAGE_MIN_CHARS = 40
+
+
+class FileSkipped(Exception):
+    """El extractor omite el archivo a proposito (p. ej. una imagen sin texto)."""
+
+
+def _extract_tex(path: str, category: str) -> List[Dict]:
+    from tex_processor import extract_chunks_from_tex
+    return extract_chunks_from_tex(path, category)
+
+
+def _extract_pdf(path: str, category: str) -> List[Dict]:
+    from pdf_processor import process_pdf_to_chunks
+    return process_pdf_to_chunks(path, category)
+
+
+def _extract_docx(path: str, category: str) -> List[Dict]:
+    from docx_processor import process_docx_to_chunks
+    return process_docx_to_chunks(path, category)
+
+
+def _extract_image(path: str, category: str) -> List[Dict]:
+    from pdf_processor import ocr_available, ocr_image
+
+    if not ocr_available():
+        print(f"    Advertencia: OCR no disponible, se omite {os.path.basename(path)}")
+        return []
+    text = ocr_image(path)
+    if len(text.strip()) < IMAGE_MIN_CHARS:
+        raise FileSkipped("imagen sin texto")
+    return chunk_document(text, os.path.basename(path), category, "image")
+
+
+# Extension -> (nombre para los mensajes, extractor)
+EXTRACTORS: Dict[str, Tuple[str, Callable[[str, str], List[Dict]]]] = {
+    ".tex": ("LaTeX", _extract_tex),
+    ".pdf": ("PDF", _extract_pdf),
+    ".docx": ("DOCX", _extract_docx),
+    ".png": ("imagen", _extract_image),
+    ".jpg": ("imagen", _extract_image),
+    ".jpeg": ("imagen", _extract_image),
+}
+
+
+def is_supported(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in EXTRACTORS
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 del contenido del archivo, leido por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(digest: str, extension: str) -> str:
+    settings = (f"{CACHE_VERSION}:{extension}:{MAX_CHILD_CHARS}:{MAX_CHILD_TOKENS}:{CHUNK_OVERLAP_TOKENS}:"
+                f"{MATH_NORMALIZE}")
+    key = hashlib.sha256(f"{digest}:{settings}".encode()).hexdigest()
+    return os.path.join(CHUNK_CACHE_DIR, key[:2], key + ".json")
+
+
+def _load_cached(path: str) -> Optional[List[Dict]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store_cached(path: str, chunks: List[Dict]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def process_file(path: str, category: str, use_cache: bool = True) -> List[Dict]:
+    """
+    Extrae los chunks de un archivo con el extractor de su extension.
+
+    Args:
+        path: Ruta al archivo
+        category: Categoria tematica (carpeta de origen)
+        use_cache: Reusar los chunks guardados si el contenido no cambio
+
+    Returns:
+        Lista de chunks (vacia si la extension no esta soportada)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTRACTORS:
+        return []
+    kind, extractor = EXTRACTORS[extension]
+    filename = os.path.basename(path)
+
+    with span("extract", file=filename, file_type=extension[1:]) as trace:
+        cache_path = _cache_path(file_digest(path), extension) if use_cache else None
+        if cache_path:
+            cached = _load_cached(cache_path)
+            if cached is not None:
+                print(f"    En cache ({kind}): {filename}")
+                # El mismo contenido puede estar con otro nombre o en otra categoria
+                for chunk in cached:
+                    chunk["source"] = filename
+                    chunk["category"] = category
+                trace.set(cache="hit", chunks=len(cached))
+                return cached
+
+        print(f"    Procesando {kind}: {filename}")
+        try:
+            # Misma notacion matematica para .tex, .pdf y .docx (ver math_normalize)
+            chunks = normalize_chunks(extractor(path, category))
+        except FileSkipped as e:
+            print(f"    Se omite {filename}: {e}")
+            # La lista vacia en cache marca la omision (ver is_skipped)
+            if cache_path:
+                _store_cached(cache_path, [])
+            trace.set(skipped=str(e))
+            return []
+        # Un resultado vacio puede deberse a que falta OCR: no se guarda
+        if cache_path and chunks:
+            _store_cached(cache_path, chunks)
+        trace.set(chunks=len(chunks))
+        if cache_path:
+            trace.set(cache="miss")
+        return chunks
+
+
+def is_skipped(path: str) -> bool:
+    """True si el extractor omitio a proposito este contenido (y no por un error o por falta de OCR)."""
+    return _load_cached(_cache_path(file_digest(path), os.path.splitext(path)[1].lower())) == []
+
+
+def _process_file_safe(args: Tuple[str, str, bool]) -> List[Dict]:
+    path, category, use_cache = args
+    try:
+        return process_file(path, category, use_cache)
+    except Exception as e:
+        print(f"    Error procesando {os.path.basename(path)}: {e}")
+        return []
+
+
+def list_category_files(category_path: str) -> List[str]:
+    """Archivos soportados de una carpeta de categoria, en orden estable."""
+    return [
+        os.path.join(category_path, name)
+        for name in sorted(os.listdir(category_path))
+        if not name.startswith(".") and is_supported(name)
+        and os.path.isfile(os.path.join(category_path, name))
+    ]
+
+
+def process_files(files: List[Tuple[str, str]], workers: int = INGEST_WORKERS,
+                  use_cache: bool = True) -> List[Dict]:
+    """
+    Procesa varios archivos, en paralelo si workers > 1.
+
+    Args:
+        files: Pares (ruta, categoria)
+        workers: Numero de procesos (la extraccion de PDF y el OCR usan CPU)
+        use_cache: Reusar los chunks guardados de archivos sin cambios
+
+    Returns:
+        Chunks de todos los archivos, en el mismo orden que files
+    """
+    jobs = [(path, category, use_cache) for path, category in files]
+    if workers <= 1 or len(jobs) <= 1:
+        results = [_process_file_safe(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_process_file_safe, jobs))
+    return [chunk for chunks in results for chunk in chunks]
+
+
+def manifest_key(path: str, category: str) -> str:
+    """Clave de un archivo en el manifiesto: "categoria/nombre" (como source + category en ChromaDB)."""
+    return f"{category}/{os.path.basename(path)}"
+
+
+def load_manifest(path: str) -> Dict[str, str]:
+    """
+    Manifiesto de archivos ya indexados: {"categoria/nombre": huella SHA-256}.
+    Un manifiesto que no existe o esta danado se lee vacio.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path: str, manifest: Dict[str, str]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def process_category(category_path: str, category_name: str, workers: int = INGEST_WORKERS,
+                     use_cache: bool = True) -> List[Dict]:
+    """Procesa todos los archivos soportados de una carpeta de categoria."""
+    if not os.path.exists(category_path):
+        print(f"  Carpeta no existe: {category_path}")
+        return []
+    files = [(path, category_name) for path in list_category_files(category_path)]
+    return process_files(files, workers, use_cache)
@@ -0,0 +1,454 @@
+"""
+Cola de trabajos persistente (SQLite) para subidas y reindexacion.
+
+La extraccion de PDFs (incluido OCR) y la generacion de embeddings se
+ejecutan en procesos worker separados, de modo que la ingesta pesada no
+bloquea la sesion de Streamlit ni compite con la latencia del chat.
+
+Uso:
+    python job_queue.py worker              # un worker
+    python job_queue.py worker --workers 2  # varios procesos worker
+    python job_queue.py list                # ver trabajos recientes
+    python job_queue.py cancel 12           # cancelar un trabajo
+    python job_queue.py retry 12            # reintentar un trabajo fallido
+"""
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import closing
+from typing import Dict, List, Optional
+
+JOBS_DB = os.getenv("JOBS_DB", "./jobs.db")
+UPLOADS_DIR = os.getenv("UPLOADS_DIR", "./uploads")
+# Salida (y tracebacks) del worker que lanza ensure_worker
+WORKER_LOG = os.getenv("WORKER_LOG", "./worker.log")
+# Un trabajo que ya dejo muerto a su worker estas veces (p. ej. un OCR sin
+# memoria) pasa a fallido en vez de volver a la cola
+MAX_JOB_ATTEMPTS = int(os.getenv("MAX_JOB_ATTEMPTS", "3"))
+
+# Un worker sin latido durante este tiempo se considera muerto y sus
+# trabajos en ejecucion vuelven a la cola.
+WORKER_TIMEOUT = 60
+HEARTBEAT_INTERVAL = 10
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT NOT NULL DEFAULT '',
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class JobCancelled(Exception):
+    """Se lanza dentro de un trabajo cuando se solicito su cancelacion."""
+
+
+class JobQueue:
+    """Cola de trabajos respaldada por SQLite, segura entre procesos."""
+
+    def __init__(self, db_path: str = JOBS_DB):
+        self.db_path = db_path
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "attempts" not in columns:
+                # Bases creadas antes de limitar los intentos
+                conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self) -> sqlite3.Connection:
+        # El context manager de sqlite3 solo confirma la transaccion: se usa con closing()
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def enqueue(self, kind: str, payload: Dict) -> int:
+        """Agrega un trabajo a la cola y retorna su ID."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (kind, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), STATUS_QUEUED, now, now)
+            )
+            return cur.lastrowid
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_job(r) for r in rows]
+
+    def pending_count(self) -> int:
+        """Numero de trabajos en cola o en ejecucion."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (STATUS_QUEUED, STATUS_RUNNING)
+            ).fetchone()
+        return row[0]
+
+    def request_cancel(self, job_id: int) -> bool:
+        """
+        Solicita cancelar un trabajo. Los trabajos en cola se cancelan de
+        inmediato; los que estan corriendo se detienen en su proximo reporte
+        de progreso.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, message = 'Cancelado', updated_at = ? WHERE id = ? AND status = ?",
+                (STATUS_CANCELLED, now, job_id, STATUS_QUEUED)
+            )
+            if cur.rowcount:
+                return True
+            cur = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = ?",
+                (now, job_id, STATUS_RUNNING)
+            )
+            return bool(cur.rowcount)
+
+    def retry(self, job_id: int) -> bool:
+        """Devuelve a la cola un trabajo fallido (p. ej. tras instalar Tesseract)."""
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, progress = 0, message = '', cancel_requested = 0, attempts = 0, "
+                "worker_id = NULL, updated_at = ? WHERE id = ? AND status = ?",
+                (STATUS_QUEUED, time.time(), job_id, STATUS_FAILED)
+            )
+            return bool(cur.rowcount)
+
+    def claim_next(self, worker_id: str) -> Optional[Dict]:
+        """
+        Toma atomicamente el trabajo mas antiguo en cola. Los trabajos de
+        workers muertos vuelven a la cola, salvo los que ya se intentaron
+        MAX_JOB_ATTEMPTS veces, que pasan a fallidos.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            dead = "status = ? AND worker_id NOT IN (SELECT worker_id FROM workers WHERE last_seen > ?)"
+            conn.execute(
+                f"UPDATE jobs SET status = ?, worker_id = NULL, message = ?, updated_at = ? "
+                f"WHERE {dead} AND attempts >= ?",
+                (STATUS_FAILED, f"El worker termino inesperadamente en {MAX_JOB_ATTEMPTS} intentos", now,
+                 STATUS_RUNNING, now - WORKER_TIMEOUT, MAX_JOB_ATTEMPTS)
+            )
+            conn.execute(
+                f"UPDATE jobs SET status = ?, worker_id = NULL, updated_at = ? WHERE {dead}",
+                (STATUS_QUEUED, now, STATUS_RUNNING, now - WORKER_TIMEOUT)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (STATUS_RUNNING, worker_id, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        job = self._row_to_job(row)
+        job["status"] = STATUS_RUNNING
+        job["attempts"] += 1
+        return job
+
+    def update_progress(self, job_id: int, progress: float, message: str = ""):
+        """Actualiza el avance de un trabajo. Lanza JobCancelled si se pidio cancelarlo."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, message = ?, updated_at = ? WHERE id = ?",
+                (max(0.0, min(progress, 1.0)), message, time.time(), job_id)
+            )
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row and row[0]:
+            raise JobCancelled(f"Trabajo {job_id} cancelado")
+
+    def finish(self, job_id: int, status: str, message: str = ""):
+        progress = 1.0 if status == STATUS_DONE else None
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, message = ?, progress = COALESCE(?, progress), updated_at = ? WHERE id = ?",
+                (status, message, progress, time.time(), job_id)
+            )
+
+    def heartbeat(self, worker_id: str):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, pid, last_seen) VALUES (?, ?, ?)",
+                (worker_id, os.getpid(), time.time())
+            )
+
+    def remove_worker(self, worker_id: str):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def live_workers(self) -> int:
+        with closing(self._connect()) as conn:
+            return self._live_workers(conn)
+
+    @staticmethod
+    def _live_workers(conn: sqlite3.Connection) -> int:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM workers WHERE last_seen > ?", (time.time() - WORKER_TIMEOUT,)
+        ).fetchone()
+        return row[0]
+
+    def spawn_worker_if_none(self, spawn) -> bool:
+        """
+        Llama a spawn() si no hay ningun worker vivo. La comprobacion y el
+        registro del worker nuevo ocurren en una misma transaccion
+        (BEGIN IMMEDIATE): dos sesiones que llegan juntas no lanzan dos.
+
+        Args:
+            spawn: Funcion que lanza el worker y retorna su PID
+
+        Returns:
+            True si se lanzo un worker
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if self._live_workers(conn) > 0:
+                conn.execute("COMMIT")
+                return False
+            pid = spawn()
+            # Mismo ID que usara el worker en sus latidos (ver run_worker)
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, pid, last_seen) VALUES (?, ?, ?)",
+                (f"{socket.gethostname()}:{pid}", pid, time.time())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return True
+
+
+def save_upload(filename: str, data: bytes) -> str:
+    """Guarda un archivo subido en UPLOADS_DIR para que lo procese un worker."""
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    safe_name = os.path.basename(filename)
+    path = os.path.join(UPLOADS_DIR, f"{int(time.time() * 1000)}_{safe_name}")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _run_upload_job(rag, queue: JobQueue, job: Dict) -> str:
+    payload = job["payload"]
+    path = payload["path"]
+    filename = payload["filename"]
+    category = payload["category"]
+    done = False
+    try:
+        queue.update_progress(job["id"], 0.1, f"Extrayendo texto de {filename}")
+        from ingest import process_file
+        chunks = process_file(path, category)
+
+        if not chunks:
+            done = True
+            return "No se pudo extraer contenido del archivo."
+
+        queue.update_progress(job["id"], 0.6, f"Generando embeddings de {len(chunks)} fragmentos")
+        added = rag.add_chunks(chunks, source=filename)
+        done = True
+        return f"Se agregaron {added} fragmentos al corpus."
+    except JobCancelled:
+        done = True
+        raise
+    finally:
+        # Si fallo, el archivo se conserva para "python job_queue.py retry <id>"
+        if done and os.path.exists(path):
+            os.unlink(path)
+
+
+def _run_reindex_job(rag, queue: JobQueue, job: Dict) -> str:
+    corpus_path = job["payload"].get("corpus_path", "./corpus")
+
+    def progress(fraction: float, message: str):
+        queue.update_progress(job["id"], fraction, message)
+
+    rag.clear_and_reindex(corpus_path, progress_callback=progress)
+    return f"Corpus reindexado ({rag.get_collection_stats()['total_problems']} fragmentos)."
+
+
+JOB_HANDLERS = {
+    "upload": _run_upload_job,
+    "reindex": _run_reindex_job,
+}
+
+
+def run_worker(db_path: str = JOBS_DB, poll_interval: float = 1.0, once: bool = False):
+    """
+    Bucle principal de un worker: toma trabajos de la cola y los ejecuta.
+
+    Args:
+        db_path: Ruta a la base de datos de la cola
+        poll_interval: Segundos de espera cuando la cola esta vacia
+        once: Si True, termina cuando la cola queda vacia
+    """
+    from dotenv import load_dotenv
+    from rag_system import ElectromagnetismRAG
+
+    load_dotenv()
+    queue = JobQueue(db_path)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    rag = ElectromagnetismRAG(require_llm=False)
+    print(f"Worker {worker_id} esperando trabajos en {db_path}...")
+
+    # Latido en un hilo aparte: un OCR largo no debe hacer parecer muerto al worker
+    stop = threading.Event()
+
+    def beat():
+        while not stop.is_set():
+            queue.heartbeat(worker_id)
+            stop.wait(HEARTBEAT_INTERVAL)
+
+    queue.heartbeat(worker_id)
+    threading.Thread(target=beat, daemon=True).start()
+
+    try:
+        while True:
+            job = queue.claim_next(worker_id)
+            if job is None:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            print(f"  Trabajo {job['id']} ({job['kind']})")
+            handler = JOB_HANDLERS.get(job["kind"])
+            try:
+                if handler is None:
+                    raise ValueError(f"Tipo de trabajo desconocido: {job['kind']}")
+                message = handler(rag, queue, job)
+                queue.finish(job["id"], STATUS_DONE, message)
+            except JobCancelled:
+                queue.finish(job["id"], STATUS_CANCELLED, "Cancelado")
+            except Exception as e:
+                print(f"    Error en trabajo {job['id']}: {e}")
+                queue.finish(job["id"], STATUS_FAILED, str(e))
+    finally:
+        stop.set()
+        queue.remove_worker(worker_id)
+
+
+def ensure_worker(db_path: str = JOBS_DB) -> bool:
+    """
+    Lanza un worker en segundo plano si no hay ninguno vivo; su salida va
+    a WORKER_LOG. En produccion los workers deberian correr como servicio
+    systemd.
+
+    Returns:
+        True si se lanzo un nuevo worker
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    def spawn() -> int:
+        with open(os.path.join(directory, WORKER_LOG), "ab") as log:
+            process = subprocess.Popen(
+                # --db es del parser principal: va antes del subcomando
+                [sys.executable, "-u", os.path.abspath(__file__), "--db", os.path.abspath(db_path), "worker"],
+                cwd=directory,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        return process.pid
+
+    return JobQueue(db_path).spawn_worker_if_none(spawn)
+
+
+def main() -> int:
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description="Cola de trabajos de ingesta")
+    parser.add_argument("--db", default=JOBS_DB, help="Base de datos de la cola")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    worker = sub.add_parser("worker", help="Ejecutar workers")
+    worker.add_argument("--workers", type=int, default=1, help="Numero de procesos worker")
+    worker.add_argument("--once", action="store_true", help="Terminar cuando la cola quede vacia")
+    sub.add_parser("list", help="Listar trabajos recientes")
+    cancel = sub.add_parser("cancel", help="Cancelar un trabajo")
+    cancel.add_argument("job_id", type=int)
+    retry = sub.add_parser("retry", help="Reintentar un trabajo fallido")
+    retry.add_argument("job_id", type=int)
+
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        if args.workers <= 1:
+            run_worker(args.db, once=args.once)
+            return 0
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(args.db,), kwargs={"once": args.once})
+            for _ in range(args.workers)
+        ]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+    elif args.command == "list":
+        for job in JobQueue(args.db).list_jobs():
+            print(f"{job['id']:5d} {job['kind']:8s} {job['status']:10s} {job['progress'] * 100:5.0f}% {job['message']}")
+    elif args.command == "cancel":
+        if not JobQueue(args.db).request_cancel(args.job_id):
+            print(f"El trabajo {args.job_id} no esta en cola ni en ejecucion")
+            return 1
+    elif args.command == "retry":
+        if not JobQueue(args.db).retry(args.job_id):
+            print(f"El trabajo {args.job_id} no esta fallido")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
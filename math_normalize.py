@@ -0,0 +1,304 @@
+"""
+Normalizacion de notacion matematica para embeddings, documentos y consultas.
+
+clean_latex deja las ecuaciones en LaTeX crudo (\\frac{q}{4\\pi\\varepsilon_0 r^{2}},
+\\vec{F}_{31}), el texto de los PDF trae simbolos unicode (ε₀, 10⁻⁹, ﬁ, ×) y
+acentos separados de su letra, y el de los .docx simbolos matematicos
+alfanumericos (𝝁) y subindices con espacios (ε_{0 }).
+Todos se llevan a una misma forma compacta:
+
+    \\varepsilon_0, \\epsilon_{0}, ε₀   ->  epsilon0
+    \\frac{kq}{r^{2}}                 ->  kq/r^2
+    \\frac{1}{4\\pi\\epsilon_0}       ->  1/(4 pi epsilon0)
+    \\vec{F}_{31}                     ->  vec F31
+    \\hat{\\imath}, î                  ->  i hat
+    9\\times10^{9}, 9×10⁹             ->  9*10^9
+    \\int_0^{\\infty}, ∫_0^∞          ->  int_0^inf
+    Diel´ectrica, esta´, 0,5ˆı, 𝝁     ->  Dieléctrica, está, 0,5 i hat, mu
+
+Un comando expandido a letras queda separado por espacios de las letras
+y cifras vecinas, y un denominador de mas de un factor va entre parentesis.
+
+Asi un mismo problema en .tex, .pdf o escrito en la pregunta del alumno
+queda igual, y los documentos, prompts y embeddings usan menos tokens.
+Cada texto se resuelve con pocas pasadas de una sola expresion regular
+(una por nivel de llaves). Los lotes se deduplican y pasan por una cache,
+ya que los mismos chunks y consultas se repiten al reindexar y al consultar.
+"""
+import os
+import re
+import unicodedata
+from typing import Dict, List
+
+MATH_NORMALIZE = os.getenv("MATH_NORMALIZE", "1") == "1"
+
+_GREEK = {
+    "alpha": "α", "beta": "β", "gamma": "γ", "delta": "δ", "epsilon": "εϵ", "zeta": "ζ", "eta": "η",
+    "theta": "θϑ", "iota": "ι", "kappa": "κ", "lambda": "λ", "mu": "μµ", "nu": "ν", "xi": "ξ",
+    "pi": "π", "rho": "ρ", "sigma": "σς", "tau": "τ", "upsilon": "υ", "phi": "φϕ", "chi": "χ",
+    "psi": "ψ", "omega": "ω", "Gamma": "Γ", "Delta": "Δ", "Theta": "Θ", "Lambda": "Λ", "Xi": "Ξ",
+    "Pi": "Π", "Sigma": "Σ", "Phi": "Φ", "Psi": "Ψ", "Omega": "Ω\u2126",
+}
+
+# Simbolos unicode -> forma canonica (texto de PDF y de las preguntas)
+_UNICODE = {
+    "−": "-", "–": "-", "×": "*", "·": "*", "⋅": "*", "∗": "*", "÷": "/", "∫": "int", "∮": "oint",
+    "∑": "sum", "∂": "d", "∇": "nabla", "∞": "inf", "≈": "~", "≤": "<=", "≥": ">=", "≠": "!=",
+    "±": "+-", "→": "->", "⇒": "=>", "⟹": "=>", "√": "sqrt", "∝": " prop ", "⊥": " perp ", "∥": "||",
+    "î": "i hat", "ĵ": "j hat", "ı": "i", "ȷ": "j", "◦": "°", "∆": "Delta", "⁄": "/",
+    "\u00a0": " ", "\u2009": " ", "\u202f": " ", "\u200b": "",
+}
+for _name, _chars in _GREEK.items():
+    for _char in _chars:
+        _UNICODE[_char] = _name
+
+_SUPERSCRIPT_CHARS = "⁰¹²³⁴⁵⁶⁷⁸⁹⁻⁺"
+_SUBSCRIPT_CHARS = "₀₁₂₃₄₅₆₇₈₉"
+_SUPERSCRIPTS = str.maketrans(_SUPERSCRIPT_CHARS, "0123456789-+")
+_SUBSCRIPTS = str.maketrans(_SUBSCRIPT_CHARS, "0123456789")
+
+
+class _UnicodeTable(dict):
+    """
+    Tabla de str.translate: _UNICODE y, para el resto de los caracteres no
+    ASCII, su forma NFKC (𝝁 -> mu, ℓ -> l, … -> ..., ﬁ -> fi), calculada la
+    primera vez que aparecen. NFKC se aplica caracter a caracter y no al
+    texto completo, porque compondria F + flecha o y + sombrero y convertiria
+    los exponentes en cifras sueltas (10⁻⁹ -> 10-9); esos quedan para
+    _TOKEN_RE.
+    """
+
+    def __missing__(self, code: int) -> str:
+        char = chr(code)
+        folded = unicodedata.normalize("NFKC", char) if code > 0x7F else char
+        if folded == char or folded.startswith(" ") or char in _SUPERSCRIPT_CHARS + _SUBSCRIPT_CHARS:
+            # Acentos sueltos (´, ˜) y exponentes: se resuelven aparte
+            self[code] = char
+        else:
+            self[code] = folded.translate(self)
+        return self[code]
+
+
+_UNICODE_TABLE = _UnicodeTable(str.maketrans(_UNICODE))
+# Caracteres de uso privado (fuentes Symbol de algunos PDF): no son texto
+_UNICODE_TABLE.update({code: None for code in range(0xE000, 0xF900)})
+
+# Acentos que pdfplumber separa de su letra (Diel´ectrica, esta´, ˆı, ȷˆ): el
+# acento va antes de la letra, o despues si lo que sigue no es otra vocal
+_SPACING_ACCENTS = {"´": "\u0301", "˜": "\u0303", "¨": "\u0308", "ˆ": "\u0302"}
+_SPACING_ACCENT_RE = re.compile(
+    r"(´)([aeiouAEIOUı])|(˜)([nN])|(¨)([uU])|(ˆ)([A-Za-zıȷ])"
+    r"|([aeiouAEIOU])(´)(?![aeiouAEIOUı])|([nN])(˜)(?![nN])|([uU])(¨)|([A-Za-zıȷ])(ˆ)(?![A-Za-zıȷ])"
+)
+# Acentos combinantes sobre una letra del PDF (F + flecha, k + sombrero)
+_COMBINING = {"\u20d7": ("vec", ""), "\u0302": ("", "hat"), "\u0304": ("", "bar")}
+
+# Comandos sin argumentos
+_SYMBOLS = {
+    "times": "*", "cdot": "*", "div": "/", "pm": "+-", "mp": "-+", "approx": "~", "simeq": "~",
+    "sim": "~", "equiv": "==", "leq": "<=", "le": "<=", "geq": ">=", "ge": ">=", "neq": "!=",
+    "ne": "!=", "ll": "<<", "gg": ">>", "to": "->", "rightarrow": "->", "leftarrow": "<-",
+    "Rightarrow": "=>", "Longrightarrow": "=>", "implies": "=>", "leftrightarrow": "<->",
+    "infty": "inf", "partial": "d", "circ": "°", "degree": "°", "prime": "'", "imath": "i",
+    "jmath": "j", "ell": "l", "varepsilon": "epsilon", "eps": "epsilon", "vartheta": "theta",
+    "varphi": "phi", "varrho": "rho", "parallel": "||", "propto": " prop ", "ldots": "...",
+    "cdots": "...", "dots": "...", "ii": "i hat", "jj": "j hat", "kk": "k hat", "Vert": "||",
+    "lVert": "||", "rVert": "||", "vert": "|", "therefore": "=>", "checkmark": "", "bullet": "*",
+}
+# Comandos de espaciado, tamanio o formato: se eliminan
+_DROP = {
+    "left", "right", "big", "Big", "bigg", "Bigg", "bigl", "bigr", "Bigl", "Bigr", "biggl", "biggr",
+    "quad", "qquad", "displaystyle", "textstyle", "nonumber", "rm", "bf", "it", "Large", "large",
+    "small", "limits", "notag",
+}
+# Comandos de un argumento -> (prefijo, sufijo) alrededor del argumento; None = se elimina
+_UNARY = {
+    "vec": ("vec", ""), "hat": ("", "hat"), "bar": ("", "bar"), "overline": ("", "bar"),
+    "dot": ("", "dot"), "sqrt": ("sqrt(", ")"), "boxed": ("", ""), "text": ("", ""),
+    "mathrm": ("", ""), "mathbf": ("", ""), "mathit": ("", ""), "mathbb": ("", ""),
+    "mathcal": ("", ""), "boldsymbol": ("", ""), "textbf": ("", ""), "textit": ("", ""),
+    "operatorname": ("", ""), "mbox": ("", ""), "underbrace": ("", ""), "mathring": ("", ""),
+    "hspace": None, "phantom": None, "tag": None, "label": None,
+}
+# Comandos con argumentos: esperan a que sus llaves internas se resuelvan
+_WITH_ARGS = ["[dt]?frac", "textcolor", "cancelto"] + list(_UNARY)
+
+_ARG = r"\s*\{([^{}]*)\}"
+# Los limites de una integral o sumatoria no se pegan como subindice (int_0^inf)
+_NOT_LIMIT = r"_(?<!\bint_)(?<!\boint_)(?<!\bsum_)(?<!\bprod_)"
+_TOKEN_RE = re.compile(
+    r"\\[dt]?frac" + _ARG + _ARG                                          # 1, 2
+    + r"|\\(?:textcolor|cancelto)\{[^{}]*\}" + _ARG                       # 3
+    + r"|\\(" + "|".join(_UNARY) + r")(?![a-zA-Z])" + _ARG                # 4, 5
+    + r"|" + _NOT_LIMIT + r"\{\s*([A-Za-z0-9]{1,4})\s*\}"             # 6: subindice corto
+    + r"|" + _NOT_LIMIT + r"([A-Za-z0-9])(?![A-Za-z0-9])"                 # 7: subindice de un caracter
+    + r"|\^\{([^{}\\]{1,8})\}"                                            # 8: exponente
+    + r"|\{(?:(?<![a-zA-Z}]\{)|(?=[^\w{}\\\s]+\}))([^{}\\\s]*)\}"        # 9: llaves sin nada que agrupar, N{*}m
+    + r"|\\(?!(?:" + "|".join(_WITH_ARGS) + r")(?![a-zA-Z]))([a-zA-Z]+)"  # 10: otro comando
+    + r"|\\[,;:!> ]"                                                      # espacios de LaTeX
+    + r"|(\w)([\u20d7\u0302\u0304])"                                      # 11, 12: acentos combinantes
+    + r"|([⁰¹²³⁴⁵⁶⁷⁸⁹⁻⁺]+)"                                               # 13
+    + r"|([₀₁₂₃₄₅₆₇₈₉]+)"                                                 # 14
+    + r"|\\(vec|hat|bar|dot)\s*([A-Za-z0-9])(?![A-Za-z0-9])"              # 15, 16: \vec r, \vec 0
+)
+_SIMPLE_RE = re.compile(r"[\w.,^*']+")
+# Denominador de un solo factor: un numero o un simbolo, con exponente opcional
+_FACTOR_RE = re.compile(r"(?:\d+(?:[.,]\d+)?|[A-Za-z]+\d*'?)(?:\^[\w.]+)?")
+_SPACES_RE = re.compile(r"(?<=\S)[ \t]{2,}")
+_MAX_PASSES = 6
+
+# Textos ya normalizados (se vacia al llenarse)
+_CACHE_SIZE = 16384
+_cache: Dict[str, str] = {}
+
+
+def _fraction(numerator: str, denominator: str) -> str:
+    numerator = numerator.strip()
+    denominator = denominator.strip()
+    if not _SIMPLE_RE.fullmatch(numerator):
+        numerator = f"({numerator})"
+    if not _FACTOR_RE.fullmatch(denominator):
+        denominator = f"({denominator})"
+    return f"{numerator}/{denominator}"
+
+
+def _affix(prefix: str, body: str, suffix: str) -> str:
+    """vec + F -> "vec F", r + hat -> "r hat"; sqrt( + x + ) queda junto."""
+    if prefix[-1:].isalpha():
+        prefix += " "
+    if suffix[:1].isalpha():
+        suffix = " " + suffix
+    return prefix + body + suffix
+
+
+def _spaced(match: re.Match, expansion: str, before: str = "", after: str = "") -> str:
+    """
+    Separa con un espacio la expansion de un comando de las letras o cifras
+    vecinas (4\\pi\\epsilon_0 -> "4 pi epsilon0" y no "4piepsilon0").
+    before/after agregan otros vecinos que tambien se separan.
+    """
+    if not expansion:
+        return expansion
+    text, start, end = match.string, match.start(), match.end()
+    if start and (expansion[0].isalnum() or before) and (text[start - 1].isalnum() or text[start - 1] in before):
+        expansion = " " + expansion
+    if end < len(text) and (expansion[-1].isalnum() or after) and (text[end].isalnum() or text[end] in after):
+        expansion += " "
+    return expansion
+
+
+def _replace(match: re.Match) -> str:
+    group = match.lastindex
+    if group is None:
+        return " "
+    if group == 2:
+        # Dos fracciones seguidas no se pegan: 1/(4 pi epsilon0) (q1 q2)/r^2
+        return _spaced(match, _fraction(_inner(match.group(1)), _inner(match.group(2))), "})", "\\")
+    if group == 3:
+        return _inner(match.group(3))
+    if group == 5:
+        affixes = _UNARY[match.group(4)]
+        if affixes is None:
+            return ""
+        return _spaced(match, _affix(affixes[0], _inner(match.group(5)).strip(), affixes[1]))
+    if group in (6, 7, 9):
+        return match.group(group)
+    if group == 8:
+        return "^" + _inner(match.group(8)).strip()
+    if group == 10:
+        name = match.group(10)
+        if name in _DROP:
+            # \left( no deja un espacio suelto; a\quad b sigue separado
+            text, start, end = match.string, match.start(), match.end()
+            keep = start and end < len(text) and text[start - 1].isalnum() and text[end].isalnum()
+            return " " if keep else ""
+        return _spaced(match, _SYMBOLS.get(name, name))
+    if group == 12:
+        prefix, suffix = _COMBINING[match.group(12)]
+        return _spaced(match, _affix(prefix, match.group(11), suffix))
+    if group == 13:
+        return "^" + match.group(13).translate(_SUPERSCRIPTS)
+    if group == 14:
+        return match.group(14).translate(_SUBSCRIPTS)
+    prefix, suffix = _UNARY[match.group(15)]
+    return _spaced(match, _affix(prefix, match.group(16), suffix))
+
+
+def _compose(match: re.Match) -> str:
+    """´ + e -> e con tilde, ˆ + ı -> i con sombrero (ver _SPACING_ACCENT_RE)."""
+    pieces = [piece for piece in match.groups() if piece]
+    accent, letter = pieces if pieces[0] in _SPACING_ACCENTS else pieces[::-1]
+    letter = {"ı": "i", "ȷ": "j"}.get(letter, letter)
+    if accent == "ˆ":
+        # Vector unitario, como \hat{\imath}: 0,07 i hat
+        return _spaced(match, _affix("", letter, "hat"))
+    return unicodedata.normalize("NFC", letter + _SPACING_ACCENTS[accent])
+
+
+def _inner(text: str) -> str:
+    """Normaliza el argumento de un comando (ya sin llaves anidadas)."""
+    return _TOKEN_RE.sub(_replace, text)
+
+
+def _normalize(text: str) -> str:
+    if not text.isascii():
+        text = _SPACING_ACCENT_RE.sub(_compose, text).translate(_UNICODE_TABLE)
+    # Cada pasada resuelve un nivel de llaves; se repite hasta que no cambie
+    for _ in range(_MAX_PASSES):
+        normalized = _TOKEN_RE.sub(_replace, text)
+        if normalized == text:
+            break
+        text = normalized
+    return _SPACES_RE.sub(" ", text.replace("^°", "°"))
+
+
+def _remember(text: str, normalized: str):
+    if len(_cache) >= _CACHE_SIZE:
+        _cache.clear()
+    _cache[text] = normalized
+
+
+def normalize_math(text: str) -> str:
+    """
+    Lleva la notacion LaTeX y los simbolos unicode de un texto a la forma canonica.
+
+    Args:
+        text: Chunk, pagina o consulta
+
+    Returns:
+        Texto normalizado (igual al original si MATH_NORMALIZE=0)
+    """
+    if not MATH_NORMALIZE:
+        return text
+    normalized = _cache.get(text)
+    if normalized is None:
+        normalized = _normalize(text)
+        _remember(text, normalized)
+    return normalized
+
+
+def normalize_batch(texts: List[str]) -> List[str]:
+    """
+    Normaliza varios textos; los repetidos dentro del lote o ya vistos se
+    toman de la cache.
+
+    Args:
+        texts: Textos a normalizar
+
+    Returns:
+        Textos normalizados, en el mismo orden
+    """
+    if not MATH_NORMALIZE:
+        return list(texts)
+    for text in dict.fromkeys(t for t in texts if t not in _cache):
+        _remember(text, _normalize(text))
+    return [normalize_math(text) for text in texts]
+
+
+def normalize_chunks(chunks: List[Dict]) -> List[Dict]:
+    """Normaliza en lote el contenido de una lista de chunks (en el lugar)."""
+    if not MATH_NORMALIZE or not chunks:
+        return chunks
+    for chunk, content in zip(chunks, normalize_batch([c["content"] for c in chunks])):
+        chunk["content"] = content
+    return chunks
@@ -0,0 +1,266 @@
+"""
+Endpoint de metricas y salud para el despliegue (ver DEPLOY_UNIVERSIDAD.md).
+
+    GET /metrics  Formato de texto de Prometheus: llamadas al LLM en curso,
+                  respuestas y errores, latencia p50/p95 de las respuestas,
+                  llamadas, tokens, costo y latencia por ruta de modelo,
+                  trabajos en cola y workers vivos, tamanio del indice,
+                  aciertos de la cache de chunk_store, resultado de cada
+                  sonda y las duraciones por etapa de tracing.py.
+    GET /healthz  JSON con el resultado de las sondas; 200 si todas pasan y
+                  503 si alguna falla (para systemd, nginx o un balanceador).
+
+Dos formas de correrlo:
+  - Dentro de la app: con METRICS_PORT definido, initialize_rag lo levanta
+    en un hilo y /metrics incluye los contadores de ElectromagnetismRAG.
+  - Como sidecar: python metrics_server.py --port 9100. Sin una instancia
+    de RAG en el proceso, expone solo las sondas y lo que se lee de disco
+    (cola de trabajos e indice).
+
+check_environment.py --live usa las mismas sondas.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+import tracing
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Las sondas se reutilizan durante este tiempo entre scrapes
+PROBE_CACHE_SECONDS = 5.0
+PROBE_TIMEOUT = 2.0
+
+
+def probe_index(collection) -> Dict:
+    """La coleccion abre y tiene documentos."""
+    count = collection.count()
+    return {"ok": count > 0, "documents": count}
+
+
+def probe_job_queue(db_path: Optional[str] = None) -> Dict:
+    """La cola de trabajos responde y, si hay trabajos pendientes, algun worker esta vivo."""
+    from job_queue import JOBS_DB, JobQueue
+
+    queue = JobQueue(db_path or JOBS_DB)
+    pending, workers = queue.pending_count(), queue.live_workers()
+    return {"ok": pending == 0 or workers > 0, "pending": pending, "workers": workers}
+
+
+def probe_llm() -> Dict:
+    """Hay clave de Anthropic o el servidor del modelo local responde."""
+    import urllib.error
+    import urllib.request
+
+    backend = os.getenv("LLM_BACKEND", "anthropic")
+    if backend == "anthropic":
+        return {"ok": bool(os.getenv("ANTHROPIC_API_KEY")), "backend": backend}
+    url = os.getenv("LOCAL_MODEL_URL", "http://localhost:11434")
+    try:
+        urllib.request.urlopen(url, timeout=PROBE_TIMEOUT).close()
+    except urllib.error.HTTPError:
+        pass  # El servidor respondio, aunque no en la raiz
+    except OSError as e:
+        return {"ok": False, "backend": backend, "error": str(e)}
+    return {"ok": True, "backend": backend}
+
+
+def _open_collection(persist_directory: str):
+    from rag_system import RETRIEVAL_SERVICE_URL, open_collection
+
+    if RETRIEVAL_SERVICE_URL:
+        from retrieval_service import RemoteCollection
+        return RemoteCollection(RETRIEVAL_SERVICE_URL)
+    return open_collection(persist_directory)
+
+
+def run_probes(collection=None, persist_directory: str = "./chroma_db") -> Dict[str, Dict]:
+    """
+    Ejecuta todas las sondas; una sonda que lanza una excepcion falla.
+
+    Args:
+        collection: Coleccion ya abierta (si no, se abre la del despliegue)
+        persist_directory: Carpeta de ChromaDB, si hay que abrirla
+
+    Returns:
+        {nombre: {"ok": bool, ...detalles}}
+    """
+    probes = {
+        "index": lambda: probe_index(collection if collection is not None else _open_collection(persist_directory)),
+        "job_queue": probe_job_queue,
+        "llm": probe_llm,
+    }
+    results = {}
+    for name, probe in probes.items():
+        try:
+            results[name] = probe()
+        except Exception as e:
+            results[name] = {"ok": False, "error": str(e)}
+    return results
+
+
+class MetricsServer:
+    """Sirve /metrics y /healthz para una instancia de RAG (o sin ella, como sidecar)."""
+
+    def __init__(self, rag=None, persist_directory: str = "./chroma_db"):
+        """
+        Args:
+            rag: ElectromagnetismRAG del proceso (None en modo sidecar)
+            persist_directory: Carpeta de ChromaDB para las sondas sin rag
+        """
+        self.rag = rag
+        self.persist_directory = persist_directory
+        self._lock = threading.Lock()
+        self._probes: Dict[str, Dict] = {}
+        self._probed_at = 0.0
+        self._collection = None
+
+    def probes(self) -> Dict[str, Dict]:
+        with self._lock:
+            if time.monotonic() - self._probed_at > PROBE_CACHE_SECONDS:
+                collection = self.rag.collection if self.rag is not None else self._collection
+                if collection is None:
+                    try:
+                        collection = self._collection = _open_collection(self.persist_directory)
+                    except Exception:
+                        collection = None
+                self._probes = run_probes(collection, self.persist_directory)
+                self._probed_at = time.monotonic()
+            return self._probes
+
+    def healthz(self) -> Dict:
+        probes = self.probes()
+        return {"status": "ok" if all(p["ok"] for p in probes.values()) else "error", "probes": probes}
+
+    def metrics(self) -> str:
+        lines = []
+
+        def add(name: str, kind: str, value, labels: str = ""):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{labels} {value:g}")
+
+        probes = self.probes()
+        lines.append("# TYPE rag_probe_ok gauge")
+        for name, result in probes.items():
+            lines.append(f'rag_probe_ok{{probe="{name}"}} {int(result["ok"])}')
+        if "pending" in probes["job_queue"]:
+            add("rag_jobs_pending", "gauge", probes["job_queue"]["pending"])
+            add("rag_workers_live", "gauge", probes["job_queue"]["workers"])
+
+        if self.rag is not None:
+            snapshot = self.rag.metrics_snapshot()
+            add("rag_llm_in_flight", "gauge", snapshot["llm_in_flight"])
+            add("rag_answers_total", "counter", snapshot["answers_total"])
+            add("rag_answer_errors_total", "counter", snapshot["answer_errors_total"])
+            lines.append("# TYPE rag_answer_latency_seconds gauge")
+            for quantile in ("p50", "p95"):
+                lines.append(f'rag_answer_latency_seconds{{quantile="{quantile}"}} '
+                             f'{snapshot[f"answer_{quantile}_seconds"]:.6f}')
+            routes = snapshot.get("routes") or {}
+            for name in ("calls", "errors", "cost_usd"):
+                lines.append(f"# TYPE rag_route_{name}_total counter")
+                for route, stats in sorted(routes.items()):
+                    lines.append(f'rag_route_{name}_total{{route="{route}"}} {stats[name]:g}')
+            lines.append("# TYPE rag_route_tokens_total counter")
+            for route, stats in sorted(routes.items()):
+                for kind in ("input", "output"):
+                    lines.append(f'rag_route_tokens_total{{route="{route}",kind="{kind}"}} {stats[f"{kind}_tokens"]}')
+            lines.append("# TYPE rag_route_generate_seconds gauge")
+            for route, stats in sorted(routes.items()):
+                for quantile in ("p50", "p95"):
+                    lines.append(f'rag_route_generate_seconds{{route="{route}",quantile="{quantile}"}} '
+                                 f'{stats[f"{quantile}_seconds"]:.6f}')
+            add("rag_index_documents", "gauge", snapshot["index_documents"])
+            if "chunk_store_bytes" in snapshot:
+                add("rag_chunk_store_bytes", "gauge", snapshot["chunk_store_bytes"])
+                lines.append("# TYPE rag_chunk_store_cache_total counter")
+                lines.append(f'rag_chunk_store_cache_total{{result="hit"}} {snapshot["chunk_store_cache_hits"]}')
+                lines.append(f'rag_chunk_store_cache_total{{result="miss"}} {snapshot["chunk_store_cache_misses"]}')
+            if "compact_index_bytes" in snapshot:
+                add("rag_compact_index_bytes", "gauge", snapshot["compact_index_bytes"])
+        elif "documents" in probes["index"]:
+            add("rag_index_documents", "gauge", probes["index"]["documents"])
+
+        return "\n".join(lines) + "\n" + tracing.export_prometheus()
+
+
+def _make_handler(server: MetricsServer):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            try:
+                if self.path == "/metrics":
+                    self._send(200, server.metrics().encode("utf-8"), "text/plain; version=0.0.4")
+                elif self.path == "/healthz":
+                    health = server.healthz()
+                    self._send(200 if health["status"] == "ok" else 503,
+                               json.dumps(health).encode("utf-8"), "application/json")
+                else:
+                    self._send(404, b'{"error": "not found"}', "application/json")
+            except Exception as e:
+                self._send(500, json.dumps({"error": str(e)}).encode("utf-8"), "application/json")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_in_background(rag, port: int, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """
+    Levanta el endpoint en un hilo del proceso de la app. Activa tracing.py
+    para las duraciones por etapa (sin escribir trazas JSON si TRACING no
+    esta activado).
+
+    Returns:
+        El servidor, o None si el puerto esta ocupado (otra instancia de la app)
+    """
+    if not tracing.is_enabled():
+        tracing.enable(sample_rate=0.0)
+    try:
+        server = ThreadingHTTPServer((host, port), _make_handler(MetricsServer(rag, rag.persist_directory)))
+    except OSError as e:
+        print(f"Advertencia: no se pudo abrir el endpoint de metricas en {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metricas en http://{host}:{port}/metrics")
+    return server
+
+
+def main() -> int:
+    import argparse
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Endpoint de metricas y salud (sidecar)")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--host", default=METRICS_HOST)
+    parser.add_argument("--port", type=int, default=int(os.getenv("METRICS_PORT") or 9100))
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(MetricsServer(None, args.persist_directory)))
+    server.daemon_threads = True
+    print(f"Metricas en http://{args.host}:{args.port}/metrics (sidecar)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
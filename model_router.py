@@ -0,0 +1,210 @@
+"""
+Enrutamiento de preguntas a un modelo chico o grande segun su complejidad.
+
+Las preguntas conceptuales ("Que es la ley de Coulomb?") van al modelo
+chico (ROUTER_SMALL_MODEL, de Anthropic o un servidor local) con menos
+tokens de salida; los problemas de varios pasos (el Solucionador de
+app.py, enunciados con datos y unidades) van al modelo grande. La
+clasificacion no llama a ningun modelo:
+
+  1. Reglas firmes: charla -> simple; "paso a paso", tres o mas datos
+     numericos o un enunciado largo -> complejo. Una pregunta corta que
+     sigue a un problema en el chat se queda en el modelo grande.
+  2. Si ninguna regla aplica, una regresion logistica sobre unas pocas
+     caracteristicas del texto (largo, numeros, unidades, verbos de
+     calculo, preguntas de definicion, simbolos matematicos). Los pesos
+     por defecto se ajustaron con benchmarks/eval_router.py --fit sobre
+     benchmarks/route_queries.jsonl; ROUTER_WEIGHTS apunta a otro ajuste.
+
+Con MODEL_ROUTING=0 todo va al modelo grande, como antes.
+"""
+import json
+import math
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from adaptive_retrieval import is_small_talk
+
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"
+# Backend del modelo chico: "anthropic", "ollama", "vllm" u "openai_compatible"
+ROUTER_SMALL_BACKEND = os.getenv("ROUTER_SMALL_BACKEND", "anthropic")
+ROUTER_SMALL_MODEL = os.getenv("ROUTER_SMALL_MODEL", "claude-haiku-4-5")
+ROUTER_SMALL_MAX_TOKENS = int(os.getenv("ROUTER_SMALL_MAX_TOKENS", "1024"))
+ROUTER_LARGE_MODEL = os.getenv("ROUTER_LARGE_MODEL", "claude-sonnet-4-6")
+ROUTER_LARGE_MAX_TOKENS = int(os.getenv("ROUTER_LARGE_MAX_TOKENS", "4096"))
+# Probabilidad de "complejo" desde la cual se usa el modelo grande
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.5"))
+ROUTER_WEIGHTS = os.getenv("ROUTER_WEIGHTS")
+LOCAL_MODEL_URL = os.getenv("LOCAL_MODEL_URL", "http://localhost:11434")
+LOCAL_TIMEOUT = 120
+
+# Precio en USD por millon de tokens (entrada, salida); un backend local cuesta 0
+_PRICES = {
+    "simple": (float(os.getenv("ROUTER_SMALL_PRICE_IN", "1")), float(os.getenv("ROUTER_SMALL_PRICE_OUT", "5"))),
+    "complejo": (float(os.getenv("ROUTER_LARGE_PRICE_IN", "3")), float(os.getenv("ROUTER_LARGE_PRICE_OUT", "15"))),
+}
+
+# Enunciados mas largos que esto se tratan como problemas
+_LONG_QUESTION_CHARS = 600
+
+FEATURES = ("bias", "log_words", "numbers", "units", "solve_verbs", "concept", "math", "items")
+DEFAULT_WEIGHTS = {
+    "bias": -3.35, "log_words": 0.89, "numbers": 1.27, "units": 0.52, "solve_verbs": 2.58,
+    "concept": -1.97, "math": 0.37, "items": 0.35,
+}
+
+_NUMBER_RE = re.compile(r"(?<![a-z_])[-+]?\d+(?:[.,]\d+)?(?:\s*[x*]\s*10\s*\^?\s*[-+]?\d+|e[-+]?\d+)?")
+_UNIT_RE = re.compile(
+    r"\d\s*(?:[munpkμ]?c|[munk]?m|cm|mm|[munpkμ]?f|[munkμ]?v|[mkμ]?a(?=\W|$)|amperes?|m?t|gauss|ohm|ω|[kmg]?hz|"
+    r"n|j|w|kg|ms|segundos?|rad|°|grados)(?=\W|$)"
+)
+_SOLVE_RE = re.compile(
+    r"\b(calcul\w*|determin\w*|encuentr\w*|encontrar|hall\w*|obten\w*|resuelv\w*|resolver|demuestr\w*|"
+    r"demostrar|deriv\w*|estim\w*|evalu\w*)\b"
+)
+_CONCEPT_RE = re.compile(
+    r"^(que es|que son|que significa|que dice|que establece|define|definicion|explica|explicame|por que|"
+    r"para que|cual es la diferencia|cual es la ley|enuncia|en que consiste|como funciona)\b"
+)
+_MATH_RE = re.compile(r"[=^\\∫∮∇]|\b(integral|derivada|vectorial|\\frac|\\int)\b")
+_ITEM_RE = re.compile(r"(?:^|\s)(?:[a-e]\)|\d\.|\d\))\s")
+
+
+@dataclass(frozen=True)
+class Route:
+    """Destino de una pregunta."""
+    name: str
+    backend: str
+    model: str
+    max_tokens: int
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        """Costo en USD de una llamada con esos tokens."""
+        if self.backend != "anthropic":
+            return 0.0
+        price_in, price_out = _PRICES[self.name]
+        return (input_tokens * price_in + output_tokens * price_out) / 1e6
+
+
+SIMPLE = Route("simple", ROUTER_SMALL_BACKEND, ROUTER_SMALL_MODEL, ROUTER_SMALL_MAX_TOKENS)
+COMPLEX = Route("complejo", "anthropic", ROUTER_LARGE_MODEL, ROUTER_LARGE_MAX_TOKENS)
+ROUTES = {route.name: route for route in (SIMPLE, COMPLEX)}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(c for c in text if unicodedata.category(c) != "Mn").strip(" \t\n¿¡")
+
+
+def features(question: str) -> Dict[str, float]:
+    """Caracteristicas del texto que usa el clasificador."""
+    text = _normalize(question)
+    return {
+        "bias": 1.0,
+        "log_words": math.log1p(len(text.split())),
+        "numbers": float(min(len(_NUMBER_RE.findall(text)), 5)),
+        "units": float(bool(_UNIT_RE.search(text))),
+        "solve_verbs": float(bool(_SOLVE_RE.search(text))),
+        "concept": float(bool(_CONCEPT_RE.search(text))),
+        "math": float(bool(_MATH_RE.search(question))),
+        "items": float(min(len(_ITEM_RE.findall(text)), 3)),
+    }
+
+
+def load_weights(path: Optional[str] = ROUTER_WEIGHTS) -> Dict[str, float]:
+    """Pesos del clasificador: los de path (JSON) o los por defecto."""
+    if not path:
+        return dict(DEFAULT_WEIGHTS)
+    with open(path, "r", encoding="utf-8") as f:
+        return {**DEFAULT_WEIGHTS, **json.load(f)}
+
+
+_weights = load_weights()
+
+
+def complexity(question: str, weights: Optional[Dict[str, float]] = None) -> float:
+    """Probabilidad (0-1) de que la pregunta sea un problema de varios pasos."""
+    weights = _weights if weights is None else weights
+    z = sum(weights.get(name, 0.0) * value for name, value in features(question).items())
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+def classify(question: str, weights: Optional[Dict[str, float]] = None) -> Tuple[str, str]:
+    """
+    Clasifica una pregunta como "simple" o "complejo".
+
+    Returns:
+        (ruta, motivo): el motivo es la regla que decidio o "clasificador"
+    """
+    text = _normalize(question)
+    if is_small_talk(question):
+        return "simple", "charla"
+    if "paso a paso" in text:
+        return "complejo", "paso_a_paso"
+    if len(_NUMBER_RE.findall(text)) >= 3:
+        return "complejo", "datos"
+    if len(question) > _LONG_QUESTION_CHARS:
+        return "complejo", "largo"
+    return ("complejo" if complexity(question, weights) >= ROUTER_THRESHOLD else "simple"), "clasificador"
+
+
+def choose_route(question: str, conversation_history: Optional[List[Dict]] = None,
+                 route: Optional[str] = None) -> Tuple[Route, str]:
+    """
+    Ruta de una pregunta.
+
+    Args:
+        question: Pregunta del estudiante
+        conversation_history: Mensajes anteriores del chat
+        route: Ruta forzada por quien llama ("simple" o "complejo"), p. ej. el Solucionador
+
+    Returns:
+        (ruta, motivo)
+    """
+    if route is not None:
+        return ROUTES[route], "forzada"
+    if not MODEL_ROUTING:
+        return COMPLEX, "sin_enrutar"
+    name, reason = classify(question)
+    # "Y si la distancia se duplica?" sigue un problema anterior del chat
+    if reason == "clasificador" and name == "simple" and any(
+            message["role"] == "user" and classify(message["content"])[0] == "complejo"
+            for message in (conversation_history or [])[-4:]):
+        return COMPLEX, "seguimiento"
+    return ROUTES[name], reason
+
+
+def generate_local(route: Route, system_prompt: str, messages: List[Dict]) -> Tuple[str, int, int]:
+    """
+    Genera con un servidor local (Ollama o compatible con la API de OpenAI).
+
+    Returns:
+        (texto, tokens de entrada, tokens de salida)
+    """
+    import urllib.request
+
+    chat = [{"role": "system", "content": system_prompt}] + [
+        {"role": m["role"], "content": m["content"]} for m in messages
+    ]
+    if route.backend == "ollama":
+        url = f"{LOCAL_MODEL_URL}/api/chat"
+        payload = {"model": route.model, "messages": chat, "stream": False,
+                   "options": {"num_predict": route.max_tokens}}
+    elif route.backend in ("vllm", "openai_compatible"):
+        url = f"{LOCAL_MODEL_URL}/v1/chat/completions"
+        payload = {"model": route.model, "messages": chat, "max_tokens": route.max_tokens}
+    else:
+        raise ValueError(f"Backend no soportado: {route.backend}")
+
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=LOCAL_TIMEOUT) as response:
+        data = json.loads(response.read())
+    if route.backend == "ollama":
+        return data["message"]["content"], data.get("prompt_eval_count", 0), data.get("eval_count", 0)
+    usage = data.get("usage") or {}
+    return (data["choices"][0]["message"]["content"],
+            usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
@@ -4,23 +4,68 @@ Extrae contenido de PDFs para ser usado en el sistema RAG.
 Soporta PDFs con texto y PDFs escaneados (OCR).
 """
 import os
-from typing import List, Dict
-
-try:
-    import pdfplumber
-except ImportError:
-    print("pdfplumber no instalado. Ejecuta: pip install pdfplumber")
-    pdfplumber = None
-
-# OCR dependencies (optional)
-try:
-    import pytesseract
-    from pdf2image import convert_from_path
-    from PIL import Image
-    OCR_AVAILABLE = True
+import platform
+from typing import Dict, Iterator, List, Optional
+
+from chunker import MAX_CHILD_CHARS, chunk_pages
+
+# Las dependencias de extraccion (pdfplumber) y OCR (pytesseract, pdf2image,
+# PIL) se cargan de forma diferida, solo al indexar o subir archivos. Importar
+# este modulo no debe encarecer el arranque de la ruta de consulta.
+pdfplumber = None
+pytesseract = None
+convert_from_path = None
+pdfinfo_from_path = None
+POPPLER_PATH = None
+_OCR_AVAILABLE = None
+# OCR_ENABLED=0 omite los PDFs escaneados y las imagenes (p. ej. indexer.py --no-ocr)
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") == "1"
+
+# Paginas leidas y paginas pasadas por OCR en este proceso (index_profile.py
+# las usa para atribuir el costo a cada archivo)
+page_counts = {"pages": 0, "ocr_pages": 0}
+
+
+def _load_pdfplumber():
+    """Importa pdfplumber en el primer uso."""
+    global pdfplumber
+    if pdfplumber is None:
+        try:
+            import pdfplumber as _pdfplumber
+        except ImportError:
+            print("pdfplumber no instalado. Ejecuta: pip install pdfplumber")
+            return None
+        pdfplumber = _pdfplumber
+    return pdfplumber
+
+
+def ocr_available() -> bool:
+    """
+    Importa y configura las dependencias de OCR en el primer uso.
+
+    Returns:
+        True si pytesseract y pdf2image estan disponibles (y OCR_ENABLED)
+    """
+    global _OCR_AVAILABLE, pytesseract, convert_from_path, pdfinfo_from_path, POPPLER_PATH
+    if not OCR_ENABLED:
+        return False
+    if _OCR_AVAILABLE is not None:
+        return _OCR_AVAILABLE
+
+    try:
+        import pytesseract as _pytesseract
+        from pdf2image import convert_from_path as _convert_from_path
+        from pdf2image import pdfinfo_from_path as _pdfinfo_from_path
+        from PIL import Image  # noqa: F401
+    except ImportError:
+        _OCR_AVAILABLE = False
+        return False
+
+    pytesseract = _pytesseract
+    convert_from_path = _convert_from_path
+    pdfinfo_from_path = _pdfinfo_from_path
 
     # Configure Tesseract path for Windows
-    import platform
     if platform.system() == "Windows":
         tesseract_path = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
         if os.path.exists(tesseract_path):
@@ -31,172 +76,178 @@ try:
         if os.path.exists(local_tessdata):
             os.environ["TESSDATA_PREFIX"] = local_tessdata
 
-    # Configure Poppler path for Windows (local installation)
-    POPPLER_PATH = None
-    if platform.system() == "Windows":
-        # Check local poppler installation first
+        # Configure Poppler path for Windows (local installation)
         local_poppler = os.path.join(os.path.dirname(__file__), "poppler-24.08.0", "Library", "bin")
         if os.path.exists(local_poppler):
             POPPLER_PATH = local_poppler
-except ImportError:
-    OCR_AVAILABLE = False
-    pytesseract = None
-    POPPLER_PATH = None
 
+    _OCR_AVAILABLE = True
+    return True
 
-def extract_text_with_ocr(file_path: str, language: str = "spa") -> str:
+
+def _page_marker(record: Dict) -> str:
+    return f"\n--- Pagina {record['page']} ---\n{record['text']}\n"
+
+
+def iter_ocr_pages(file_path: str, language: str = "spa", page_count: Optional[int] = None) -> Iterator[Dict]:
     """
-    Extrae texto de un PDF escaneado usando OCR (Tesseract).
+    Genera el texto OCR (Tesseract) de un PDF escaneado pagina por pagina.
+
+    Cada pagina se rasteriza por separado (first_page/last_page), asi nunca
+    hay mas de una imagen de 300 dpi en memoria.
 
     Args:
         file_path: Ruta al archivo PDF
         language: Idioma para OCR (spa=espanol, eng=ingles)
+        page_count: Numero de paginas, si ya se conoce
 
-    Returns:
-        Texto extraido mediante OCR
+    Yields:
+        {"page": n, "text": texto, "ocr": True} por cada pagina con texto
     """
-    if not OCR_AVAILABLE:
+    if not ocr_available():
         raise ImportError("pytesseract y pdf2image no estan instalados. Ejecuta: pip install pytesseract pdf2image")
 
-    text = ""
-    try:
-        # Convertir PDF a imagenes (una por pagina)
-        print(f"  Convirtiendo PDF a imagenes para OCR...")
-        if POPPLER_PATH:
-            images = convert_from_path(file_path, dpi=300, poppler_path=POPPLER_PATH)
-        else:
-            images = convert_from_path(file_path, dpi=300)
+    options = {"dpi": 300}
+    if POPPLER_PATH:
+        options["poppler_path"] = POPPLER_PATH
+    if page_count is None:
+        info = pdfinfo_from_path(file_path, poppler_path=POPPLER_PATH) if POPPLER_PATH else pdfinfo_from_path(file_path)
+        page_count = int(info.get("Pages", 0))
 
-        for page_num, image in enumerate(images, 1):
-            print(f"    OCR pagina {page_num}/{len(images)}...")
+    for page_num in range(1, page_count + 1):
+        print(f"    OCR pagina {page_num}/{page_count}...")
+        images = convert_from_path(file_path, first_page=page_num, last_page=page_num, **options)
+        page_counts["ocr_pages"] += 1
+        for image in images:
             page_text = pytesseract.image_to_string(image, lang=language)
             if page_text.strip():
-                text += f"\n--- Pagina {page_num} ---\n"
-                text += page_text + "\n"
+                yield {"page": page_num, "text": page_text, "ocr": True}
 
-    except Exception as e:
-        print(f"Error en OCR para {file_path}: {e}")
-        return ""
 
-    return text
+def ocr_image(file_path: str, language: str = "spa") -> str:
+    """
+    Extrae texto de una imagen (foto o captura de una pauta) con Tesseract.
 
+    Args:
+        file_path: Ruta a la imagen (.png, .jpg, ...)
+        language: Idioma para OCR
 
-def extract_text_from_pdf(file_path: str, use_ocr_fallback: bool = True) -> str:
+    Returns:
+        Texto reconocido
+    """
+    if not ocr_available():
+        raise ImportError("pytesseract no esta instalado. Ejecuta: pip install pytesseract")
+
+    from PIL import Image
+
+    page_counts["pages"] += 1
+    page_counts["ocr_pages"] += 1
+    with Image.open(file_path) as image:
+        # Tesseract funciona mejor en escala de grises
+        return pytesseract.image_to_string(image.convert("L"), lang=language)
+
+
+def iter_pdf_pages(file_path: str, use_ocr_fallback: bool = True) -> Iterator[Dict]:
     """
-    Extrae texto de un archivo PDF.
-    Primero intenta extraccion directa, si falla usa OCR.
+    Genera el texto de un PDF pagina por pagina.
+    Primero intenta extraccion directa; si ninguna pagina tiene texto, usa OCR.
 
     Args:
         file_path: Ruta al archivo PDF
         use_ocr_fallback: Si True, usa OCR cuando no hay texto extraible
 
-    Returns:
-        Texto extraido del PDF
+    Yields:
+        {"page": n, "text": texto, "ocr": bool} por cada pagina con texto
     """
-    if pdfplumber is None:
+    if _load_pdfplumber() is None:
         raise ImportError("pdfplumber no esta instalado")
 
-    text = ""
     has_text = False
-
+    page_count = None
     try:
         with pdfplumber.open(file_path) as pdf:
+            page_count = len(pdf.pages)
+            page_counts["pages"] += page_count
             for page_num, page in enumerate(pdf.pages, 1):
                 page_text = page.extract_text()
+                # Liberar los objetos ya parseados de la pagina (pdfplumber >= 0.11)
+                if hasattr(page, "close"):
+                    page.close()
                 if page_text and page_text.strip():
                     has_text = True
-                    text += f"\n--- Pagina {page_num} ---\n"
-                    text += page_text + "\n"
+                    yield {"page": page_num, "text": page_text, "ocr": False}
     except Exception as e:
         print(f"Error procesando PDF {file_path}: {e}")
-        return ""
+        return
 
     # Si no se extrajo texto y OCR esta disponible, usar OCR
     if not has_text and use_ocr_fallback:
-        if OCR_AVAILABLE:
+        if ocr_available():
             print(f"  PDF escaneado detectado, usando OCR...")
-            text = extract_text_with_ocr(file_path)
+            try:
+                yield from iter_ocr_pages(file_path, page_count=page_count)
+            except Exception as e:
+                print(f"Error en OCR para {file_path}: {e}")
+        elif not OCR_ENABLED:
+            print(f"  PDF escaneado omitido (OCR desactivado)")
         else:
             print(f"  Advertencia: PDF escaneado pero OCR no disponible")
             print(f"  Instala: pip install pytesseract pdf2image")
             print(f"  Y asegurate de tener Tesseract OCR instalado")
 
-    return text
 
+def extract_text_with_ocr(file_path: str, language: str = "spa") -> str:
+    """
+    Extrae texto de un PDF escaneado usando OCR (Tesseract).
 
-def process_pdf_to_chunks(file_path: str, category: str, chunk_size: int = 2000) -> List[Dict]:
+    Args:
+        file_path: Ruta al archivo PDF
+        language: Idioma para OCR (spa=espanol, eng=ingles)
+
+    Returns:
+        Texto extraido mediante OCR
+    """
+    try:
+        return "".join(_page_marker(record) for record in iter_ocr_pages(file_path, language))
+    except ImportError:
+        raise
+    except Exception as e:
+        print(f"Error en OCR para {file_path}: {e}")
+        return ""
+
+
+def extract_text_from_pdf(file_path: str, use_ocr_fallback: bool = True) -> str:
+    """
+    Extrae texto de un archivo PDF con marcadores "--- Pagina N ---".
+    Se mantiene por compatibilidad; la indexacion usa iter_pdf_pages.
+
+    Args:
+        file_path: Ruta al archivo PDF
+        use_ocr_fallback: Si True, usa OCR cuando no hay texto extraible
+
+    Returns:
+        Texto extraido del PDF
+    """
+    return "".join(_page_marker(record) for record in iter_pdf_pages(file_path, use_ocr_fallback))
+
+
+def process_pdf_to_chunks(file_path: str, category: str, chunk_size: int = MAX_CHILD_CHARS) -> List[Dict]:
     """
     Procesa un PDF y lo divide en chunks para indexacion.
-    
+
+    Las paginas se consumen como generador y los problemas, sus items y
+    soluciones se detectan con chunker, asi que un problema que cruza un
+    salto de pagina queda en un solo chunk padre.
+
     Args:
         file_path: Ruta al PDF
         category: Categoria tematica (carpeta de origen)
-        chunk_size: Tamano maximo de cada chunk en caracteres
-        
+        chunk_size: Tamano maximo de cada chunk hijo en caracteres
+
     Returns:
         Lista de diccionarios con metadata de cada chunk
     """
-    text = extract_text_from_pdf(file_path)
-    
-    if not text.strip():
-        return []
-    
-    filename = os.path.basename(file_path)
-    chunks = []
-    
-    # Dividir por paginas primero
-    pages = text.split("--- Pagina ")
-    
-    for i, page_content in enumerate(pages):
-        if not page_content.strip():
-            continue
-            
-        # Limpiar el marcador de pagina
-        page_content = page_content.strip()
-        if page_content.startswith("---"):
-            # Quitar la linea del marcador
-            lines = page_content.split("\n", 1)
-            if len(lines) > 1:
-                page_content = lines[1]
-        
-        if not page_content.strip():
-            continue
-        
-        # Si la pagina es muy grande, subdividir
-        if len(page_content) > chunk_size:
-            # Dividir por parrafos o por tamano
-            sub_chunks = []
-            current_chunk = ""
-            
-            for paragraph in page_content.split("\n\n"):
-                if len(current_chunk) + len(paragraph) < chunk_size:
-                    current_chunk += paragraph + "\n\n"
-                else:
-                    if current_chunk.strip():
-                        sub_chunks.append(current_chunk.strip())
-                    current_chunk = paragraph + "\n\n"
-            
-            if current_chunk.strip():
-                sub_chunks.append(current_chunk.strip())
-            
-            for k, sub in enumerate(sub_chunks):
-                chunks.append({
-                    "source": filename,
-                    "category": category,
-                    "chunk_number": f"{i}_{k}",
-                    "content": sub,
-                    "file_type": "pdf"
-                })
-        else:
-            chunks.append({
-                "source": filename,
-                "category": category,
-                "chunk_number": str(i),
-                "content": page_content.strip(),
-                "file_type": "pdf"
-            })
-    
-    return chunks
+    return chunk_pages(iter_pdf_pages(file_path), os.path.basename(file_path), category, "pdf", max_chars=chunk_size)
 
 
 if __name__ == "__main__":
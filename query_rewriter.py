@@ -0,0 +1,137 @@
+"""
+Reescritura de consultas y expansion multi-consulta.
+
+Las preguntas de los estudiantes suelen ser cortas o informales ("como saco
+el campo de un anillo?"), y un unico embedding no encuentra buenos chunks.
+Este modulo reescribe la pregunta en varias sub-consultas enfocadas usando
+reglas y el vocabulario del curso (CATEGORIES), sin llamar a ningun modelo,
+y fusiona los resultados recuperados para cada una (Reciprocal Rank Fusion).
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from dedup import collapse_duplicates
+from rag_system import CATEGORIES
+
+MAX_SUBQUERIES = 3
+
+# Expresiones informales -> forma estandar
+_INFORMAL = [
+    (r"\bcomo (saco|saca|sacar|obtengo|encuentro|hallo)\b", "como calcular"),
+    (r"\bxq\b|\bpq\b|\bporq\b", "por que"),
+    (r"\bq\b", "que"),
+    (r"\bd\b", "de"),
+    (r"\bcampo e\b", "campo electrico"),
+    (r"\bcampo b\b", "campo magnetico"),
+    (r"\bfem\b", "fuerza electromotriz fem"),
+]
+
+# Conceptos del curso: palabra clave -> (categoria, sub-consulta enfocada)
+_CONCEPTS: Dict[str, Tuple[str, str]] = {
+    "anillo": ("campo_electrico", "campo electrico de un anillo cargado en su eje"),
+    "disco": ("campo_electrico", "campo electrico de un disco cargado en su eje"),
+    "dipolo": ("campo_electrico", "campo electrico y potencial de un dipolo electrico"),
+    "gauss": ("campo_electrico", "ley de Gauss flujo electrico superficie gaussiana"),
+    "flujo": ("campo_electrico", "flujo electrico a traves de una superficie"),
+    "coulomb": ("campo_electrico", "ley de Coulomb fuerza entre cargas puntuales"),
+    "esfera": ("campo_electrico", "campo electrico de una esfera cargada ley de Gauss"),
+    "cascaron": ("campo_electrico", "campo electrico de un cascaron esferico cargado"),
+    "hilo": ("campo_electrico", "campo electrico de un hilo con densidad lineal de carga"),
+    "plano": ("campo_electrico", "campo electrico de un plano infinito cargado"),
+    "coaxial": ("campo_electrico", "cable coaxial ley de Gauss campo electrico"),
+    "potencial": ("campo_electrico", "potencial electrico y diferencia de potencial"),
+    "biot": ("campo_magnetico", "ley de Biot-Savart campo magnetico de una corriente"),
+    "ampere": ("campo_magnetico", "ley de Ampere campo magnetico"),
+    "solenoide": ("campo_magnetico", "campo magnetico de un solenoide ley de Ampere"),
+    "espira": ("campo_magnetico", "campo magnetico de una espira con corriente"),
+    "faraday": ("campo_magnetico", "ley de Faraday fuerza electromotriz inducida"),
+    "induccion": ("campo_magnetico", "induccion electromagnetica ley de Faraday y Lenz"),
+    "lorentz": ("campo_magnetico", "fuerza de Lorentz sobre una carga en movimiento"),
+    "kirchhoff": ("corriente_directa", "leyes de Kirchhoff mallas y nodos"),
+    "malla": ("corriente_directa", "ley de mallas de Kirchhoff circuito"),
+    "resistencia": ("corriente_directa", "resistencia equivalente en serie y paralelo"),
+    "condensador": ("corriente_directa", "condensadores en serie y paralelo capacitancia equivalente"),
+    "capacitor": ("corriente_directa", "condensadores en serie y paralelo capacitancia equivalente"),
+    "ohm": ("corriente_directa", "ley de Ohm corriente voltaje y resistencia"),
+    "rc": ("corriente_directa", "circuito RC carga y descarga de un condensador"),
+    "fasor": ("corriente_alterna", "fasores e impedancia en corriente alterna"),
+    "impedancia": ("corriente_alterna", "impedancia en circuitos de corriente alterna"),
+    "transformador": ("maquinas_electricas", "transformador relacion de vueltas"),
+    "motor": ("maquinas_electricas", "motor electrico principio de funcionamiento"),
+    "vector": ("vectores", "operaciones con vectores producto punto y producto cruz"),
+    "producto cruz": ("vectores", "producto cruz de vectores"),
+    "producto punto": ("vectores", "producto punto de vectores"),
+}
+
+_INFORMAL_RE = [(re.compile(pattern), repl) for pattern, repl in _INFORMAL]
+_CONCEPT_RE = re.compile(r"\b(" + "|".join(sorted(map(re.escape, _CONCEPTS), key=len, reverse=True)) + r")\w*")
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def normalize_question(question: str) -> str:
+    """Minusculas, sin tildes ni signos, y expresiones informales estandarizadas."""
+    text = _strip_accents(question.lower())
+    text = re.sub(r"[¿?¡!,;]", " ", text)
+    for pattern, repl in _INFORMAL_RE:
+        text = pattern.sub(repl, text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+@lru_cache(maxsize=2048)
+def rewrite_query(question: str, max_subqueries: int = MAX_SUBQUERIES) -> Tuple[str, ...]:
+    """
+    Reescribe una pregunta en sub-consultas enfocadas (resultado cacheado).
+
+    Args:
+        question: Pregunta original del estudiante
+        max_subqueries: Maximo de sub-consultas ademas de la pregunta normalizada
+
+    Returns:
+        Tupla con la pregunta normalizada seguida de las sub-consultas
+    """
+    normalized = normalize_question(question)
+    subqueries = []
+    for match in _CONCEPT_RE.finditer(normalized):
+        category, focused = _CONCEPTS[match.group(1)]
+        subquery = f"{focused} {CATEGORIES.get(category, '')}".strip()
+        if subquery not in subqueries:
+            subqueries.append(subquery)
+        if len(subqueries) >= max_subqueries:
+            break
+    return tuple([normalized] + subqueries)
+
+
+def _doc_key(doc: Dict) -> Tuple:
+    metadata = doc.get("metadata") or {}
+    return (metadata.get("source"), metadata.get("chunk_number"), doc.get("content", "")[:64])
+
+
+def fuse_results(result_lists: List[List[Dict]], n_results: int, k: int = 60) -> List[Dict]:
+    """
+    Fusiona listas de documentos recuperados con Reciprocal Rank Fusion.
+
+    Args:
+        result_lists: Resultados de cada sub-consulta, ordenados por relevancia
+        n_results: Numero de documentos a retornar
+        k: Constante de suavizado de RRF
+
+    Returns:
+        Documentos unicos ordenados por puntaje fusionado
+    """
+    scores: Dict[Tuple, float] = {}
+    best: Dict[Tuple, Dict] = {}
+    for docs in result_lists:
+        for rank, doc in enumerate(docs, 1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            current = best.get(key)
+            if current is None or (doc.get("distance") or 0) < (current.get("distance") or 0):
+                best[key] = doc
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    # Sub-consultas distintas pueden traer copias casi iguales del mismo material
+    return collapse_duplicates([best[key] for key in ranked], n_results)
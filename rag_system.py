@@ -2,12 +2,30 @@
 Sistema RAG (Retrieval-Augmented Generation) para el agente de electromagnetismo.
 Usa ChromaDB para almacenar y recuperar documentos por categorias.
 """
+import copy
+import json
 import os
-from typing import List, Dict, Optional
-import chromadb
-from chromadb.config import Settings
-import anthropic
-from tex_processor import process_all_files_in_category
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, List, Dict, Optional, Tuple
+
+from adaptive_retrieval import ADAPTIVE_K, ADAPTIVE_MAX_K, DEFAULT_K, is_small_talk, select_documents
+from chunk_store import CHUNK_STORE, CHUNK_STORE_DIR, ChunkStore, default_store_dir
+from chunker import collapse_to_parents
+from compact_index import CompactIndex, default_index_dir, open_compact_index, wants_compact
+from dedup import DEDUP_ENABLED, collapse_duplicates, dedup_chunks, signature_key
+from embeddings import DEFAULT_MODEL_NAME, document_embedding_function, embedding_model_name, get_embedding_function
+from math_normalize import normalize_batch
+from model_router import COMPLEX, ROUTES, Route, choose_route, generate_local
+from tracing import span
+from write_lock import write_lock
+
+# chromadb, anthropic y los extractores se importan de forma diferida: la ruta
+# de consulta no necesita cargar pdfplumber/OCR, y anthropic solo se carga en
+# la primera llamada al LLM.
 
 # Definicion de categorias (temas del curso)
 CATEGORIES = {
@@ -20,84 +38,1078 @@ CATEGORIES = {
 }
 
 CORPUS_PATH = "./corpus"
+COLLECTION_NAME = "electromagnetism_corpus"
+# Archivos indexados y su huella, para la indexacion incremental (ver indexer.py)
+MANIFEST_FILE = "corpus_manifest.json"
+# Siguiente ID doc_N libre, reservado con el candado de escritura
+DOC_ID_FILE = "doc_ids.json"
+# Coleccion que sirve las consultas y colecciones retiradas por un reindexado
+# (ver clear_and_reindex); sin el archivo se usa COLLECTION_NAME
+ACTIVE_COLLECTION_FILE = "active_collection.json"
+# Segundos que se conserva la coleccion anterior tras un reindexado, para que
+# los procesos que aun la usan pasen a la nueva antes de borrarla
+RETIRED_COLLECTION_GRACE = float(os.getenv("RETIRED_COLLECTION_GRACE", "120"))
+# Filas por lectura de metadata al compactar chunk_store
+COMPACT_PAGE_ROWS = 5000
+
+# Chunks por llamada al modelo de embeddings y a collection.add al indexar
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+
+# Si esta definida, las consultas y escrituras van al servicio de recuperacion
+# compartido (retrieval_service.py) en vez de abrir ChromaDB en este proceso.
+RETRIEVAL_SERVICE_URL = os.getenv("RETRIEVAL_SERVICE_URL")
+
+# Expansion multi-consulta (query_rewriter.py), desactivada por defecto.
+# El presupuesto limita cuanto se espera por las sub-consultas ademas de la
+# consulta original; si se excede se usan solo los resultados originales.
+QUERY_EXPANSION = os.getenv("QUERY_EXPANSION", "0") == "1"
+QUERY_EXPANSION_BUDGET_MS = float(os.getenv("QUERY_EXPANSION_BUDGET_MS", "150"))
+
+# Caracteres de material de referencia que se envian al LLM por pregunta
+CONTEXT_CHARS = 4500
+
+# Parametros del HNSW de ChromaDB (sin definir = valor por defecto de ChromaDB).
+# HNSW_SPACE, HNSW_M y HNSW_CONSTRUCTION_EF se fijan al crear la coleccion y
+# cambiarlos requiere reindexar; HNSW_SEARCH_EF se aplica tambien a un indice
+# ya construido (mas alto = mejor recall y consultas mas lentas).
+HNSW_SPACE = os.getenv("HNSW_SPACE")  # "l2", "cosine" o "ip"
+HNSW_M = os.getenv("HNSW_M")
+HNSW_CONSTRUCTION_EF = os.getenv("HNSW_CONSTRUCTION_EF")
+HNSW_SEARCH_EF = os.getenv("HNSW_SEARCH_EF")
+# Nombre de cada parametro en la configuracion de ChromaDB >= 1.0
+_HNSW_CONFIG_KEYS = {"hnsw:space": "space", "hnsw:M": "max_neighbors",
+                     "hnsw:construction_ef": "ef_construction", "hnsw:search_ef": "ef_search"}
+_HNSW_DEFAULTS = {"hnsw:space": "l2", "hnsw:M": 16, "hnsw:construction_ef": 100}
+
+# Consultas de calentamiento al iniciar (ver ElectromagnetismRAG.warm_up), una por categoria
+WARM_UP = os.getenv("WARM_UP", "1") == "1"
+WARM_UP_QUERIES = {
+    "vectores": "producto cruz y producto punto de vectores",
+    "campo_electrico": "campo electrico de una esfera con la ley de Gauss",
+    "campo_magnetico": "campo magnetico de un alambre recto con Biot-Savart",
+    "corriente_directa": "resistencias en serie y paralelo con leyes de Kirchhoff",
+    "corriente_alterna": "impedancia de un circuito RLC en corriente alterna",
+    "maquinas_electricas": "rendimiento de un transformador y un motor de induccion",
+}
+
+# Cada cuantos segundos se revisa si ./chroma_db paso a apuntar a otra version
+# del indice (index_bundle.py install) o a otra coleccion (clear_and_reindex);
+# la nueva se abre y calienta en segundo plano
+INDEX_SWAP_CHECK_SECONDS = 2.0
+
+# Respuestas recientes sobre las que se calculan los percentiles de latencia
+LATENCY_WINDOW = 1024
+
+# Metadata estructural que agrega chunker.chunk_document, y alias de dedup.dedup_chunks
+STRUCTURE_KEYS = ("chunk_level", "block_type", "parent_id", "problem_label", "part_label", "page",
+                  "aliases", "alias_sources")
+
+
+def hnsw_metadata() -> Dict:
+    """Claves hnsw:* de la metadata de la coleccion segun la configuracion."""
+    settings = {"hnsw:space": HNSW_SPACE, "hnsw:M": HNSW_M,
+                "hnsw:construction_ef": HNSW_CONSTRUCTION_EF, "hnsw:search_ef": HNSW_SEARCH_EF}
+    return {key: value if key == "hnsw:space" else int(value) for key, value in settings.items() if value}
+
+
+def _hnsw_settings(collection) -> Dict:
+    """Parametros HNSW de una coleccion existente (los no registrados quedan fuera)."""
+    metadata = collection.metadata or {}
+    config = (getattr(collection, "configuration_json", None) or {}).get("hnsw") or {}
+    current = {}
+    for key, config_key in _HNSW_CONFIG_KEYS.items():
+        value = config.get(config_key, metadata.get(key))
+        if value is not None:
+            current[key] = value
+    return current
+
+
+def hnsw_mismatches(collection) -> Dict[str, tuple]:
+    """Parametros fijados al crear el indice que difieren de los pedidos: {clave: (actual, pedido)}."""
+    current = _hnsw_settings(collection)
+    return {
+        key: (current.get(key, _HNSW_DEFAULTS[key]), wanted)
+        for key, wanted in hnsw_metadata().items()
+        if key in _HNSW_DEFAULTS and current.get(key, _HNSW_DEFAULTS[key]) != wanted
+    }
+
+
+def _apply_search_ef(collection):
+    """Ajusta search_ef de un indice existente si difiere del configurado."""
+    wanted = hnsw_metadata().get("hnsw:search_ef")
+    if wanted is None or _hnsw_settings(collection).get("hnsw:search_ef") == wanted:
+        return
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": wanted}})
+        print(f"HNSW: search_ef = {wanted}")
+    except TypeError:
+        # ChromaDB < 1.0 no permite cambiarlo sin recrear la coleccion
+        print("Advertencia: esta version de ChromaDB solo aplica HNSW_SEARCH_EF al reindexar")
+
+
+def chroma_client(persist_directory: str = "./chroma_db"):
+    """
+    Cliente de ChromaDB para la carpeta, resolviendo enlaces simbolicos:
+    ChromaDB reutiliza el cliente abierto para una misma ruta, y tras
+    instalar otra version del indice (index_bundle.py) ./chroma_db apunta a
+    una carpeta nueva que hay que abrir aparte.
+    """
+    import chromadb
+    return chromadb.PersistentClient(path=os.path.realpath(persist_directory))
+
+
+def _read_pointer(persist_directory: str) -> Dict:
+    try:
+        with open(os.path.join(persist_directory, ACTIVE_COLLECTION_FILE), encoding="utf-8") as f:
+            pointer = json.load(f)
+    except FileNotFoundError:
+        pointer = {}
+    return {"active": pointer.get("active", COLLECTION_NAME), "retired": pointer.get("retired", {})}
+
+
+def _write_pointer(persist_directory: str, pointer: Dict):
+    """Reemplaza active_collection.json de forma atomica."""
+    path = os.path.join(persist_directory, ACTIVE_COLLECTION_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pointer, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def active_collection_name(persist_directory: str = "./chroma_db") -> str:
+    """Nombre de la coleccion que sirve las consultas."""
+    return _read_pointer(persist_directory)["active"]
+
+
+def index_identity(persist_directory: str = "./chroma_db") -> Tuple[str, str]:
+    """(carpeta real, coleccion activa): si cambia, los procesos reabren el indice."""
+    return os.path.realpath(persist_directory), active_collection_name(persist_directory)
+
+
+def new_collection_name() -> str:
+    """Nombre para la coleccion de un reindexado completo."""
+    return f"{COLLECTION_NAME}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:4]}"
+
+
+def compact_index_dir(persist_directory: str, collection_name: str) -> str:
+    """Carpeta del indice int8 de una coleccion (la original conserva compact_index/)."""
+    return default_index_dir(persist_directory, None if collection_name == COLLECTION_NAME else collection_name)
+
+
+def activate_collection(persist_directory: str, name: str) -> str:
+    """
+    Hace que las consultas pasen a la coleccion name; la anterior queda
+    retirada hasta que drop_retired_collections la borre. Se llama con el
+    candado de escritura tomado (en modo servicio, por el cliente que
+    reindexa).
+
+    Returns:
+        Nombre de la coleccion anterior
+    """
+    pointer = _read_pointer(persist_directory)
+    previous = pointer["active"]
+    if previous != name:
+        pointer["retired"][previous] = time.time()
+    pointer["retired"].pop(name, None)
+    pointer["active"] = name
+    _write_pointer(persist_directory, pointer)
+    return previous
+
+
+def drop_collection(persist_directory: str, name: str):
+    """Borra una coleccion y su indice int8 (no la activa)."""
+    if name == active_collection_name(persist_directory):
+        raise ValueError(f"La coleccion {name} esta activa")
+    try:
+        chroma_client(persist_directory).delete_collection(name)
+    except Exception as e:
+        # Ya borrada (p. ej. por otro proceso)
+        print(f"Advertencia: no se pudo borrar la coleccion {name}: {e}")
+    directory = compact_index_dir(persist_directory, name)
+    shutil.rmtree(directory, ignore_errors=True)
+    if os.path.exists(f"{directory}.lock"):
+        os.unlink(f"{directory}.lock")
+
+
+def drop_retired_collections(persist_directory: str = "./chroma_db",
+                             grace: float = RETIRED_COLLECTION_GRACE) -> List[str]:
+    """
+    Borra las colecciones retiradas hace mas de grace segundos.
+
+    Returns:
+        Nombres de las colecciones borradas
+    """
+    with write_lock(persist_directory):
+        pointer = _read_pointer(persist_directory)
+        expired = [name for name, retired_at in pointer["retired"].items() if time.time() - retired_at >= grace]
+        for name in expired:
+            drop_collection(persist_directory, name)
+            del pointer["retired"][name]
+        if expired:
+            _write_pointer(persist_directory, pointer)
+            print(f"Colecciones anteriores borradas: {', '.join(expired)}")
+            try:
+                compact_chunk_store(persist_directory)
+            except Exception as e:
+                print(f"Advertencia: no se pudo compactar chunk_store: {e}")
+    return expired
+
+
+def compact_chunk_store(persist_directory: str = "./chroma_db") -> Optional[Dict]:
+    """
+    Quita de chunk_store los textos que ya no usa ninguna coleccion de la
+    carpeta: la activa, las retiradas que aun no se borraron y la que se
+    este armando en un reindexado. No se hace con CHUNK_STORE_DIR definido,
+    porque ese almacen puede ser compartido por otras carpetas.
+
+    Returns:
+        Resultado de ChunkStore.compact, o None si no se compacto
+    """
+    store_dir = default_store_dir(persist_directory)
+    if not CHUNK_STORE or CHUNK_STORE_DIR or not os.path.isdir(store_dir):
+        return None
+    # Con el candado, ninguna escritura queda entre put_many y collection.add
+    with write_lock(persist_directory):
+        client = chroma_client(persist_directory)
+        keep = set()
+        for listed in client.list_collections():
+            collection = client.get_collection(getattr(listed, "name", listed))
+            for offset in range(0, collection.count(), COMPACT_PAGE_ROWS):
+                page = collection.get(include=["metadatas"], limit=COMPACT_PAGE_ROWS, offset=offset)
+                keep.update(metadata["content_hash"] for metadata in page["metadatas"]
+                            if metadata and metadata.get("content_hash"))
+        store = ChunkStore(store_dir)
+        try:
+            result = store.compact(keep)
+        finally:
+            store.close()
+    print(f"chunk_store compactado: {result['chunks_before']} -> {result['chunks_after']} textos, "
+          f"{result['bytes_before'] / 1e6:.2f} -> {result['bytes_after'] / 1e6:.2f} MB")
+    return result
+
+
+def schedule_retired_drop(persist_directory: str, grace: float = RETIRED_COLLECTION_GRACE):
+    """Borra en segundo plano las colecciones retiradas cuando vence su plazo."""
+    def run():
+        try:
+            drop_retired_collections(persist_directory, grace)
+        except Exception as e:
+            print(f"Advertencia: no se pudieron borrar las colecciones anteriores: {e}")
+
+    timer = threading.Timer(grace, run)
+    timer.daemon = True
+    timer.start()
+
+
+def open_collection(persist_directory: str = "./chroma_db", name: Optional[str] = None):
+    """
+    Abre (o crea) una coleccion persistente de ChromaDB del corpus.
+
+    Args:
+        persist_directory: Carpeta de ChromaDB
+        name: Coleccion a abrir (None = la activa)
+    """
+    name = name or active_collection_name(persist_directory)
+    embedding_function = get_embedding_function()
+    model_name = embedding_model_name(embedding_function)
+    options = {"embedding_function": embedding_function} if embedding_function is not None else {}
+
+    client = chroma_client(persist_directory)
+    try:
+        collection = client.get_or_create_collection(
+            name=name,
+            metadata={"description": "Corpus de electromagnetismo por categorias", "embedding_model": model_name,
+                      **hnsw_metadata()},
+            **options
+        )
+    except ValueError as e:
+        # ChromaDB >= 1.0 no abre con otra funcion una coleccion creada con la por
+        # defecto: se abre sin ella y la advertencia de abajo pide reindexar
+        print(f"Advertencia: {e}")
+        collection = client.get_collection(name=name)
+    indexed_model = (collection.metadata or {}).get("embedding_model", DEFAULT_MODEL_NAME)
+    if indexed_model != model_name:
+        print(f"Advertencia: el indice se genero con {indexed_model} y las consultas usan {model_name}; "
+              "reindexar el corpus")
+    for key, (current, wanted) in hnsw_mismatches(collection).items():
+        print(f"Advertencia: el indice HNSW tiene {key}={current} y se configuro {wanted}; reindexar el corpus")
+    _apply_search_ef(collection)
+    return collection
+
+
+def warm_up_collection(collection, n_results: int = 9):
+    """Una consulta por categoria directo a la coleccion (carga modelo de embeddings e indice)."""
+    collection.query(query_texts=normalize_batch(list(WARM_UP_QUERIES.values())), n_results=n_results,
+                     include=["metadatas", "distances"])
 
 
 class ElectromagnetismRAG:
     """Sistema RAG para consultas de electromagnetismo."""
 
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db", service_url: Optional[str] = RETRIEVAL_SERVICE_URL,
+                 require_llm: bool = True):
+        """
+        Args:
+            persist_directory: Carpeta de ChromaDB
+            service_url: URL del servicio de recuperacion compartido (opcional)
+            require_llm: Si False, no exige ANTHROPIC_API_KEY (indexacion, evaluacion)
+        """
         self.persist_directory = persist_directory
-        self.chroma_client = chromadb.PersistentClient(path=persist_directory)
-        self.collection = self.chroma_client.get_or_create_collection(
-            name="electromagnetism_corpus",
-            metadata={"description": "Corpus de electromagnetismo por categorias"}
-        )
+        self.batch_size = INDEX_BATCH_SIZE
+        self._remote = bool(service_url)
+        self._index_target = index_identity(persist_directory)
+        self._swap_checked_at = time.monotonic()
+        self._reloading = threading.Lock()
+        if service_url:
+            from retrieval_service import RemoteCollection
+            self.collection = RemoteCollection(service_url)
+        else:
+            self.collection = open_collection(persist_directory)
         api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
+        if not api_key and require_llm:
             raise ValueError("ANTHROPIC_API_KEY no encontrada en variables de entorno")
-        self.anthropic_client = anthropic.Anthropic(api_key=api_key)
+        self._api_key = api_key
+        self._anthropic_client = None
+        self._executor = None
+        self._space = None
+        # Texto de los chunks fuera de ChromaDB (ver chunk_store.py)
+        self.chunk_store = ChunkStore(default_store_dir(persist_directory)) if CHUNK_STORE else None
+        # Indice int8 para las consultas en vez del HNSW (ver compact_index.py)
+        self.compact_index = None if service_url else open_compact_index(
+            compact_index_dir(persist_directory, self.collection.name), self.collection)
+        # Contadores del proceso que expone metrics_server.py
+        self._metrics_lock = threading.Lock()
+        self.llm_in_flight = 0
+        self.answers_total = 0
+        self.answer_errors_total = 0
+        self.answer_latencies = deque(maxlen=LATENCY_WINDOW)
+        # Por ruta de model_router.py: llamadas, errores, tokens, costo y latencia del LLM
+        self.route_stats = {
+            name: {"calls": 0, "errors": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0,
+                   "latencies": deque(maxlen=LATENCY_WINDOW)}
+            for name in ROUTES
+        }
 
-    def index_corpus(self, corpus_path: str = CORPUS_PATH):
+    @property
+    def anthropic_client(self):
+        """Cliente de Anthropic, creado en la primera consulta al LLM."""
+        if self._anthropic_client is None:
+            import anthropic
+            self._anthropic_client = anthropic.Anthropic(api_key=self._api_key)
+        return self._anthropic_client
+
+    def _chunk_metadata(self, chunk: Dict, source: Optional[str] = None) -> Dict:
+        """Construye la metadata que se guarda en ChromaDB para un chunk."""
+        category = chunk["category"]
+        metadata = {
+            "source": source or chunk["source"],
+            "category": category,
+            "category_display": CATEGORIES.get(category, category),
+            "chunk_number": chunk["chunk_number"],
+            "file_type": chunk["file_type"]
+        }
+        # Enlaces padre/hijo del chunker estructural
+        for key in STRUCTURE_KEYS:
+            if key in chunk:
+                metadata[key] = chunk[key]
+        # Firma para colapsar casi duplicados al consultar (dedup_chunks ya la calculo)
+        signature = chunk["minhash"] if "minhash" in chunk else signature_key(chunk["content"])
+        if signature:
+            metadata["minhash"] = signature
+        return metadata
+
+    def add_chunks(self, chunks: List[Dict], source: Optional[str] = None) -> int:
+        """
+        Agrega chunks ya extraidos a la coleccion, con IDs nuevos.
+
+        Args:
+            chunks: Chunks producidos por los procesadores de TeX/PDF
+            source: Nombre de archivo a registrar (p. ej. el nombre original de una subida)
+
+        Returns:
+            Numero de chunks agregados
+        """
+        if not chunks:
+            return 0
+        self._write_chunks([c["content"] for c in chunks], [self._chunk_metadata(c, source) for c in chunks])
+        return len(chunks)
+
+    def _write_lock(self):
+        """Candado de escritura de chroma_db entre procesos (ver write_lock.py)."""
+        return write_lock(self.persist_directory)
+
+    def _reserve_doc_ids(self, count: int) -> int:
+        """
+        Reserva count IDs doc_N consecutivos y devuelve el primero. El
+        contador (doc_ids.json) es unico para todas las colecciones de la
+        carpeta; si no existe se inicializa desde los IDs de la coleccion.
+        """
+        path = os.path.join(self.persist_directory, DOC_ID_FILE)
+        with self._write_lock():
+            try:
+                with open(path, encoding="utf-8") as f:
+                    next_id = json.load(f)["next"]
+            except FileNotFoundError:
+                next_id = self._scan_next_doc_id()
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"next": next_id + count}, f)
+            os.replace(tmp_path, path)
+        return next_id
+
+    def _scan_next_doc_id(self) -> int:
+        """Siguiente numero libre de IDs doc_N segun la coleccion."""
+        if self.collection.count() == 0:
+            return 0
+        existing = self.collection.get(include=[])
+        return max([int(i.replace("doc_", "")) for i in existing["ids"] if i.startswith("doc_")] or [0]) + 1
+
+    def _embed(self, documents: List[str]) -> List:
+        """Embeddings de los documentos en lotes de self.batch_size, sin el candado de escritura."""
+        embeddings = []
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            with span("embed", documents=len(batch)):
+                embeddings.extend(document_embedding_function()(batch))
+        return embeddings
+
+    def _write_chunks(self, documents: List[str], metadatas: List[Dict], embeddings: Optional[List] = None):
+        """
+        Agrega chunks a la coleccion en lotes de self.batch_size. Los
+        embeddings de cada lote se calculan sin el candado de escritura (o
+        llegan ya calculados); con el candado solo se reservan los IDs y se
+        confirma el lote, asi otros procesos pueden escribir entre lotes. Con
+        chunk_store activo, ChromaDB recibe solo los embeddings y la metadata
+        (con el content_hash del texto).
+        """
+        for start in range(0, len(documents), self.batch_size):
+            end = start + self.batch_size
+            batch_documents, batch_metadatas = documents[start:end], metadatas[start:end]
+            batch_embeddings = embeddings[start:end] if embeddings is not None else self._embed(batch_documents)
+            with self._write_lock():
+                first = self._reserve_doc_ids(len(batch_documents))
+                ids = [f"doc_{first + i}" for i in range(len(batch_documents))]
+                self._write_batch(batch_documents, batch_metadatas, ids, batch_embeddings)
+
+    def _write_batch(self, documents: List[str], metadatas: List[Dict], ids: List[str], embeddings):
+        with span("upsert", documents=len(documents)):
+            compact = self._compact_for_write()
+            if self.chunk_store is not None:
+                for metadata, key in zip(metadatas, self.chunk_store.put_many(documents)):
+                    metadata["content_hash"] = key
+                self.collection.add(embeddings=embeddings, metadatas=metadatas, ids=ids)
+            else:
+                self.collection.add(documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids)
+            if compact is not None:
+                compact.append(ids, embeddings, [metadata["category"] for metadata in metadatas])
+
+    def _compact_for_write(self) -> Optional[CompactIndex]:
+        """
+        Indice int8 de la coleccion al que agregar un lote, lo use o no este
+        proceso para consultar (un worker con VECTOR_INDEX=hnsw debe
+        mantenerlo al dia para la app). Solo si esta completo: con el
+        candado tomado, la coleccion no cambia entre la comparacion y el add.
+        """
+        index = self.compact_index or CompactIndex(compact_index_dir(self.persist_directory, self.collection.name))
+        if not index.open():
+            return None
+        return index if index.count == self.collection.count() else None
+
+    def index_corpus(self, corpus_path: str = CORPUS_PATH,
+                     progress_callback: Optional[Callable[[float, str], None]] = None,
+                     categories: Optional[List[str]] = None, workers: Optional[int] = None,
+                     extract: Optional[Callable[[List[Tuple[str, str]]], List[Dict]]] = None) -> int:
+        """
+        Indexa todas las categorias del corpus (o solo las indicadas).
+
+        Args:
+            corpus_path: Carpeta raiz del corpus
+            progress_callback: Funcion opcional (fraccion, mensaje) para reportar avance.
+                Puede lanzar una excepcion para cancelar la indexacion.
+            categories: Carpetas de categoria a indexar (None = todas las de CATEGORIES)
+            workers: Procesos de extraccion (None = INGEST_WORKERS)
+            extract: Reemplaza a ingest.process_files para extraer los chunks
+                de una lista de (ruta, categoria), p. ej. index_profile.profile_files
+
+        Returns:
+            Numero de chunks indexados
+        """
+        with span("index", corpus=corpus_path):
+            return self._index_corpus(corpus_path, progress_callback, categories, workers, extract)
+
+    def _index_corpus(self, corpus_path: str, progress_callback: Optional[Callable[[float, str], None]],
+                      categories: Optional[List[str]], workers: Optional[int],
+                      extract: Optional[Callable[[List[Tuple[str, str]]], List[Dict]]]) -> int:
+        selected = categories or list(CATEGORIES)
+        all_chunks, indexed_files = self._extract_categories(corpus_path, selected, progress_callback, workers, extract)
+        # Huellas de los archivos (antes de dedup: un archivo puede quedar solo como alias)
+        entries = self._manifest_entries(indexed_files, all_chunks)
+        added = self._store_chunks(self._dedup(all_chunks, progress_callback), progress_callback)
+        with self._write_lock():
+            manifest = {} if categories is None else {
+                key: digest for key, digest in self.load_manifest().items() if key.split("/", 1)[0] not in selected}
+            manifest.update(entries)
+            self.save_manifest(manifest)
+        return added
+
+    def _extract_categories(self, corpus_path: str, selected: List[str],
+                            progress_callback: Optional[Callable[[float, str], None]], workers: Optional[int],
+                            extract: Optional[Callable[[List[Tuple[str, str]]], List[Dict]]]
+                            ) -> Tuple[List[Dict], List[Tuple[str, str]]]:
+        """Extrae los chunks de las categorias (sin escribir nada). Returns: (chunks, archivos)."""
+        from ingest import INGEST_WORKERS, list_category_files, process_files
+
+        if extract is None:
+            extract = lambda files: process_files(files, workers or INGEST_WORKERS)  # noqa: E731
         print(f"Indexando corpus desde {corpus_path}...")
-        documents = []
-        metadatas = []
-        ids = []
-        doc_id = 0
+        all_chunks, indexed_files = [], []
+
+        for step, category_folder in enumerate(selected):
+            category_name = CATEGORIES.get(category_folder, category_folder)
+            if progress_callback:
+                progress_callback(0.85 * step / len(selected), f"Procesando {category_name}")
 
-        for category_folder, category_name in CATEGORIES.items():
             category_path = os.path.join(corpus_path, category_folder)
             if not os.path.exists(category_path):
                 print(f"  Advertencia: Carpeta {category_folder} no existe")
                 continue
 
             print(f"  Procesando categoria: {category_name}")
-            chunks = process_all_files_in_category(category_path, category_folder)
-
-            for chunk in chunks:
-                documents.append(chunk["content"])
-                metadatas.append({
-                    "source": chunk["source"],
-                    "category": chunk["category"],
-                    "category_display": category_name,
-                    "chunk_number": chunk["chunk_number"],
-                    "file_type": chunk["file_type"]
-                })
-                ids.append(f"doc_{doc_id}")
-                doc_id += 1
-
-        if documents:
-            self.collection.add(documents=documents, metadatas=metadatas, ids=ids)
-            print(f"Total: {len(documents)} documentos indexados.")
-        else:
+            files = [(path, category_folder) for path in list_category_files(category_path)]
+            all_chunks.extend(extract(files))
+            indexed_files.extend(files)
+        return all_chunks, indexed_files
+
+    @staticmethod
+    def _dedup(chunks: List[Dict], progress_callback: Optional[Callable[[float, str], None]] = None) -> List[Dict]:
+        """Versiones del mismo material (.tex/.pdf, pautas v1/v2, formas A/B): una sola copia."""
+        if not (DEDUP_ENABLED and chunks):
+            return chunks
+        if progress_callback:
+            progress_callback(0.85, "Eliminando fragmentos duplicados")
+        total = len(chunks)
+        chunks = dedup_chunks(chunks)
+        print(f"  Duplicados: {total} fragmentos -> {len(chunks)} ({total - len(chunks)} colapsados)")
+        return chunks
+
+    def _store_chunks(self, chunks: List[Dict], progress_callback: Optional[Callable[[float, str], None]] = None) -> int:
+        """Escribe chunks extraidos y reconstruye el indice int8. Returns: chunks escritos."""
+        if not chunks:
             print("No se encontraron documentos para indexar.")
+            return 0
+        if progress_callback:
+            progress_callback(0.9, f"Generando embeddings de {len(chunks)} fragmentos")
+        self._write_chunks([chunk["content"] for chunk in chunks], [self._chunk_metadata(chunk) for chunk in chunks])
+        print(f"Total: {len(chunks)} documentos indexados.")
+        self._build_compact_index()
+        return len(chunks)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.persist_directory, MANIFEST_FILE)
+
+    def load_manifest(self) -> Dict[str, str]:
+        """Archivos indexados: {"categoria/nombre": huella SHA-256} (ver ingest.load_manifest)."""
+        from ingest import load_manifest
+        return load_manifest(self.manifest_path)
+
+    def save_manifest(self, manifest: Dict[str, str]):
+        from ingest import save_manifest
+        save_manifest(self.manifest_path, manifest)
+
+    @staticmethod
+    def _manifest_entries(files: List[Tuple[str, str]], chunks: List[Dict]) -> Dict[str, str]:
+        """
+        Huellas de los archivos procesados. Un archivo sin chunks (un PDF
+        escaneado sin OCR, pdfplumber ausente, un error de extraccion) no se
+        registra, para que una corrida posterior lo vuelva a procesar; solo
+        se registran los que el extractor omitio a proposito (ver
+        ingest.FileSkipped).
+        """
+        from ingest import file_digest, is_skipped, manifest_key
+
+        produced = {(chunk["category"], chunk["source"]) for chunk in chunks}
+        return {
+            manifest_key(path, category): file_digest(path)
+            for path, category in files
+            if (category, os.path.basename(path)) in produced or is_skipped(path)
+        }
+
+    def corpus_changes(self, corpus_path: str = CORPUS_PATH,
+                       categories: Optional[List[str]] = None) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """
+        Compara el corpus con el manifiesto de la ultima indexacion.
+
+        Args:
+            corpus_path: Carpeta raiz del corpus
+            categories: Carpetas de categoria a revisar (None = todas)
+
+        Returns:
+            (archivos nuevos o modificados como (ruta, categoria),
+             claves "categoria/nombre" de archivos borrados)
+        """
+        from ingest import file_digest, list_category_files, manifest_key
+
+        manifest = self.load_manifest()
+        selected = categories or list(CATEGORIES)
+        changed, present = [], set()
+        for category in selected:
+            category_path = os.path.join(corpus_path, category)
+            if not os.path.isdir(category_path):
+                continue
+            for path in list_category_files(category_path):
+                key = manifest_key(path, category)
+                present.add(key)
+                if manifest.get(key) != file_digest(path):
+                    changed.append((path, category))
+        deleted = [key for key in manifest if key.split("/", 1)[0] in selected and key not in present]
+        return changed, deleted
+
+    def _file_chunks(self, keys: List[str]) -> Tuple[List[str], set]:
+        """
+        Chunks de los archivos indicados.
+
+        Args:
+            keys: Claves "categoria/nombre"
+
+        Returns:
+            (IDs de sus chunks, nombres de archivos cuyo contenido solo esta
+             como alias de estos chunks y hay que volver a extraer)
+        """
+        ids, alias_sources = [], set()
+        for key in keys:
+            category, source = key.split("/", 1)
+            where = {"$and": [{"source": source}, {"category": category}]}
+            found = self.collection.get(where=where, include=["metadatas"])
+            ids.extend(found["ids"])
+            for metadata in found["metadatas"] or []:
+                alias_sources.update(name for name in (metadata or {}).get("alias_sources", "").split("; ") if name)
+        return ids, alias_sources
+
+    def _prepare_chunks(self, chunks: List[Dict]) -> Tuple[List[str], List[Dict], List]:
+        """Textos, metadata y embeddings de chunks extraidos, calculados sin el candado de escritura."""
+        documents = [chunk["content"] for chunk in chunks]
+        return documents, [self._chunk_metadata(chunk) for chunk in chunks], self._embed(documents)
+
+    def _replace_chunks(self, old_ids: List[str], prepared: Tuple[List[str], List[Dict], List]) -> int:
+        """
+        Escribe los chunks nuevos (ya embebidos, ver _prepare_chunks) y luego
+        borra los anteriores, con el candado de escritura tomado: las
+        consultas ven la version anterior o la nueva de un archivo, nunca
+        ninguna. El indice int8 se actualiza despues, sin el candado (ver
+        _refresh_compact_index). Returns: chunks agregados.
+        """
+        documents, metadatas, embeddings = prepared
+        with self._write_lock():
+            if documents:
+                self._write_chunks(documents, metadatas, embeddings)
+            if old_ids:
+                self.collection.delete(ids=old_ids)
+        return len(documents)
+
+    def _refresh_compact_index(self, removed: int, added: int):
+        """Indice int8 tras _replace_chunks; se llama sin el candado de escritura."""
+        if removed and self.compact_index is not None:
+            # Los vectores borrados no se pueden quitar del indice int8 en su lugar
+            self._build_compact_index()
+        elif added and self.compact_index is None:
+            self._build_compact_index()
+
+    def sync_files(self, changed: List[Tuple[str, str]], deleted: List[str], corpus_path: str = CORPUS_PATH,
+                   workers: Optional[int] = None,
+                   extract: Optional[Callable[[List[Tuple[str, str]]], List[Dict]]] = None) -> Dict[str, int]:
+        """
+        Actualiza la coleccion con archivos nuevos, modificados o borrados
+        del corpus, sin reindexar el resto.
+
+        Los duplicados se colapsan solo entre los archivos actualizados; la
+        deduplicacion contra el resto del corpus la hace el reindexado
+        completo. Si un archivo borrado o modificado era la copia canonica
+        de otro, ese otro tambien se vuelve a extraer. La extraccion corre
+        y los embeddings corren sin el candado de escritura; el reemplazo de
+        los chunks y del manifiesto, con el.
+
+        Args:
+            changed: Archivos nuevos o modificados, como (ruta, categoria)
+            deleted: Claves "categoria/nombre" de archivos borrados
+            corpus_path: Carpeta raiz del corpus (para ubicar archivos alias)
+            workers: Procesos de extraccion (None = INGEST_WORKERS)
+            extract: Reemplaza a ingest.process_files (ver index_corpus)
+
+        Returns:
+            {"files": archivos procesados, "removed": chunks borrados, "added": chunks agregados}
+        """
+        from ingest import INGEST_WORKERS, manifest_key, process_files
+
+        if extract is None:
+            extract = lambda files: process_files(files, workers or INGEST_WORKERS)  # noqa: E731
+        manifest = self.load_manifest()
+        changed = list(changed)
+        pending = {manifest_key(path, category) for path, category in changed}
+        _, alias_sources = self._file_chunks(list(pending) + list(deleted))
+        # Archivos que quedarian sin su copia canonica
+        for key in manifest:
+            category, source = key.split("/", 1)
+            path = os.path.join(corpus_path, category, source)
+            if source in alias_sources and key not in pending and key not in deleted and os.path.exists(path):
+                changed.append((path, category))
+                pending.add(key)
+
+        with span("index", corpus=corpus_path, files=len(changed)):
+            chunks = extract(changed) if changed else []
+            entries = self._manifest_entries(changed, chunks)
+            if DEDUP_ENABLED and chunks:
+                chunks = dedup_chunks(chunks)
+            prepared = self._prepare_chunks(chunks)
+            with self._write_lock():
+                # Los IDs se leen con el candado: otro proceso pudo reemplazar estos archivos
+                old_ids, _ = self._file_chunks(list(pending) + list(deleted))
+                added = self._replace_chunks(old_ids, prepared)
+                manifest = self.load_manifest()
+                for key in list(deleted) + list(pending):
+                    manifest.pop(key, None)
+                manifest.update(entries)
+                self.save_manifest(manifest)
+            self._refresh_compact_index(len(old_ids), added)
+        return {"files": len(changed) + len(deleted), "removed": len(old_ids), "added": added}
+
+    def replace_files(self, files: List[Tuple[str, str]], workers: Optional[int] = None,
+                      extract: Optional[Callable[[List[Tuple[str, str]]], List[Dict]]] = None) -> Dict[str, int]:
+        """
+        Indexa archivos de fuera del corpus (indexer.py file con --category,
+        add_single_pdf.py) reemplazando los chunks que ya tuviera la misma
+        clave "categoria/nombre": indexar dos veces un archivo no duplica sus
+        fragmentos. No se registran en el manifiesto, porque corpus_changes
+        los tomaria como borrados del corpus.
+
+        Args:
+            files: Archivos como (ruta, categoria)
+            workers: Procesos de extraccion (None = INGEST_WORKERS)
+            extract: Reemplaza a ingest.process_files (ver index_corpus)
+
+        Returns:
+            {"files": archivos procesados, "removed": chunks borrados, "added": chunks agregados}
+        """
+        from ingest import INGEST_WORKERS, manifest_key, process_files
+
+        if extract is None:
+            extract = lambda files: process_files(files, workers or INGEST_WORKERS)  # noqa: E731
+        keys = [manifest_key(path, category) for path, category in files]
+        shadowed = [key for key in keys if key in self.load_manifest()]
+        if shadowed:
+            print(f"Advertencia: {', '.join(shadowed)} tambien es un archivo del corpus; sus chunks se reemplazan")
+        with span("index", files=len(files)):
+            chunks = extract(files)
+            if DEDUP_ENABLED and chunks:
+                chunks = dedup_chunks(chunks)
+            prepared = self._prepare_chunks(chunks)
+            with self._write_lock():
+                old_ids, _ = self._file_chunks(keys)
+                added = self._replace_chunks(old_ids, prepared)
+            self._refresh_compact_index(len(old_ids), added)
+        return {"files": len(files), "removed": len(old_ids), "added": added}
+
+    def reindex_categories(self, categories: List[str], corpus_path: str = CORPUS_PATH,
+                           workers: Optional[int] = None,
+                           extract: Optional[Callable[[List[Tuple[str, str]]], List[Dict]]] = None) -> int:
+        """
+        Vuelve a indexar solo las categorias indicadas: extrae sus archivos
+        y luego reemplaza sus chunks (ver _replace_chunks).
+
+        Returns:
+            Chunks borrados
+        """
+        with span("index", corpus=corpus_path, categories=len(categories)):
+            chunks, files = self._extract_categories(corpus_path, categories, None, workers, extract)
+            entries = self._manifest_entries(files, chunks)
+            prepared = self._prepare_chunks(self._dedup(chunks))
+            with self._write_lock():
+                old_ids = []
+                for category in categories:
+                    old_ids.extend(self.collection.get(where={"category": category}, include=[])["ids"])
+                added = self._replace_chunks(old_ids, prepared)
+                manifest = {key: digest for key, digest in self.load_manifest().items()
+                            if key.split("/", 1)[0] not in categories}
+                manifest.update(entries)
+                self.save_manifest(manifest)
+            self._refresh_compact_index(len(old_ids), added)
+        return len(old_ids)
+
+    def _build_compact_index(self):
+        """
+        Reconstruye el indice int8 si VECTOR_INDEX (y el presupuesto de
+        memoria) lo piden. La lectura de la coleccion corre sin el candado de
+        escritura; si otro proceso escribio entretanto (y no pudo agregar sus
+        vectores a un indice incompleto), se reconstruye otra vez con el
+        candado tomado.
+        """
+        sample = self.collection.get(include=["embeddings"], limit=1)
+        if sample["embeddings"] is None or not len(sample["embeddings"]):
+            return
+        if not wants_compact(self.collection.count(), len(sample["embeddings"][0])):
+            return
+        index = CompactIndex(compact_index_dir(self.persist_directory, self.collection.name))
+        count = index.build(self.collection)
+        with self._write_lock():
+            if count != self.collection.count():
+                count = index.build(self.collection)
+        print(f"  Indice int8: {count} vectores")
+        self.compact_index = index
 
     def retrieve_relevant_problems(self, query: str, n_results: int = 3, category_filter: Optional[str] = None) -> List[Dict]:
+        return self.retrieve_relevant_problems_batch([query], n_results, category_filter)[0]
+
+    def retrieve_relevant_problems_batch(self, queries: List[str], n_results: int = 3,
+                                         category_filter: Optional[str] = None) -> List[List[Dict]]:
+        """
+        Recupera documentos para varias consultas con una sola llamada a
+        collection.query (embeddings y busqueda vectorizados).
+
+        Args:
+            queries: Consultas a resolver
+            n_results: Documentos por consulta
+            category_filter: Categoria a filtrar ("todos" o None para no filtrar)
+
+        Returns:
+            Una lista de documentos relevantes por cada consulta, en el mismo orden
+        """
+        if not queries:
+            return []
+        self._check_index_swap()
+        with span("retrieve", queries=len(queries), category=category_filter or "todos") as trace:
+            batch = self._retrieve_batch(queries, n_results, category_filter)
+            trace.set(documents=sum(len(docs) for docs in batch))
+        return batch
+
+    def _retrieve_batch(self, queries: List[str], n_results: int,
+                        category_filter: Optional[str]) -> List[List[Dict]]:
         where_filter = None
         if category_filter and category_filter != "todos":
             where_filter = {"category": category_filter}
 
-        results = self.collection.query(query_texts=[query], n_results=n_results, where=where_filter)
-
-        relevant = []
-        if results["documents"]:
-            for i, doc in enumerate(results["documents"][0]):
-                relevant.append({
-                    "content": doc,
-                    "metadata": results["metadatas"][0][i] if results["metadatas"] else {},
-                    "distance": results["distances"][0][i] if results["distances"] else None
-                })
-        return relevant
-
-    def generate_response(self, user_question: str, conversation_history: List[Dict] = None, category_filter: Optional[str] = None) -> str:
-        relevant_docs = self.retrieve_relevant_problems(user_question, n_results=3, category_filter=category_filter)
-
-        context = "## Material de referencia relevante:\n\n"
-        for i, doc in enumerate(relevant_docs, 1):
-            cat_display = doc["metadata"].get("category_display", "N/A")
-            source = doc["metadata"].get("source", "N/A")
-            context += f"### Documento {i} - Tema: {cat_display}\n"
-            context += f"Fuente: {source}\n\n"
-            context += f"{doc['content'][:1500]}\n\n---\n\n"
+        # Se piden mas candidatos porque varios hijos del mismo problema (y las
+        # copias casi iguales de un mismo material) se colapsan en uno
+        # Las consultas pasan por la misma normalizacion matematica que los documentos
+        query_texts = normalize_batch(queries)
+        include = self._include("metadatas", "distances")
+        if self.compact_index is not None:
+            with span("embed", queries=len(query_texts)):
+                query_embeddings = document_embedding_function()(query_texts)
+            results = self.compact_index.query(self.collection, query_embeddings, n_results * 3, where_filter, include)
+        else:
+            results = self.collection.query(query_texts=query_texts, n_results=n_results * 3,
+                                            where=where_filter, include=include)
+
+        result_ids = results.get("ids") or []
+        documents = results.get("documents") or []
+        metadatas = results.get("metadatas") or []
+        distances = results.get("distances") or []
+
+        batch = []
+        for q in range(len(queries)):
+            relevant = []
+            if q < len(result_ids):
+                for i, doc_id in enumerate(result_ids[q]):
+                    relevant.append({
+                        "id": doc_id,
+                        "content": documents[q][i] if documents else None,
+                        "metadata": (metadatas[q][i] if metadatas else None) or {},
+                        "distance": distances[q][i] if distances else None
+                    })
+            batch.append(relevant)
+
+        parents = self._fetch_parents(doc for docs in batch for doc in docs)
+        self._load_contents([doc for docs in batch for doc in docs] + list(parents.values()))
+        return [
+            collapse_duplicates(collapse_to_parents(docs, parents, len(docs)), n_results)
+            for docs in batch
+        ]
+
+    def _check_index_swap(self):
+        """Si ./chroma_db apunta a otra version del indice o coleccion, la abre en segundo plano."""
+        now = time.monotonic()
+        if self._remote or now - self._swap_checked_at < INDEX_SWAP_CHECK_SECONDS:
+            return
+        self._swap_checked_at = now
+        if index_identity(self.persist_directory) != self._index_target and self._reloading.acquire(blocking=False):
+            threading.Thread(target=self._reload_in_background, name="index-reload", daemon=True).start()
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"Advertencia: no se pudo abrir la nueva version del indice: {e}")
+        finally:
+            self._reloading.release()
+
+    def reload(self):
+        """
+        Reabre la coleccion activa y su indice int8 desde disco (p. ej. tras
+        index_bundle.py install o un reindexado en otro proceso). Las
+        consultas siguen usando los anteriores hasta que los nuevos estan
+        abiertos y calientes. chunk_store detecta solo el cambio de archivos.
+        """
+        target = index_identity(self.persist_directory)
+        collection = open_collection(self.persist_directory, target[1])
+        compact = open_compact_index(compact_index_dir(self.persist_directory, collection.name), collection)
+        if WARM_UP and collection.count():
+            warm_up_collection(collection)
+        self.collection, self.compact_index = collection, compact
+        self._index_target = target
+        print(f"Indice recargado desde {target[0]}, coleccion {target[1]} ({collection.count()} fragmentos)")
+
+    def _fetch_parents(self, docs) -> Dict[tuple, Dict]:
+        """Trae en una sola llamada los chunks padre de los hijos recuperados."""
+        wanted = {
+            (doc["metadata"].get("category"), doc["metadata"].get("source"), doc["metadata"]["parent_id"])
+            for doc in docs if doc["metadata"] and doc["metadata"].get("parent_id")
+        }
+        if not wanted:
+            return {}
+        clauses = [
+            {"$and": [{"category": category}, {"source": source}, {"chunk_number": parent_id}]}
+            for category, source, parent_id in wanted
+        ]
+        where = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+        try:
+            found = self.collection.get(where=where, include=self._include("metadatas"))
+        except Exception as e:
+            print(f"Advertencia: no se pudieron obtener los problemas completos: {e}")
+            return {}
+        parents = {}
+        documents = found.get("documents") or []
+        for i, (doc_id, metadata) in enumerate(zip(found.get("ids") or [], found.get("metadatas") or [])):
+            parents.setdefault((metadata.get("category"), metadata.get("source"), metadata.get("chunk_number")), {
+                "id": doc_id, "content": documents[i] if documents else None, "metadata": metadata
+            })
+        return parents
+
+    def _include(self, *fields: str) -> List[str]:
+        """Campos a pedir a ChromaDB: el texto solo si no esta en chunk_store."""
+        return list(fields) if self.chunk_store is not None else ["documents", *fields]
+
+    def _load_contents(self, docs: List[Dict]):
+        """
+        Completa el texto de los documentos recuperados desde chunk_store.
+        Los chunks indexados antes de chunk_store (sin content_hash) se piden
+        a ChromaDB en una sola llamada.
+        """
+        missing = [doc for doc in docs if doc["content"] is None]
+        if not missing:
+            return
+        for doc in missing:
+            key = doc["metadata"].get("content_hash")
+            if key:
+                doc["content"] = self.chunk_store.get(key)
+        legacy = {doc["id"]: doc for doc in missing if doc["content"] is None}
+        if legacy:
+            found = self.collection.get(ids=list(legacy), include=["documents"])
+            for doc_id, content in zip(found.get("ids") or [], found.get("documents") or []):
+                legacy[doc_id]["content"] = content
+        for doc in missing:
+            if doc["content"] is None:
+                doc["content"] = ""
+
+    def retrieve_with_expansion(self, query: str, n_results: int = 3,
+                                category_filter: Optional[str] = None,
+                                budget_ms: float = QUERY_EXPANSION_BUDGET_MS) -> List[Dict]:
+        """
+        Recupera para la consulta original y, en paralelo, para sus
+        sub-consultas reescritas; fusiona ambos resultados con RRF.
+
+        La consulta original siempre se espera completa. Las sub-consultas
+        solo se incluyen si terminan dentro de budget_ms.
+        """
+        from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+        from query_rewriter import rewrite_query, fuse_results
+
+        start = time.perf_counter()
+        subqueries = list(rewrite_query(query))
+        if len(subqueries) <= 1:
+            return self.retrieve_relevant_problems(query, n_results, category_filter)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+        expanded_future = self._executor.submit(
+            self.retrieve_relevant_problems_batch, subqueries, n_results, category_filter
+        )
+        primary = self.retrieve_relevant_problems(query, n_results, category_filter)
+
+        remaining = budget_ms / 1000 - (time.perf_counter() - start)
+        try:
+            expanded = expanded_future.result(timeout=max(remaining, 0))
+        except FutureTimeout:
+            return primary
+        except Exception as e:
+            print(f"Advertencia: expansion de consulta fallida: {e}")
+            return primary
+        return fuse_results([primary] + expanded, n_results)
+
+    def generate_response(self, user_question: str, conversation_history: List[Dict] = None, category_filter: Optional[str] = None,
+                          route: Optional[str] = None) -> str:
+        """
+        Responde una pregunta con el material de referencia recuperado.
+
+        Args:
+            user_question: Pregunta del estudiante
+            conversation_history: Mensajes anteriores del chat
+            category_filter: Categoria a filtrar ("todos" o None para no filtrar)
+            route: "simple" o "complejo" para no clasificar la pregunta (ver model_router.py)
+        """
+        start = time.perf_counter()
+        failed = True
+        try:
+            with span("answer", category=category_filter or "todos", history=len(conversation_history or [])):
+                response = self._generate_response(user_question, conversation_history, category_filter, route)
+            failed = False
+            return response
+        finally:
+            with self._metrics_lock:
+                self.answers_total += 1
+                self.answer_errors_total += failed
+                self.answer_latencies.append(time.perf_counter() - start)
+
+    def _distance_space(self) -> str:
+        """Metrica de las distancias de las consultas ("l2", "cosine" o "ip")."""
+        if self._space is None or self._space[0] != self._index_target:
+            # El indice int8 siempre devuelve distancia euclidiana al cuadrado
+            space = "l2" if self.compact_index is not None else _hnsw_settings(self.collection).get("hnsw:space", "l2")
+            self._space = (self._index_target, space)
+        return self._space[1]
+
+    def _select_context(self, user_question: str, category_filter: Optional[str]) -> Tuple[List[Dict], str]:
+        """Documentos de referencia para la pregunta y el motivo de cuantos se eligieron (adaptive_retrieval.py)."""
+        if ADAPTIVE_K and is_small_talk(user_question):
+            return [], "charla"
+        n_results = ADAPTIVE_MAX_K if ADAPTIVE_K else DEFAULT_K
+        if QUERY_EXPANSION:
+            docs = self.retrieve_with_expansion(user_question, n_results=n_results, category_filter=category_filter)
+        else:
+            docs = self.retrieve_relevant_problems(user_question, n_results=n_results, category_filter=category_filter)
+        if not ADAPTIVE_K:
+            return docs, "fijo"
+        return select_documents(docs, self._distance_space())
+
+    def _generate_response(self, user_question: str, conversation_history: Optional[List[Dict]],
+                           category_filter: Optional[str], route: Optional[str] = None) -> str:
+        relevant_docs, reason = self._select_context(user_question, category_filter)
+
+        # Un problema completo puede ocupar mas que un fragmento suelto; el
+        # presupuesto total se mantiene en el de antes (3 x 1500 caracteres)
+        with span("pack", documents=len(relevant_docs), policy=reason) as trace:
+            context = "## Material de referencia relevante:\n\n" if relevant_docs else ""
+            budget = CONTEXT_CHARS
+            for i, doc in enumerate(relevant_docs, 1):
+                if budget <= 0:
+                    break
+                cat_display = doc["metadata"].get("category_display", "N/A")
+                source = doc["metadata"].get("source", "N/A")
+                content = doc["content"][:budget]
+                budget -= len(content)
+                context += f"### Documento {i} - Tema: {cat_display}\n"
+                context += f"Fuente: {source}\n\n"
+                context += f"{content}\n\n---\n\n"
+            trace.set(context_chars=len(context))
 
         system_prompt = """Eres un asistente experto en electromagnetismo para estudiantes de ingenieria.
 
@@ -113,20 +1125,97 @@ IMPORTANTE:
 - Explica los conceptos fisicos detras de las ecuaciones
 - Manten un tono educativo y de apoyo"""
 
-        user_message = f"{context}\n\n## Pregunta del estudiante:\n{user_question}"
+        if context:
+            user_message = f"{context}\n\n## Pregunta del estudiante:\n{user_question}"
+        else:
+            user_message = user_question
 
         messages = []
         if conversation_history:
             messages.extend(conversation_history)
         messages.append({"role": "user", "content": user_message})
 
-        response = self.anthropic_client.messages.create(
-            model="claude-sonnet-4-6",
-            max_tokens=4096,
-            system=system_prompt,
-            messages=messages
-        )
-        return response.content[0].text
+        chosen, reason = choose_route(user_question, conversation_history, route)
+        try:
+            return self._call_model(chosen, reason, system_prompt, messages)
+        except Exception as e:
+            if chosen is COMPLEX:
+                raise
+            # Modelo chico caido (p. ej. el servidor local): responde el grande
+            print(f"Advertencia: el modelo {chosen.model} fallo ({e}); se usa {COMPLEX.model}")
+            return self._call_model(COMPLEX, "respaldo", system_prompt, messages)
+
+    def _call_model(self, route: Route, reason: str, system_prompt: str, messages: List[Dict]) -> str:
+        """Llama al modelo de la ruta y registra su latencia, tokens y costo."""
+        start = time.perf_counter()
+        stats = self.route_stats[route.name]
+        with span("generate", model=route.model, route=route.name, reason=reason) as trace:
+            with self._metrics_lock:
+                self.llm_in_flight += 1
+                stats["calls"] += 1
+            try:
+                if route.backend == "anthropic":
+                    response = self.anthropic_client.messages.create(
+                        model=route.model,
+                        max_tokens=route.max_tokens,
+                        system=system_prompt,
+                        messages=messages
+                    )
+                    text = response.content[0].text
+                    usage = getattr(response, "usage", None)
+                    tokens = (usage.input_tokens, usage.output_tokens) if usage is not None else None
+                else:
+                    text, *tokens = generate_local(route, system_prompt, messages)
+            except Exception:
+                with self._metrics_lock:
+                    stats["errors"] += 1
+                raise
+            finally:
+                with self._metrics_lock:
+                    self.llm_in_flight -= 1
+            if tokens is not None:
+                trace.set(input_tokens=tokens[0], output_tokens=tokens[1])
+        with self._metrics_lock:
+            stats["latencies"].append(time.perf_counter() - start)
+            if tokens is not None:
+                stats["input_tokens"] += tokens[0]
+                stats["output_tokens"] += tokens[1]
+                stats["cost_usd"] += route.cost(*tokens)
+        return text
+
+    def metrics_snapshot(self) -> Dict:
+        """
+        Contadores y medidas actuales del proceso (ver metrics_server.py).
+
+        Returns:
+            Diccionario con llamadas al LLM en curso, respuestas, errores,
+            percentiles de latencia, llamadas, tokens, costo y latencia por
+            ruta de model_router.py, tamanio del indice y aciertos de cache
+        """
+        with self._metrics_lock:
+            latencies = sorted(self.answer_latencies)
+            snapshot = {
+                "llm_in_flight": self.llm_in_flight,
+                "answers_total": self.answers_total,
+                "answer_errors_total": self.answer_errors_total,
+            }
+            routes = {name: dict(stats, latencies=sorted(stats["latencies"])) for name, stats in self.route_stats.items()}
+        for name, q in (("answer_p50_seconds", 0.5), ("answer_p95_seconds", 0.95)):
+            snapshot[name] = latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+        for stats in routes.values():
+            route_latencies = stats.pop("latencies")
+            for name, q in (("p50_seconds", 0.5), ("p95_seconds", 0.95)):
+                stats[name] = (route_latencies[min(int(q * len(route_latencies)), len(route_latencies) - 1)]
+                               if route_latencies else 0.0)
+        snapshot["routes"] = routes
+        snapshot["index_documents"] = self.collection.count()
+        if self.chunk_store is not None:
+            snapshot["chunk_store_cache_hits"] = self.chunk_store.cache_hits
+            snapshot["chunk_store_cache_misses"] = self.chunk_store.cache_misses
+            snapshot["chunk_store_bytes"] = os.path.getsize(self.chunk_store.data_path)
+        if self.compact_index is not None:
+            snapshot["compact_index_bytes"] = self.compact_index.memory_bytes()["resident"]
+        return snapshot
 
     def get_collection_stats(self) -> Dict:
         count = self.collection.count()
@@ -136,17 +1225,149 @@ IMPORTANTE:
         stats = {}
         for category_key in CATEGORIES.keys():
             try:
-                results = self.collection.get(where={"category": category_key})
+                results = self.collection.get(where={"category": category_key}, include=[])
                 stats[category_key] = len(results["ids"]) if results["ids"] else 0
             except Exception:
                 stats[category_key] = 0
         return stats
 
-    def clear_and_reindex(self, corpus_path: str = CORPUS_PATH):
-        existing = self.collection.get()
-        if existing["ids"]:
-            self.collection.delete(ids=existing["ids"])
-        self.index_corpus(corpus_path)
+    def clear_and_reindex(self, corpus_path: str = CORPUS_PATH,
+                          progress_callback: Optional[Callable[[float, str], None]] = None,
+                          workers: Optional[int] = None,
+                          extract: Optional[Callable[[List[Tuple[str, str]]], List[Dict]]] = None) -> int:
+        """
+        Reindexa todo el corpus en una coleccion nueva mientras las consultas
+        siguen usando la activa. Al terminar, la nueva pasa a ser la activa
+        con un solo reemplazo atomico de active_collection.json (los demas
+        procesos la abren y calientan antes de cambiar) y la anterior se borra
+        en segundo plano tras RETIRED_COLLECTION_GRACE segundos. Si la
+        indexacion falla, se cancela o no produce documentos, la coleccion
+        nueva se descarta y la activa queda intacta.
+
+        La coleccion nueva se crea con el modelo de embeddings y los
+        parametros HNSW configurados. chunk_store no se vacia: direcciona por
+        contenido, asi que los textos que no cambiaron se reutilizan.
+
+        Returns:
+            Numero de chunks de la coleccion nueva
+        """
+        name = new_collection_name()
+        # Las escrituras a la coleccion activa durante el reindexado reciben IDs desde aqui
+        first_id = self._reserve_doc_ids(0)
+        if self._remote:
+            shadow = self.collection.create_collection(name)
+        else:
+            drop_retired_collections(self.persist_directory)
+            shadow = open_collection(self.persist_directory, name)
+        # Misma configuracion (chunk_store, tamanio de lote) escribiendo en la coleccion nueva
+        builder = copy.copy(self)
+        builder.collection, builder.compact_index = shadow, None
+        try:
+            with span("index", corpus=corpus_path):
+                chunks, files = builder._extract_categories(corpus_path, list(CATEGORIES), progress_callback,
+                                                            workers, extract)
+                manifest = self._manifest_entries(files, chunks)
+                added = builder._store_chunks(self._dedup(chunks, progress_callback), progress_callback)
+        except BaseException:
+            self._discard_collection(name)
+            raise
+        if not added:
+            self._discard_collection(name)
+            print("Advertencia: el reindexado no produjo documentos; se mantiene la coleccion actual")
+            return 0
+
+        if WARM_UP and not self._remote:
+            # La coleccion nueva aun no esta activa: se calienta sin el candado
+            warm_up_collection(shadow)
+        with self._write_lock():
+            added += builder._carry_over(self.collection, first_id, self._reserve_doc_ids(0), manifest)
+            if self._remote:
+                self.collection.activate(name)
+            else:
+                previous = activate_collection(self.persist_directory, name)
+                self.collection, self.compact_index = shadow, builder.compact_index
+                self._index_target = index_identity(self.persist_directory)
+            self.save_manifest(manifest)
+        if not self._remote:
+            schedule_retired_drop(self.persist_directory)
+            print(f"Coleccion activa: {name} (la anterior, {previous}, se borra en "
+                  f"{RETIRED_COLLECTION_GRACE:g} s)")
+        return added
+
+    def _carry_over(self, active, first_id: int, last_id: int, manifest: Dict[str, str]) -> int:
+        """
+        Copia a la coleccion nueva los chunks escritos en la activa mientras
+        se reindexaba (IDs reservados entre first_id y last_id), salvo los de
+        archivos del corpus, que el reindexado ya extrajo. Asi no se pierden
+        las subidas confirmadas durante el reindexado. Se llama con el
+        candado tomado.
+
+        Returns:
+            Chunks copiados
+        """
+        candidates = [f"doc_{n}" for n in range(first_id, last_id)]
+        copied = 0
+        for start in range(0, len(candidates), self.batch_size):
+            # Casi todos son IDs de la coleccion nueva y no estan en la activa
+            found = active.get(ids=candidates[start:start + self.batch_size],
+                               include=["embeddings", "metadatas", "documents"])
+            documents = found.get("documents") or [None] * len(found["ids"])
+            rows = [i for i, metadata in enumerate(found["metadatas"])
+                    if f"{(metadata or {}).get('category')}/{(metadata or {}).get('source')}" not in manifest]
+            if not rows:
+                continue
+            compact = self._compact_for_write()
+            self.collection.add(
+                ids=[found["ids"][i] for i in rows],
+                embeddings=[found["embeddings"][i] for i in rows],
+                metadatas=[found["metadatas"][i] for i in rows],
+                **({"documents": [documents[i] for i in rows]} if any(documents[i] for i in rows) else {})
+            )
+            if compact is not None:
+                compact.append([found["ids"][i] for i in rows], [found["embeddings"][i] for i in rows],
+                               [(found["metadatas"][i] or {}).get("category", "") for i in rows])
+            copied += len(rows)
+        if copied:
+            print(f"  {copied} fragmentos agregados durante el reindexado se copiaron a la coleccion nueva")
+        return copied
+
+    def _discard_collection(self, name: str):
+        try:
+            if self._remote:
+                self.collection.drop_collection(name)
+            else:
+                drop_collection(self.persist_directory, name)
+        except Exception as e:
+            print(f"Advertencia: no se pudo descartar la coleccion {name}: {e}")
+
+    def warm_up(self, rounds: int = 2) -> List[float]:
+        """
+        Ejecuta consultas representativas (una por categoria, con y sin filtro)
+        para cargar el modelo de embeddings, el indice vectorial y las paginas
+        de metadata y de chunk_store antes de la primera pregunta real.
+
+        Args:
+            rounds: Repeticiones; la ultima ya deberia medir la latencia en caliente
+
+        Returns:
+            Milisegundos de cada ronda
+        """
+        timings = []
+        try:
+            if self.collection.count() == 0:
+                return timings
+            for _ in range(rounds):
+                start = time.perf_counter()
+                self.retrieve_relevant_problems_batch(list(WARM_UP_QUERIES.values()), n_results=3)
+                for category, query in WARM_UP_QUERIES.items():
+                    self.retrieve_relevant_problems(query, n_results=3, category_filter=category)
+                timings.append((time.perf_counter() - start) * 1000)
+        except Exception as e:
+            print(f"Advertencia: calentamiento fallido: {e}")
+            return timings
+        print("Calentamiento: " + " -> ".join(f"{ms:.0f} ms" for ms in timings)
+              + f" ({2 * len(WARM_UP_QUERIES)} consultas por ronda)")
+        return timings
 
     def index_tex_files(self, directory: str = "."):
         self.index_corpus(directory)
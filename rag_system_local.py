@@ -4,9 +4,10 @@ Configuracion flexible para despliegue universitario.
 """
 import os
 from typing import List, Dict, Optional
-import chromadb
-from chromadb.config import Settings
-from tex_processor import process_all_files_in_category
+
+from tracing import span
+
+# chromadb y los extractores se importan de forma diferida (ver rag_system.py)
 
 # Definicion de categorias (temas del curso)
 CATEGORIES = {
@@ -29,12 +30,11 @@ class ElectromagnetismRAG:
     """Sistema RAG para consultas de electromagnetismo con soporte multi-backend."""
 
     def __init__(self, persist_directory: str = "./chroma_db"):
+        # Misma coleccion y funcion de embeddings que rag_system
+        from rag_system import open_collection
+
         self.persist_directory = persist_directory
-        self.chroma_client = chromadb.PersistentClient(path=persist_directory)
-        self.collection = self.chroma_client.get_or_create_collection(
-            name="electromagnetism_corpus",
-            metadata={"description": "Corpus de electromagnetismo por categorias"}
-        )
+        self.collection = open_collection(persist_directory)
 
         # Inicializar cliente segun backend
         self.backend = LLM_BACKEND
@@ -70,6 +70,8 @@ class ElectromagnetismRAG:
 
     def index_corpus(self, corpus_path: str = CORPUS_PATH):
         """Indexa el corpus de documentos."""
+        from tex_processor import process_all_files_in_category
+
         print(f"Indexando corpus desde {corpus_path}...")
         documents = []
         metadatas = []
@@ -112,11 +114,18 @@ class ElectromagnetismRAG:
         results = self.collection.query(query_texts=[query], n_results=n_results, where=where_filter)
 
         relevant = []
+        store = None
         if results["documents"]:
             for i, doc in enumerate(results["documents"][0]):
+                metadata = results["metadatas"][0][i] if results["metadatas"] else {}
+                if doc is None and metadata.get("content_hash"):
+                    # Los indices de rag_system guardan el texto en chunk_store
+                    from chunk_store import ChunkStore, default_store_dir
+                    store = store or ChunkStore(default_store_dir(self.persist_directory))
+                    doc = store.get(metadata["content_hash"]) or ""
                 relevant.append({
                     "content": doc,
-                    "metadata": results["metadatas"][0][i] if results["metadatas"] else {},
+                    "metadata": metadata,
                     "distance": results["distances"][0][i] if results["distances"] else None
                 })
         return relevant
@@ -176,11 +185,31 @@ class ElectromagnetismRAG:
         )
         return response.choices[0].message.content
 
-    def generate_response(self, user_question: str, conversation_history: List[Dict] = None, category_filter: Optional[str] = None) -> str:
-        """Genera respuesta usando el backend configurado."""
-        relevant_docs = self.retrieve_relevant_problems(user_question, n_results=3, category_filter=category_filter)
-
-        context = "## Material de referencia relevante:\n\n"
+    def generate_response(self, user_question: str, conversation_history: List[Dict] = None, category_filter: Optional[str] = None,
+                          route: Optional[str] = None) -> str:
+        """Genera respuesta usando el backend configurado (un solo modelo: route se ignora)."""
+        with span("answer", backend=self.backend, category=category_filter or "todos"):
+            return self._generate_response(user_question, conversation_history, category_filter)
+
+    def _generate_response(self, user_question: str, conversation_history: Optional[List[Dict]],
+                           category_filter: Optional[str]) -> str:
+        from adaptive_retrieval import ADAPTIVE_K, ADAPTIVE_MAX_K, DEFAULT_K, is_small_talk, select_documents
+
+        with span("retrieve", queries=1) as trace:
+            # Misma profundidad adaptativa que rag_system (ver adaptive_retrieval.py)
+            if ADAPTIVE_K and is_small_talk(user_question):
+                relevant_docs, reason = [], "charla"
+            else:
+                relevant_docs = self.retrieve_relevant_problems(
+                    user_question, n_results=ADAPTIVE_MAX_K if ADAPTIVE_K else DEFAULT_K, category_filter=category_filter)
+                reason = "fijo"
+                if ADAPTIVE_K:
+                    from rag_system import _hnsw_settings
+                    relevant_docs, reason = select_documents(
+                        relevant_docs, _hnsw_settings(self.collection).get("hnsw:space", "l2"))
+            trace.set(documents=len(relevant_docs), policy=reason)
+
+        context = "## Material de referencia relevante:\n\n" if relevant_docs else ""
         for i, doc in enumerate(relevant_docs, 1):
             cat_display = doc["metadata"].get("category_display", "N/A")
             source = doc["metadata"].get("source", "N/A")
@@ -202,7 +231,10 @@ IMPORTANTE:
 - Explica los conceptos fisicos detras de las ecuaciones
 - Manten un tono educativo y de apoyo"""
 
-        user_message = f"{context}\n\n## Pregunta del estudiante:\n{user_question}"
+        if context:
+            user_message = f"{context}\n\n## Pregunta del estudiante:\n{user_question}"
+        else:
+            user_message = user_question
 
         messages = []
         if conversation_history:
@@ -210,14 +242,15 @@ IMPORTANTE:
         messages.append({"role": "user", "content": user_message})
 
         # Seleccionar backend para generacion
-        if self.backend == "anthropic":
-            return self._generate_with_anthropic(messages, system_prompt)
-        elif self.backend == "ollama":
-            return self._generate_with_ollama(messages, system_prompt)
-        elif self.backend in ["vllm", "openai_compatible"]:
-            return self._generate_with_openai_compatible(messages, system_prompt)
-        else:
-            raise ValueError(f"Backend no soportado: {self.backend}")
+        with span("generate", backend=self.backend, model=LOCAL_MODEL_NAME if self.backend != "anthropic" else "claude-sonnet-4-20250514"):
+            if self.backend == "anthropic":
+                return self._generate_with_anthropic(messages, system_prompt)
+            elif self.backend == "ollama":
+                return self._generate_with_ollama(messages, system_prompt)
+            elif self.backend in ["vllm", "openai_compatible"]:
+                return self._generate_with_openai_compatible(messages, system_prompt)
+            else:
+                raise ValueError(f"Backend no soportado: {self.backend}")
 
     def get_collection_stats(self) -> Dict:
         """Obtiene estadisticas de la coleccion."""
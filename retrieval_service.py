@@ -0,0 +1,464 @@
+"""
+Servicio local de recuperacion compartido entre procesos de la app.
+
+Un unico proceso abre ChromaDB (indice HNSW + modelo de embeddings) y lo
+expone por HTTP, sobre TCP o un socket Unix. Los procesos de Streamlit usan
+RemoteCollection, que imita la interfaz de una coleccion de Chroma, asi que
+se pueden correr N workers de la app detras de nginx sin N copias del indice
+en RAM. Las consultas concurrentes se agrupan en una sola llamada
+vectorizada a collection.query.
+
+El servicio es ademas el unico escritor de ChromaDB: cada proceso que abre
+./chroma_db por su cuenta mantiene su propia copia del indice y no ve los
+vectores que agregan los demas. Las escrituras que recibe se aplican de a
+una; las operaciones de varios pasos de los clientes (reemplazar los chunks
+de un archivo, reservar IDs) se coordinan con write_lock.py.
+
+Uso:
+    python retrieval_service.py --port 8765
+    python retrieval_service.py --unix-socket /run/electroai/retrieval.sock
+
+Y en el .env de la app:
+    RETRIEVAL_SERVICE_URL=http://127.0.0.1:8765
+    RETRIEVAL_SERVICE_URL=unix:///run/electroai/retrieval.sock
+"""
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+DEFAULT_PORT = 8765
+
+# Ventana de agrupacion de consultas concurrentes
+BATCH_MAX_WAIT = float(os.getenv("RETRIEVAL_BATCH_WAIT_MS", "5")) / 1000
+BATCH_MAX_SIZE = int(os.getenv("RETRIEVAL_BATCH_SIZE", "64"))
+
+# Cada cuanto se revisa si ./chroma_db apunta a otra version del indice o coleccion
+INDEX_SWAP_CHECK_SECONDS = 2.0
+
+# Operaciones de la coleccion expuestas por el servicio
+_COLLECTION_OPS = ("get", "count", "add", "upsert", "delete")
+# Las escrituras se aplican de a una (las consultas no esperan por ellas)
+_WRITE_OPS = ("add", "upsert", "delete")
+
+
+# Campos de collection.query con una lista por consulta
+_PER_QUERY_FIELDS = ("ids", "documents", "metadatas", "distances", "embeddings", "uris", "data")
+
+
+def _to_jsonable(value):
+    """Convierte arreglos de numpy (embeddings, distancias) a listas."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {k: _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    return value
+
+
+class _PendingQuery:
+    def __init__(self, query_texts: List[str], options: Dict):
+        self.query_texts = query_texts
+        self.options = options
+        self.key = json.dumps(options, sort_keys=True)
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class QueryBatcher:
+    """
+    Agrupa consultas concurrentes con las mismas opciones (n_results, where,
+    include) en una sola llamada a collection.query.
+    """
+
+    def __init__(self, service: "RetrievalService", max_wait: float = BATCH_MAX_WAIT, max_size: int = BATCH_MAX_SIZE):
+        self.service = service
+        self.max_wait = max_wait
+        self.max_size = max_size
+        self._queue: "queue.Queue[_PendingQuery]" = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, query_texts: List[str], **options) -> Dict:
+        pending = _PendingQuery(query_texts, options)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0].query_texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item.query_texts)
+
+            groups: Dict[str, List[_PendingQuery]] = {}
+            for item in batch:
+                groups.setdefault(item.key, []).append(item)
+            for items in groups.values():
+                self._run_group(items)
+
+    def _run_group(self, items: List[_PendingQuery]):
+        texts = [t for item in items for t in item.query_texts]
+        try:
+            results = self.service.collection.query(query_texts=texts, **items[0].options)
+        except Exception as e:
+            for item in items:
+                item.error = e
+                item.done.set()
+            return
+
+        results = _to_jsonable(results)
+        offset = 0
+        for item in items:
+            n = len(item.query_texts)
+            # Solo las listas con un resultado por consulta; "included" y el resto se copian
+            item.result = {
+                key: (value[offset:offset + n] if key in _PER_QUERY_FIELDS and isinstance(value, list) else value)
+                for key, value in results.items()
+            }
+            offset += n
+            item.done.set()
+
+
+class RetrievalService:
+    """Duenio unico de la coleccion de ChromaDB en el servidor."""
+
+    def __init__(self, persist_directory: str = "./chroma_db"):
+        self.persist_directory = persist_directory
+        self._lock = threading.Lock()
+        self._reloading = threading.Lock()
+        self._writing = threading.Lock()
+        self._swap_checked_at = time.monotonic()
+        self.collection = None
+        # Colecciones de reindexados en curso (ver ElectromagnetismRAG.clear_and_reindex)
+        self._building: Dict[str, object] = {}
+        self.reload()
+        self.batcher = QueryBatcher(self)
+
+    def reload(self):
+        """Reabre la coleccion (p. ej. tras reemplazar el indice en disco)."""
+        from rag_system import WARM_UP, index_identity, open_collection, warm_up_collection
+
+        target = index_identity(self.persist_directory)
+        collection = open_collection(self.persist_directory, target[1])
+        # Se calienta antes de reemplazar a la coleccion que esta sirviendo
+        if WARM_UP and collection.count():
+            warm_up_collection(collection)
+        with self._lock:
+            self.collection = collection
+            self.index_target = target
+
+    def _check_index_swap(self):
+        """
+        Si ./chroma_db apunta a otra version del indice (index_bundle.py) o
+        a otra coleccion activa, la abre en segundo plano.
+        """
+        from rag_system import index_identity
+
+        now = time.monotonic()
+        if now - self._swap_checked_at < INDEX_SWAP_CHECK_SECONDS:
+            return
+        self._swap_checked_at = now
+        if index_identity(self.persist_directory) != self.index_target and self._reloading.acquire(blocking=False):
+            def run():
+                try:
+                    self.reload()
+                    print(f"Indice recargado: {self.index_target[0]}, coleccion {self.index_target[1]}")
+                except Exception as e:
+                    print(f"Advertencia: no se pudo abrir la nueva version del indice: {e}")
+                finally:
+                    self._reloading.release()
+            threading.Thread(target=run, name="index-reload", daemon=True).start()
+
+    def create_collection(self, name: str):
+        """Crea la coleccion vacia de un reindexado; las escrituras la indican con "collection"."""
+        from rag_system import open_collection
+
+        with self._lock:
+            self._building[name] = open_collection(self.persist_directory, name)
+
+    def activate(self, name: str) -> str:
+        """
+        Pasa las consultas a la coleccion name (ya calentada) y programa el
+        borrado de la anterior.
+
+        Returns:
+            Nombre de la coleccion anterior
+        """
+        from rag_system import (WARM_UP, activate_collection, index_identity, schedule_retired_drop,
+                                warm_up_collection)
+
+        collection = self._building.get(name)
+        if collection is None:
+            raise ValueError(f"La coleccion {name} no se creo en este servicio")
+        if WARM_UP and collection.count():
+            warm_up_collection(collection)
+        previous = activate_collection(self.persist_directory, name)
+        with self._lock:
+            self.collection = collection
+            self.index_target = index_identity(self.persist_directory)
+            self._building.pop(name, None)
+        schedule_retired_drop(self.persist_directory)
+        print(f"Coleccion activa: {name} ({collection.count()} fragmentos); se retira {previous}")
+        return previous
+
+    def drop_collection(self, name: str):
+        """Descarta la coleccion de un reindexado fallido o cancelado."""
+        from rag_system import drop_collection
+
+        with self._lock:
+            self._building.pop(name, None)
+        drop_collection(self.persist_directory, name)
+
+    def handle(self, op: str, kwargs: Dict):
+        if op == "query":
+            self._check_index_swap()
+            query_texts = kwargs.pop("query_texts")
+            return self.batcher.submit(query_texts, **kwargs)
+        if op == "info":
+            collection = self.collection
+            return {"name": collection.name, "count": collection.count(),
+                    "metadata": _to_jsonable(collection.metadata),
+                    "configuration": _to_jsonable(getattr(collection, "configuration_json", None))}
+        if op == "reload":
+            self.reload()
+            return {"ok": True}
+        if op == "create_collection":
+            self.create_collection(kwargs["name"])
+            return {"ok": True}
+        if op == "activate":
+            return {"previous": self.activate(kwargs["name"])}
+        if op == "drop_collection":
+            self.drop_collection(kwargs["name"])
+            return {"ok": True}
+        if op in _COLLECTION_OPS:
+            name = kwargs.pop("collection", None)
+            collection = self.collection if name is None else self._building.get(name)
+            if collection is None:
+                raise ValueError(f"La coleccion {name} no se creo en este servicio")
+            if op in _WRITE_OPS:
+                with self._writing:
+                    return _to_jsonable(getattr(collection, op)(**kwargs))
+            return _to_jsonable(getattr(collection, op)(**kwargs))
+        raise KeyError(op)
+
+
+def _make_handler(service: RetrievalService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: Dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            op = self.path.strip("/")
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                kwargs = json.loads(self.rfile.read(length) or b"{}")
+                self._send(200, {"result": service.handle(op, kwargs)})
+            except KeyError:
+                self._send(404, {"error": f"operacion desconocida: {op}"})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+
+        def address_string(self):
+            # En sockets Unix client_address no es una tupla (host, puerto)
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RemoteCollection:
+    """
+    Cliente del servicio con la misma interfaz que una coleccion de Chroma
+    (query, get, count, add, upsert, delete). Mantiene una conexion por hilo.
+    Sin collection, opera sobre la coleccion activa; con collection, sobre
+    la coleccion de un reindexado en curso (solo escrituras y lecturas).
+    """
+
+    def __init__(self, url: str, timeout: float = 60, collection: Optional[str] = None):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+        self._collection = collection
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            parsed = urlparse(self.url)
+            if parsed.scheme == "unix":
+                conn = _UnixHTTPConnection(parsed.path, self.timeout)
+            else:
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or DEFAULT_PORT, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, op: str, **kwargs):
+        body = json.dumps(_to_jsonable(kwargs))
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request("POST", f"/{op}", body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                payload = json.loads(response.read())
+                break
+            except TimeoutError:
+                # El servicio pudo haber aplicado la operacion: no se repite
+                conn.close()
+                self._local.conn = None
+                raise
+            except (ConnectionError, http.client.HTTPException, OSError):
+                # Conexion caida (p. ej. reinicio del servicio): reintentar una vez
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"Servicio de recuperacion: {payload.get('error')}")
+        return payload["result"]
+
+    @property
+    def name(self) -> str:
+        # La coleccion activa cambia con cada reindexado
+        return self._collection or self._call("info")["name"]
+
+    @property
+    def metadata(self) -> Optional[Dict]:
+        return self._call("info")["metadata"]
+
+    @property
+    def configuration_json(self) -> Optional[Dict]:
+        # Parametros HNSW de la coleccion del servicio (metrica de las distancias)
+        return self._call("info")["configuration"]
+
+    def query(self, query_texts: List[str], n_results: int = 10, where: Optional[Dict] = None, **kwargs) -> Dict:
+        return self._call("query", query_texts=query_texts, n_results=n_results, where=where, **kwargs)
+
+    def _collection_call(self, op: str, **kwargs):
+        if self._collection is not None:
+            kwargs["collection"] = self._collection
+        return self._call(op, **kwargs)
+
+    def get(self, **kwargs) -> Dict:
+        return self._collection_call("get", **kwargs)
+
+    def count(self) -> int:
+        return self._collection_call("count")
+
+    def add(self, **kwargs):
+        return self._collection_call("add", **kwargs)
+
+    def upsert(self, **kwargs):
+        return self._collection_call("upsert", **kwargs)
+
+    def delete(self, **kwargs):
+        return self._collection_call("delete", **kwargs)
+
+    def create_collection(self, name: str) -> "RemoteCollection":
+        """Crea en el servicio la coleccion vacia de un reindexado y devuelve su cliente."""
+        self._call("create_collection", name=name)
+        return RemoteCollection(self.url, self.timeout, collection=name)
+
+    def activate(self, name: str) -> str:
+        """Pasa las consultas del servicio a la coleccion name; devuelve la anterior."""
+        return self._call("activate", name=name)["previous"]
+
+    def drop_collection(self, name: str):
+        return self._call("drop_collection", name=name)
+
+    def reload(self):
+        """Pide al servicio reabrir el indice desde disco."""
+        return self._call("reload")
+
+
+def serve(persist_directory: str = "./chroma_db", host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+          unix_socket: Optional[str] = None):
+    """Inicia el servicio y bloquea hasta recibir Ctrl+C."""
+    service = RetrievalService(persist_directory)
+    handler = _make_handler(service)
+
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server = _ThreadingUnixHTTPServer(unix_socket, handler)
+        print(f"Servicio de recuperacion en unix://{unix_socket}")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        print(f"Servicio de recuperacion en http://{host}:{port}")
+
+    print(f"  Coleccion: {service.collection.name} ({service.collection.count()} fragmentos)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main() -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servicio de recuperacion compartido")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", help="Escuchar en un socket Unix en vez de TCP")
+    args = parser.parse_args()
+
+    serve(args.persist_directory, args.host, args.port, args.unix_socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,77 +3,374 @@ Procesador de archivos LaTeX para extraer contenido relevante.
 Convierte archivos .tex a texto limpio para ser usado en RAG.
 """
 import re
+from bisect import bisect_right
+from itertools import accumulate
 import os
-from typing import List, Dict
+import unicodedata
+from typing import List, Dict, Optional
+
+from chunker import chunk_document
+
+PAGE_BREAK = "\n---NUEVA PAGINA---\n"
+
+# re.split separa el documento en texto y tokens LaTeX; el conversor recorre
+# esa lista resolviendo cada token con tablas, con lo que las llaves anidadas
+# y los entornos sin cerrar se manejan sin volver a recorrer el texto.
+_SPLIT_RE = re.compile(r"(\\(?:[a-zA-Z@]+\*?|.)|[{}~]|\$\$?|%[^\n]*)", re.DOTALL)
+
+_ENV_NAME_RE = re.compile(r"\s*\{([^{}]*)\}")
+_ACCENT_BASE_RE = re.compile(r"\{(\\?[a-zA-Z])\}|\\?[a-zA-Z]")
+_BRACE_RE = re.compile(r"\\.|[{}]", re.DOTALL)
+_BRACKET_RE = re.compile(r"\\.|[{}\[\]]", re.DOTALL)
+_MATH_COMMENT_RE = re.compile(r"(?<!\\)%[^\n]*")
+_SPACES_RE = re.compile(r"(?<=\S)[ \t]{2,}")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n")
+
+# Entornos matematicos: se conserva el contenido tal cual
+_MATH_ENVS = {"equation", "align", "eqnarray", "gather", "multline", "displaymath", "math", "flalign", "alignat"}
+
+# Entornos que se omiten completos (contenido -> marcador)
+_SKIP_ENVS = {
+    "circuitikz": "[DIAGRAMA DE CIRCUITO]",
+    "tikzpicture": "[DIAGRAMA]",
+    "comment": "",
+}
+
+_LIST_ENVS = {"enumerate", "itemize", "description", "questions", "parts"}
+
+# Argumentos obligatorios a descartar al abrir otros entornos
+_ENV_ARGS = {"minipage": 1, "wrapfigure": 2, "tabular": 1, "tabularx": 2, "array": 1, "multicols": 1}
+
+# Comandos que envuelven su ultimo argumento: (argumentos descartados antes, apertura, cierre).
+# P. ej. \textcolor{azul}{texto} -> texto
+_WRAP_COMMANDS = {
+    "textbf": (0, "**", "**"),
+    "textit": (0, "*", "*"),
+    "emph": (0, "*", "*"),
+    "section": (0, "\n## ", "\n"),
+    "subsection": (0, "\n### ", "\n"),
+    "subsubsection": (0, "\n**", "**\n"),
+    "paragraph": (0, "\n**", "**\n"),
+    "textcolor": (1, "", ""),
+    "colorbox": (1, "", ""),
+    "raisebox": (1, "", ""),
+    "scalebox": (1, "", ""),
+    "href": (1, "", ""),
+    "multicolumn": (2, "", ""),
+    "fcolorbox": (2, "", ""),
+    "resizebox": (2, "", ""),
+}
+
+# Comandos que se reemplazan tras descartar N argumentos
+_REPLACE_COMMANDS = {
+    "includegraphics": (1, "[IMAGEN]"),
+    "FRAME": (8, "[IMAGEN]"),
+    "newpage": (0, PAGE_BREAK),
+    "clearpage": (0, PAGE_BREAK),
+    "pagebreak": (0, PAGE_BREAK),
+    "par": (0, "\n\n"),
+    "newline": (0, "\n"),
+    "linebreak": (0, "\n"),
+    "ldots": (0, "..."),
+    "dots": (0, "..."),
+    "quad": (0, " "),
+    "qquad": (0, " "),
+    "hfill": (0, " "),
+    "i": (0, "i"),
+    "j": (0, "j"),
+    "label": (1, ""), "ref": (1, ""), "eqref": (1, ""), "pageref": (1, ""), "cite": (1, ""),
+    "vspace": (1, ""), "hspace": (1, ""), "color": (1, ""), "pagestyle": (1, ""),
+    "thispagestyle": (1, ""), "fancyhead": (1, ""), "fancyfoot": (1, ""), "fancyhf": (1, ""),
+    "usetikzlibrary": (1, ""), "tikzset": (1, ""), "hypersetup": (1, ""), "special": (1, ""),
+    "documentclass": (1, ""), "usepackage": (1, ""), "geometry": (1, ""),
+    "setlength": (2, ""), "addtolength": (2, ""), "setcounter": (2, ""), "addtocounter": (2, ""),
+    "newcommand": (2, ""), "renewcommand": (2, ""), "providecommand": (2, ""), "def": (2, ""),
+    "newtheorem": (2, ""), "fancypagestyle": (2, ""), "rule": (2, ""), "fontsize": (2, ""),
+    "definecolor": (3, ""), "newenvironment": (3, ""), "renewenvironment": (3, ""),
+}
+
+# Simbolos de control: \% -> %, \, -> espacio, \\ -> salto de linea
+_CONTROL_SYMBOLS = {"%": "%", "$": "$", "&": "&", "#": "#", "_": "_", "{": "{", "}": "}",
+                    ",": " ", ";": " ", ":": " ", " ": " ", "\n": " ", "\\": "\n"}
+
+# Matematica con delimitadores \( \) y \[ \]
+_MATH_DELIMITERS = {"(": ("MATH: ", "\\)"), "[": ("ECUACION: ", "\\]")}
+
+# Acentos: \'a, \'{a}, \'\i -> caracter con tilde
+_ACCENTS = {"'": "\u0301", "`": "\u0300", "^": "\u0302", '"': "\u0308", "~": "\u0303"}
+
+
+def _compact_math(body: str) -> str:
+    if "%" in body:
+        body = _MATH_COMMENT_RE.sub("", body)
+    return " ".join(body.split())
+
+
+class _LatexToText:
+    """
+    Conversor LaTeX -> texto plano en una sola pasada.
+
+    Las llaves se resuelven con una pila de cierres: cada { apila el texto
+    que emitira su } correspondiente (p. ej. "**" tras \textbf{), por lo que
+    el anidamiento arbitrario se maneja sin recursion ni retroceso.
+    """
+
+    def __init__(self, src: str):
+        self.src = src
+        self.n = len(src)
+        self.pos = 0
+        self.list_depth = 0
+
+    def convert(self) -> str:
+        src = self.src
+        # Todo el preambulo se descarta de una vez
+        marker = src.find("\\begin{document}")
+        if marker != -1:
+            src = src[marker + len("\\begin{document}"):]
+        end_marker = src.rfind("\\end{document}")
+        if end_marker != -1:
+            src = src[:end_marker]
+        self.src = src
+        self.n = len(src)
+
+        # Indices pares: texto; impares: tokens
+        parts = _SPLIT_RE.split(src)
+        n_parts = len(parts)
+        # Posicion (en src) donde termina cada pieza
+        self.ends = ends = list(accumulate(map(len, parts)))
+        out: List[str] = []
+        append = out.append
+        closers: List[str] = []
+        i = 0
+
+        while i < n_parts:
+            piece = parts[i]
+            i += 1
+            if not piece:
+                continue
+            if i & 1:
+                append(piece)
+                continue
+
+            c = piece[0]
+            if c == "\\":
+                name = piece[1:]
+                if name in _REPLACE_COMMANDS or name in _WRAP_COMMANDS or len(name) == 1 \
+                        or name in ("begin", "end", "item") or name[-1] == "*":
+                    self.pos = offset = ends[i - 1]
+                    self._command(out, closers, name)
+                    if self.pos > offset:
+                        i = self._resync(parts)
+                # Cualquier otro comando se elimina; sus grupos {...} quedan como texto
+            elif c == "{":
+                closers.append("")
+            elif c == "}":
+                if closers:
+                    append(closers.pop())
+            elif c == "$":
+                offset = ends[i - 1]
+                end = src.find(piece, offset)
+                while end != -1 and src[end - 1] == "\\":
+                    end = src.find(piece, end + 1)
+                if end == -1:
+                    # Sin cierre: tratar el delimitador como texto
+                    append(piece)
+                    continue
+                prefix = "MATH: " if piece == "$" else "ECUACION: "
+                append(prefix + _compact_math(src[offset:end]))
+                self.pos = end + len(piece)
+                i = self._resync(parts)
+            elif c == "~":
+                append(" ")
+            # "%": comentario, se descarta
+
+        return "".join(out)
+
+    def _resync(self, parts: List[str]) -> int:
+        """Indice de la pieza donde sigue el recorrido tras consumir hasta self.pos."""
+        target = self.pos
+        ends = self.ends
+        j = bisect_right(ends, target)
+        if j < len(parts) and (ends[j - 1] if j else 0) < target:
+            # Texto consumido a medias (p. ej. tras \item[...]): conservar el resto
+            parts[j] = self.src[target:ends[j]] if not j & 1 else ""
+        return j
+
+    # -- argumentos ------------------------------------------------------
+
+    def _skip_spaces(self):
+        src, n = self.src, self.n
+        while self.pos < n and src[self.pos] in " \t\n":
+            self.pos += 1
+
+    def _matching(self, regex, open_char: str, close_char: str) -> int:
+        """Posicion del cierre que empareja la apertura en self.pos."""
+        depth = braces = 0
+        for m in regex.finditer(self.src, self.pos, self.n):
+            token = m.group()
+            if open_char != "{" and token in ("{", "}"):
+                # Un ] dentro de {...} no cierra el argumento opcional: \item[{a]}]
+                braces += 1 if token == "{" else -1
+            elif braces > 0:
+                continue
+            elif token == open_char:
+                depth += 1
+            elif token == close_char:
+                depth -= 1
+                if depth == 0:
+                    return m.start()
+        return self.n
+
+    def _raw_optional(self) -> Optional[str]:
+        """Consume un argumento opcional [...] y retorna su texto crudo."""
+        start = self.pos
+        self._skip_spaces()
+        if self.pos >= self.n or self.src[self.pos] != "[":
+            self.pos = start
+            return None
+        close = self._matching(_BRACKET_RE, "[", "]")
+        raw = self.src[self.pos + 1:close]
+        self.pos = close + 1
+        return raw
+
+    def _skip_optionals(self):
+        while self._raw_optional() is not None:
+            pass
+
+    def _skip_group(self):
+        self._skip_spaces()
+        if self.pos >= self.n:
+            return
+        if self.src[self.pos] == "{":
+            self.pos = self._matching(_BRACE_RE, "{", "}") + 1
+        elif self.src[self.pos] == "\\":
+            # Argumento de un solo comando, p. ej. \def\x
+            m = _SPLIT_RE.match(self.src, self.pos)
+            self.pos = m.end() if m else self.pos + 1
+
+    # -- construcciones --------------------------------------------------
+
+    def _command(self, out: List[str], closers: List[str], name: str):
+        if len(name) == 1 and not name.isalpha():
+            if name in _ACCENTS:
+                out.append(self._accent(name))
+            elif name in _MATH_DELIMITERS:
+                prefix, closer = _MATH_DELIMITERS[name]
+                end = self.src.find(closer, self.pos, self.n)
+                if end != -1:
+                    out.append(prefix + _compact_math(self.src[self.pos:end]))
+                    self.pos = end + len(closer)
+            else:
+                if name == "\\":
+                    self._raw_optional()
+                out.append(_CONTROL_SYMBOLS.get(name, ""))
+            return
+
+        base = name.rstrip("*")
+        if base == "begin" or base == "end":
+            m = _ENV_NAME_RE.match(self.src, self.pos, self.n)
+            if m is None:
+                return
+            self.pos = m.end()
+            if base == "begin":
+                self._begin(out, m.group(1).strip())
+            elif m.group(1).strip() in _LIST_ENVS and self.list_depth:
+                self.list_depth -= 1
+        elif base in _WRAP_COMMANDS:
+            nargs, prefix, suffix = _WRAP_COMMANDS[base]
+            self._skip_optionals()
+            for _ in range(nargs):
+                self._skip_group()
+                self._skip_optionals()
+            self._skip_spaces()
+            if self.pos < self.n and self.src[self.pos] == "{":
+                self.pos += 1
+                closers.append(suffix)
+                out.append(prefix)
+        elif base in _REPLACE_COMMANDS:
+            nargs, replacement = _REPLACE_COMMANDS[base]
+            if nargs:
+                self._skip_optionals()
+                for _ in range(nargs):
+                    self._skip_group()
+                    self._skip_optionals()
+            out.append(replacement)
+        elif base == "item":
+            # Los items anidados se sangran para conservar la jerarquia
+            bullet = "\n" + "  " * max(self.list_depth - 1, 0) + "- "
+            label = self._raw_optional()
+            if label is None:
+                out.append(bullet)
+            else:
+                out.append(bullet + _LatexToText(label).convert() + ": ")
+
+    def _accent(self, accent: str) -> str:
+        m = _ACCENT_BASE_RE.match(self.src, self.pos, self.n)
+        if m is None:
+            return ""
+        self.pos = m.end()
+        base = (m.group(1) or m.group())[-1]
+        return unicodedata.normalize("NFC", base + _ACCENTS[accent])
+
+    def _begin(self, out: List[str], name: str):
+        base = name.rstrip("*")
+        src = self.src
+
+        if base in _MATH_ENVS:
+            end_tag = "\\end{" + name + "}"
+            end = src.find(end_tag, self.pos, self.n)
+            if end == -1:
+                end = self.n
+            out.append("ECUACION: " + _compact_math(src[self.pos:end]))
+            self.pos = min(end + len(end_tag), self.n)
+        elif base in _SKIP_ENVS:
+            # Saltar hasta el \end correspondiente, respetando anidamiento
+            begin_tag, end_tag = "\\begin{" + name + "}", "\\end{" + name + "}"
+            if src.find(end_tag, self.pos, self.n) == -1:
+                # Sin cierre: no tragarse el resto del documento
+                out.append(_SKIP_ENVS[base])
+                return
+            depth = 1
+            while depth:
+                end = src.find(end_tag, self.pos, self.n)
+                if end == -1:
+                    self.pos = self.n
+                    break
+                nested = src.find(begin_tag, self.pos, end)
+                if nested != -1:
+                    depth += 1
+                    self.pos = nested + len(begin_tag)
+                else:
+                    depth -= 1
+                    self.pos = end + len(end_tag)
+            out.append(_SKIP_ENVS[base])
+        elif base in _LIST_ENVS:
+            self._skip_optionals()
+            self.list_depth += 1
+            out.append("\nLISTA:")
+        else:
+            # Entorno transparente: se descartan sus argumentos y se conserva el contenido
+            self._skip_optionals()
+            for _ in range(_ENV_ARGS.get(base, 0)):
+                self._skip_group()
+                self._skip_optionals()
 
 
 def clean_latex(text: str) -> str:
     """
     Limpia comandos LaTeX y deja el contenido matematico legible.
+
+    Recorre el documento una sola vez con un tokenizador: descarta el
+    preambulo, conserva las ecuaciones (ECUACION:/MATH:) tal cual, reemplaza
+    diagramas e imagenes por marcadores y resuelve llaves anidadas.
     """
-    # Eliminar comentarios
-    text = re.sub(r'%.*', '', text)
-
-    # Preservar ecuaciones importantes
-    text = re.sub(r'\\begin\{equation\}(.*?)\\end\{equation\}', r'ECUACION: \1', text, flags=re.DOTALL)
-    text = re.sub(r'\\begin\{align\*?\}(.*?)\\end\{align\*?\}', r'ECUACION: \1', text, flags=re.DOTALL)
-    text = re.sub(r'\\begin\{eqnarray\}(.*?)\\end\{eqnarray\}', r'ECUACION: \1', text, flags=re.DOTALL)
-    text = re.sub(r'\\\[(.*?)\\\]', r'ECUACION: \1', text, flags=re.DOTALL)
-    text = re.sub(r'\$\$(.*?)\$\$', r'ECUACION: \1', text, flags=re.DOTALL)
-    text = re.sub(r'\$(.*?)\$', r'MATH: \1', text)
-
-    # Eliminar entornos de dibujo
-    text = re.sub(r'\\begin\{circuitikz\}.*?\\end\{circuitikz\}', '[DIAGRAMA DE CIRCUITO]', text, flags=re.DOTALL)
-    text = re.sub(r'\\begin\{tikzpicture\}.*?\\end\{tikzpicture\}', '[DIAGRAMA]', text, flags=re.DOTALL)
-    text = re.sub(r'\\includegraphics.*?\{.*?\}', '[IMAGEN]', text)
-
-    # Eliminar comandos de formato
-    text = re.sub(r'\\documentclass.*', '', text)
-    text = re.sub(r'\\usepackage.*', '', text)
-    text = re.sub(r'\\geometry.*', '', text)
-    text = re.sub(r'\\begin\{document\}', '', text)
-    text = re.sub(r'\\end\{document\}', '', text)
-    text = re.sub(r'\\newpage', '\n---NUEVA PAGINA---\n', text)
-    text = re.sub(r'\\clearpage', '\n---NUEVA PAGINA---\n', text)
-
-    # Simplificar comandos de texto
-    text = re.sub(r'\\textbf\{(.*?)\}', r'**\1**', text)
-    text = re.sub(r'\\textit\{(.*?)\}', r'*\1*', text)
-    text = re.sub(r'\\textcolor\{[^}]+\}\{(.*?)\}', r'\1', text)
-    text = re.sub(r'\\section\*?\{(.*?)\}', r'\n## \1\n', text)
-    text = re.sub(r'\\subsection\*?\{(.*?)\}', r'\n### \1\n', text)
-    text = re.sub(r'\\paragraph\{(.*?)\}', r'\n**\1**\n', text)
-
-    # Limpiar entornos de listas
-    text = re.sub(r'\\begin\{enumerate\}.*?\{(.*?)\}', r'\nLISTA:', text)
-    text = re.sub(r'\\begin\{enumerate\}', '\nLISTA:', text)
-    text = re.sub(r'\\end\{enumerate\}', '', text)
-    text = re.sub(r'\\begin\{itemize\}', '\nLISTA:', text)
-    text = re.sub(r'\\end\{itemize\}', '', text)
-    text = re.sub(r'\\item\[(.*?)\]', r'\n- \1: ', text)
-    text = re.sub(r'\\item', '\n- ', text)
-
-    # Limpiar otros entornos
-    text = re.sub(r'\\begin\{minipage\}.*?\{.*?\}', '', text)
-    text = re.sub(r'\\end\{minipage\}', '', text)
-    text = re.sub(r'\\begin\{center\}', '', text)
-    text = re.sub(r'\\end\{center\}', '', text)
-    text = re.sub(r'\\begin\{wrapfigure\}.*?\{.*?\}', '', text)
-    text = re.sub(r'\\end\{wrapfigure\}', '', text)
-
-    # Eliminar comandos residuales
-    text = re.sub(r'\\[a-zA-Z]+\{([^}]*)\}', r'\1', text)
-    text = re.sub(r'\\[a-zA-Z]+', '', text)
-
-    # Limpiar espacios
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r' {2,}', ' ', text)
-
-    return text.strip()
+    text = _LatexToText(text).convert()
+    text = _SPACES_RE.sub(" ", text)
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
 
 
 def extract_chunks_from_tex(file_path: str, category: str) -> List[Dict[str, str]]:
-    """Extrae chunks de contenido de un archivo .tex."""
+    """Extrae chunks de un archivo .tex segun su estructura de problemas (ver chunker)."""
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
@@ -82,52 +379,16 @@ def extract_chunks_from_tex(file_path: str, category: str) -> List[Dict[str, str
             content = f.read()
 
     cleaned = clean_latex(content)
-    chunks = []
-    sections = re.split(r'---NUEVA PAGINA---|## Problema', cleaned)
-    filename = os.path.basename(file_path)
-
-    for i, section in enumerate(sections):
-        if section.strip():
-            chunks.append({
-                "source": filename,
-                "category": category,
-                "chunk_number": str(i),
-                "content": section.strip(),
-                "file_type": "tex"
-            })
-
-    return chunks
+    return chunk_document(cleaned, os.path.basename(file_path), category, "tex")
 
 
 def process_all_files_in_category(category_path: str, category_name: str) -> List[Dict]:
-    """Procesa todos los archivos (.tex y .pdf) en una carpeta de categoria."""
-    from pdf_processor import process_pdf_to_chunks
-
-    all_chunks = []
-
-    if not os.path.exists(category_path):
-        print(f"  Carpeta no existe: {category_path}")
-        return all_chunks
-
-    for file in os.listdir(category_path):
-        file_path = os.path.join(category_path, file)
-
-        if os.path.isdir(file_path) or file.startswith('.'):
-            continue
-
-        try:
-            if file.lower().endswith(".tex"):
-                print(f"    Procesando LaTeX: {file}")
-                chunks = extract_chunks_from_tex(file_path, category_name)
-                all_chunks.extend(chunks)
-            elif file.lower().endswith(".pdf"):
-                print(f"    Procesando PDF: {file}")
-                chunks = process_pdf_to_chunks(file_path, category_name)
-                all_chunks.extend(chunks)
-        except Exception as e:
-            print(f"    Error procesando {file}: {e}")
-
-    return all_chunks
+    """
+    Procesa todos los archivos de una carpeta de categoria (.tex, .pdf,
+    .docx e imagenes) con el pipeline de ingesta (ver ingest.py).
+    """
+    from ingest import process_category
+    return process_category(category_path, category_name)
 
 
 def extract_problems_from_tex(file_path: str) -> List[Dict[str, str]]:
@@ -0,0 +1,236 @@
+"""
+Trazas y metricas por etapa del pipeline RAG: extract, chunk, embed, upsert,
+retrieve, pack y generate (y las raices index y answer que las agrupan).
+
+Desactivado por defecto (TRACING=0): span() devuelve un objeto nulo
+compartido y no mide nada. Con TRACING=1:
+
+  - Cada span suma su duracion al histograma de su etapa, y sus atributos
+    de conteo (tokens, documentos, aciertos de cache) a contadores por
+    etapa. export_prometheus() entrega todo en el formato de texto de
+    Prometheus.
+  - Una fraccion TRACE_SAMPLE_RATE de las trazas (una pregunta, una
+    indexacion) se escribe como lineas JSON, una por span, en TRACE_LOG
+    (o en la salida estandar si no esta definido).
+
+Uso:
+    with span("retrieve", queries=len(queries)) as s:
+        ...
+        s.set(documents=len(docs), cache="hit")
+
+Los spans de los procesos de ingest.process_files (INGEST_WORKERS > 1)
+quedan en las metricas de cada proceso; sus lineas JSON si se escriben.
+"""
+import bisect
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+TRACING = os.getenv("TRACING", "0") == "1"
+# Fraccion de trazas que se escriben como JSON (las metricas cuentan todas)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_LOG = os.getenv("TRACE_LOG")
+
+# Limites de los histogramas de duracion, en segundos
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Atributos numericos de un span que se acumulan como contadores
+COUNTED_ATTRIBUTES = ("documents", "chunks", "queries", "input_tokens", "output_tokens")
+
+_enabled = TRACING
+_sample_rate = TRACE_SAMPLE_RATE
+_lock = threading.Lock()
+# etapa -> [conteo por bucket (sin acumular)..., conteo sobre el ultimo limite, suma de segundos]
+_histograms: Dict[str, list] = {}
+# nombre -> {etiquetas: valor}
+_counters: Dict[str, Dict[Tuple, float]] = {}
+_gauges: Dict[str, Dict[Tuple, float]] = {}
+_current: contextvars.ContextVar = contextvars.ContextVar("tracing_span", default=None)
+
+
+class _NullSpan:
+    """Span que no mide nada (tracing desactivado)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Tramo medido de una traza; se usa como context manager."""
+
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id", "sampled", "_start", "_token")
+
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is None:
+            self.trace_id = f"{random.getrandbits(64):016x}"
+            self.parent_id = None
+            self.sampled = random.random() < _sample_rate
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.sampled = parent.sampled
+        self.span_id = f"{random.getrandbits(32):08x}"
+        self._token = _current.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def set(self, **attributes):
+        """Agrega atributos (conteos de tokens, cache="hit"/"miss", ...)."""
+        self.attributes.update(attributes)
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self._start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _record(self, duration)
+        if self.sampled:
+            _emit(self, duration)
+        return False
+
+
+def span(name: str, **attributes):
+    """
+    Abre un span de la etapa name (hijo del span activo, si hay uno).
+
+    Args:
+        name: Etapa del pipeline (extract, chunk, embed, upsert, retrieve, pack, generate, ...)
+        **attributes: Atributos iniciales del span
+
+    Returns:
+        Context manager con .set(**atributos)
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, attributes)
+
+
+def _labels(labels: Dict) -> Tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def count(name: str, value: float = 1, **labels):
+    """Suma value al contador name (p. ej. count("rag_cache_total", cache="bloques", result="hit"))."""
+    if not _enabled:
+        return
+    key = _labels(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Fija el valor actual de una medida (tamanio del indice, trabajos en cola, ...)."""
+    if not _enabled:
+        return
+    with _lock:
+        _gauges.setdefault(name, {})[_labels(labels)] = value
+
+
+def _record(span_: Span, duration: float):
+    with _lock:
+        histogram = _histograms.get(span_.name)
+        if histogram is None:
+            histogram = _histograms[span_.name] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(BUCKETS, duration)] += 1
+        histogram[-1] += duration
+
+        stage = (("stage", span_.name),)
+        for attribute in COUNTED_ATTRIBUTES:
+            value = span_.attributes.get(attribute)
+            if isinstance(value, (int, float)):
+                series = _counters.setdefault(f"rag_{attribute}_total", {})
+                series[stage] = series.get(stage, 0) + value
+        cache = span_.attributes.get("cache")
+        if cache is not None:
+            series = _counters.setdefault("rag_cache_total", {})
+            key = (("result", str(cache)),) + stage
+            series[key] = series.get(key, 0) + 1
+        if "error" in span_.attributes:
+            series = _counters.setdefault("rag_stage_errors_total", {})
+            series[stage] = series.get(stage, 0) + 1
+
+
+def _emit(span_: Span, duration: float):
+    record = {
+        "ts": round(time.time(), 3), "trace_id": span_.trace_id, "span_id": span_.span_id,
+        "parent_id": span_.parent_id, "name": span_.name, "duration_ms": round(duration * 1000, 3),
+        **span_.attributes,
+    }
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    if TRACE_LOG:
+        with _lock, open(TRACE_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    else:
+        print(line)
+
+
+def enable(sample_rate: Optional[float] = None):
+    """Activa el tracing en este proceso (p. ej. al levantar el endpoint de metricas)."""
+    global _enabled, _sample_rate
+    _enabled = True
+    if sample_rate is not None:
+        _sample_rate = sample_rate
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def export_prometheus() -> str:
+    """Metricas acumuladas en el formato de texto de Prometheus."""
+    lines = []
+    with _lock:
+        if _histograms:
+            lines.append("# HELP rag_stage_seconds Duracion de cada etapa del pipeline RAG")
+            lines.append("# TYPE rag_stage_seconds histogram")
+            for stage, histogram in sorted(_histograms.items()):
+                cumulative = 0
+                for limit, bucket in zip(BUCKETS, histogram):
+                    cumulative += bucket
+                    lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{limit}"}} {cumulative}')
+                total = cumulative + histogram[-2]
+                lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {total}')
+                lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {total}')
+                lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {histogram[-1]:.6f}')
+        for kind, metrics in (("counter", _counters), ("gauge", _gauges)):
+            for name, series in sorted(metrics.items()):
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Vacia las metricas acumuladas."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
@@ -0,0 +1,121 @@
+"""
+Candado de escritura entre procesos para el indice compartido (./chroma_db).
+
+La pestania de subidas (via los workers de job_queue.py), indexer.py,
+add_single_pdf.py, corpus_watcher.py y el boton de reindexar pueden
+escribir al mismo tiempo. Las operaciones que leen y luego modifican estado
+compartido (reservar IDs, agregar a chunk_store o al indice int8,
+reemplazar los chunks de un archivo, el manifiesto y active_collection.json)
+se hacen con este candado tomado, y solo durante la escritura: la
+extraccion de texto y los embeddings se calculan antes. Las consultas no
+lo usan; leen lo ya confirmado y nunca esperan a una escritura.
+
+Usa flock (Linux, macOS) o msvcrt.locking (Windows) sobre un archivo
+.lock, asi que el sistema operativo lo libera si el proceso muere. Dentro
+de un proceso es reentrante para el mismo hilo.
+"""
+import os
+import threading
+import time
+from typing import Dict
+
+# Segundos maximos de espera por el candado antes de fallar
+WRITE_LOCK_TIMEOUT = float(os.getenv("WRITE_LOCK_TIMEOUT", "300"))
+LOCK_FILE = "write.lock"
+_POLL_SECONDS = 0.05
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class FileLock:
+    """Candado exclusivo sobre un archivo, reentrante dentro del proceso."""
+
+    def __init__(self, path: str, timeout: float = WRITE_LOCK_TIMEOUT):
+        """
+        Args:
+            path: Archivo del candado (se crea si no existe)
+            timeout: Segundos maximos de espera en acquire
+        """
+        self.path = path
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        if not self._thread_lock.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No se obtuvo el candado de escritura {self.path} en {self.timeout:g} s")
+        if self._depth == 0:
+            try:
+                self._lock_file()
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def _lock_file(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        f = open(self.path, "a+b")
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                _try_lock(f)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    f.close()
+                    raise TimeoutError(f"Otro proceso tiene el candado de escritura {self.path} "
+                                       f"hace mas de {self.timeout:g} s")
+                time.sleep(_POLL_SECONDS)
+        self._file = f
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock(self._file)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+_locks: Dict[str, FileLock] = {}
+_locks_guard = threading.Lock()
+
+
+def file_lock(path: str) -> FileLock:
+    """Candado del archivo path, compartido por todos los hilos del proceso."""
+    # Con la ruta real, ./chroma_db y la version a la que apunta comparten candado
+    path = os.path.realpath(path)
+    with _locks_guard:
+        if path not in _locks:
+            _locks[path] = FileLock(path)
+        return _locks[path]
+
+
+def write_lock(directory: str) -> FileLock:
+    """Candado de escritura de una carpeta (chroma_db, chunk_store)."""
+    return file_lock(os.path.join(directory, LOCK_FILE))